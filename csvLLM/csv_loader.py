@@ -0,0 +1,698 @@
+"""
+csv_loader.py
+
+Streaming CSV -> SQLite loader shared by the csvLLM steps.
+
+The steps used to call pd.read_csv on the whole file and then DataFrame.to_sql,
+so memory grew with the file. This loader reads the CSV in chunks of
+`chunk_rows` rows (pd.read_csv(chunksize=...)), turns each chunk into plain
+Python tuples and inserts it with executemany. Memory stays bounded by one
+chunk however big the file is.
+
+Column types are inferred from a small sample (the first `sample_rows` rows)
+with the same dtype -> SQLite mapping the steps use, plus date detection: a
+text column whose values are all ISO dates ("2024-01-05", "2024-01-05 10:30:00")
+becomes DATETIME. The values are kept as written, since SQLite's date functions
+accept all of these forms, so a date column costs one regex check per chunk. Every later chunk is
+checked against the table's types. A chunk whose values don't fit promotes
+the column along INTEGER -> REAL -> TEXT (DATETIME -> TEXT), and the table is
+rebuilt with the wider types. That happens at most twice per column and only
+when needed. The promotions are reported in the stats as "type_changes".
+
+if_exists="upsert" refreshes a table in place from a full snapshot of the data:
+rows whose key is already in the table are updated, new keys are inserted, in
+the same chunked executemany as a plain load:
+
+    INSERT INTO t (...) VALUES (...) ON CONFLICT (key) DO UPDATE SET col = excluded.col
+
+The key is the `key` argument, else the table's PRIMARY KEY or unique index,
+else guessed from the sample (detect_key). A unique index on it is created if
+the table doesn't have one. Rows missing from the snapshot are left alone, and
+rows with an empty key are always inserted (NULLs never conflict).
+
+The whole load runs in one transaction on the shared pooled connection (see
+sqlite_pool.py): either every row is stored or, if anything fails, none are.
+
+Two engines parse the file, picked per call with engine=:
+
+    "pandas"  pd.read_csv chunks (the default; handles any CSV pandas does)
+    "csv"     the stdlib csv module plus one typed converter per column
+              (int/float over a whole column at a time, NULL markers -> None),
+              with executemany fed straight from generators. No DataFrames,
+              and pandas is never imported, which saves ~0.4 s on short CLI runs.
+
+Both infer the same types from the same rules and treat the same markers
+("", NA, NULL, nan, ...) as missing. pandas is only imported the first time the
+pandas engine (or a function that takes a DataFrame) is used.
+
+Usage:
+    from csv_loader import stream_csv_to_sqlite
+    stats = stream_csv_to_sqlite("sample_data.csv", "example.db", "data_table")
+    stats = stream_csv_to_sqlite("sample_data.csv", "example.db", "data_table", engine="csv")
+"""
+
+import io
+import re
+import csv
+import time
+import itertools
+import contextlib
+
+from sqlite_pool import get_connection, transaction
+
+# Rows read and inserted at a time; the loader's memory use is proportional to this
+DEFAULT_CHUNK_ROWS = 50000
+# Rows read up front to pick the column types
+DEFAULT_SAMPLE_ROWS = 1000
+
+# Promotion order; a column only ever moves right (DATETIME widens straight to TEXT)
+TYPE_ORDER = ["INTEGER", "REAL", "TEXT"]
+ISO_DATE = r"\d{4}-(?:0[1-9]|1[0-2])-(?:0[1-9]|[12]\d|3[01])(?:[ T](?:[01]\d|2[0-3]):[0-5]\d(?::[0-5]\d(?:\.\d+)?)?)?"
+# Whole-chunk check: the distinct values joined by NUL must all be ISO dates, one regex call instead of one per value
+ISO_DATES = re.compile(f"(?:{ISO_DATE}\\x00)*{ISO_DATE}")
+
+ENGINES = ("pandas", "csv")
+# pd.read_csv's default missing-value markers, so both engines agree on what is NULL
+NULL_VALUES = frozenset(["", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+                         "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null"])
+# SQLite's INTEGER is 64-bit; pandas reads larger whole numbers as Python ints or uint64, stored as TEXT here
+INT64_MIN, INT64_MAX = -2**63, 2**63 - 1
+# Values pandas reads as booleans (stored as 1/0)
+BOOL_VALUES = {"True": 1, "true": 1, "TRUE": 1, "False": 0, "false": 0, "FALSE": 0}
+
+# Enough of SQLite's tokenizer to find the column types in a CREATE TABLE statement:
+# whitespace/comments, string literals, quoted identifiers, parentheses, commas and other words
+SQL_TOKEN = re.compile(r"""\s+|--[^\n]*|/\*.*?(?:\*/|$)|'(?:[^']|'')*'|"(?:[^"]|"")*"|`(?:[^`]|``)*`|\[[^\]]*\]"""
+                       r"""|[(),]|[^\s(),'"`\[]+""", re.S)
+SQL_SPACE = re.compile(r"\s+|--.*|/\*.*", re.S)
+TABLE_CONSTRAINTS = {"CONSTRAINT", "PRIMARY", "UNIQUE", "CHECK", "FOREIGN"}
+COLUMN_CONSTRAINTS = {"CONSTRAINT", "PRIMARY", "NOT", "NULL", "UNIQUE", "CHECK", "DEFAULT", "COLLATE", "REFERENCES",
+                      "GENERATED", "AS"}
+
+class _ByteRange(io.RawIOBase):
+    # Read at most `length` bytes of an open file, so a file that is still growing is read up to a fixed size
+    def __init__(self, f, length):
+        self._f = f
+        self._left = length
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        n = min(len(buffer), self._left)
+        if n <= 0:
+            return 0
+        data = self._f.read(n)
+        buffer[:len(data)] = data
+        self._left -= len(data)
+        return len(data)
+
+@contextlib.contextmanager
+def open_csv(csv_path, offset=0, end=None):
+    """
+    Open the bytes [offset, end) of a CSV file for pd.read_csv; yields (file, read_csv keyword args).
+    With an offset (which must be at the start of a line) the column names come from the file's header line.
+    """
+    with open(csv_path, "rb") as f:
+        kwargs = {}
+        if offset:
+            kwargs = {"header": None, "names": next(csv.reader([f.readline().decode("utf-8-sig")]))}
+            f.seek(offset)
+        if end is None:
+            yield f, kwargs
+        else:
+            yield io.BufferedReader(_ByteRange(f, end - offset)), kwargs
+
+def map_dtype_to_sql(dtype):
+    """
+    Map a pandas dtype to a SQLite data type.
+    """
+    import pandas as pd  # only here, so the csv engine never imports pandas
+    if pd.api.types.is_bool_dtype(dtype):
+        return "INTEGER"
+    elif pd.api.types.is_integer_dtype(dtype):
+        return "INTEGER"
+    elif pd.api.types.is_float_dtype(dtype):
+        return "REAL"
+    elif pd.api.types.is_datetime64_any_dtype(dtype):
+        return "DATETIME"
+    else:
+        return "TEXT"
+
+def looks_like_dates(series):
+    """
+    True if the column has values and every non-missing one is an ISO date or date-time.
+    """
+    values = series.dropna().unique()
+    if len(values) == 0:
+        return False
+    return ISO_DATES.fullmatch("\x00".join(map(str, values))) is not None
+
+def infer_column_type(series):
+    """
+    SQLite type of one column: the dtype mapping, except that text columns of ISO dates
+    are DATETIME and float columns that are whole numbers with gaps (pandas turns an
+    int column with missing values into floats) stay INTEGER. Whole numbers beyond 64 bits
+    (uint64, or Python ints in an object column) are TEXT, since SQLite can't store them.
+    """
+    import pandas as pd
+    if pd.api.types.is_unsigned_integer_dtype(series.dtype) and len(series) and series.max() > INT64_MAX:
+        return "TEXT"
+    if pd.api.types.is_float_dtype(series.dtype) and series.hasnans:
+        values = series.dropna()
+        if not values.empty and (values % 1 == 0).all():
+            return "INTEGER"
+    if not pd.api.types.is_numeric_dtype(series.dtype) and not pd.api.types.is_datetime64_any_dtype(series.dtype):
+        if looks_like_dates(series):
+            return "DATETIME"
+    return map_dtype_to_sql(series.dtype)
+
+def infer_schema(df):
+    """
+    Return a dict mapping each column of the DataFrame to its SQLite type, in column order.
+    """
+    return {col: infer_column_type(df[col]) for col in df.columns}
+
+def read_sample(csv_path, sample_rows=DEFAULT_SAMPLE_ROWS, engine="pandas", offset=0, end=None):
+    """
+    Read the first sample_rows rows of a CSV file (or of its bytes [offset, end)) and infer their types.
+
+    Returns:
+        (sample, schema): the sample is a DataFrame for the pandas engine and a dict of
+        column -> converted values for the csv engine; either works with detect_key.
+    """
+    check_engine(engine)
+    with open_csv(csv_path, offset, end) as (f, read_kwargs):
+        if engine == "pandas":
+            import pandas as pd
+            sample = pd.read_csv(f, nrows=sample_rows, **read_kwargs)
+            return sample, infer_schema(sample)
+        names, reader = csv_reader(f, read_kwargs)
+        chunk = RawChunk(names, next(raw_chunks(reader, len(names), sample_rows), []))
+    schema = {col: infer_raw_type(values) for col, values in zip(names, chunk.columns)}
+    chunk.fit(schema)
+    return chunk.values, schema
+
+def sample_schema(csv_path, sample_rows=DEFAULT_SAMPLE_ROWS, engine="pandas"):
+    """
+    Infer the schema of a CSV file from its first sample_rows rows only.
+    """
+    return read_sample(csv_path, sample_rows, engine)[1]
+
+def promote_type(current, new):
+    """
+    The narrowest type that holds values of both types, e.g. INTEGER + REAL -> REAL.
+    """
+    if current == new:
+        return current
+    if current in TYPE_ORDER and new in TYPE_ORDER:
+        return max(current, new, key=TYPE_ORDER.index)
+    return "TEXT"
+
+def table_schema(conn, table_name):
+    """
+    Declared column types of an existing table ({} if it doesn't exist).
+    """
+    rows = conn.execute(f"PRAGMA table_info({quote_identifier(table_name)})").fetchall()
+    return {row[1]: row[2].upper() for row in rows}
+
+def _unquote_identifier(token):
+    if token[:1] in ('"', "`", "'"):
+        return token[1:-1].replace(token[0] * 2, token[0])
+    if token[:1] == "[":
+        return token[1:-1]
+    return token
+
+def rewrite_column_types(create_sql, new_types, table_name):
+    """
+    Rewrite a CREATE TABLE statement (as stored in sqlite_master) to create table_name with
+    the column types in new_types ({column: type}) and everything else unchanged: column and
+    table constraints, collations, defaults, WITHOUT ROWID/STRICT.
+    """
+    new_types = {name.lower(): sql_type for name, sql_type in new_types.items()}  # SQLite names ignore case
+    tokens = SQL_TOKEN.findall(create_sql)
+    start = tokens.index("(")
+    # Column definitions: the top-level comma-separated token ranges inside the outer parentheses
+    definitions, depth, first = [], 0, start + 1
+    for i in range(start, len(tokens)):
+        if tokens[i] == "(":
+            depth += 1
+        elif tokens[i] == ")":
+            depth -= 1
+            if depth == 0:
+                definitions.append((first, i))
+                break
+        elif tokens[i] == "," and depth == 1:
+            definitions.append((first, i))
+            first = i + 1
+    edits = []
+    for first, last in definitions:
+        words = [i for i in range(first, last) if not SQL_SPACE.fullmatch(tokens[i])]
+        if not words or tokens[words[0]].upper() in TABLE_CONSTRAINTS:
+            continue
+        sql_type = new_types.get(_unquote_identifier(tokens[words[0]]).lower())
+        if sql_type is None:
+            continue
+        # The type name runs from after the column name to the first constraint keyword, e.g. VARCHAR(10)
+        type_words, depth = [], 0
+        for i in words[1:]:
+            if depth == 0 and tokens[i].upper() in COLUMN_CONSTRAINTS:
+                break
+            depth += {"(": 1, ")": -1}.get(tokens[i], 0)
+            type_words.append(i)
+        if type_words:
+            edits.append((type_words[0], type_words[-1] + 1, sql_type))
+        else:
+            edits.append((words[0] + 1, words[0] + 1, f" {sql_type}"))
+    for first, last, text in reversed(edits):
+        tokens[first:last] = [text]
+    return f"CREATE TABLE {quote_identifier(table_name)} {''.join(tokens[start:])}"
+
+def migrate_column_types(conn, table_name, new_types):
+    """
+    Change the declared type of some columns by rebuilding the table (SQLite can't ALTER a
+    column's type). The table is re-created from its own CREATE TABLE statement with only
+    those types changed, so rows, column order, constraints (PRIMARY KEY, UNIQUE, CHECK, ...),
+    indexes and triggers are kept; values are converted by the new column affinity
+    (e.g. 10 -> '10' for TEXT).
+    """
+    create_sql = conn.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name=?", (table_name,)).fetchone()[0]
+    info = conn.execute(f"PRAGMA table_info({quote_identifier(table_name)})").fetchall()
+    # Indexes from CREATE INDEX and triggers; the UNIQUE/PRIMARY KEY autoindexes come back with the table
+    schema_objects = [row[0] for row in conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type IN ('index', 'trigger') AND tbl_name=? AND sql IS NOT NULL "
+        "ORDER BY type", (table_name,))]
+    columns = ", ".join(quote_identifier(row[1]) for row in info)
+    rebuilt = f"{table_name}__migrate"
+    with transaction(conn):
+        conn.execute(rewrite_column_types(create_sql, new_types, rebuilt))
+        conn.execute(f"INSERT INTO {quote_identifier(rebuilt)} ({columns}) "
+                     f"SELECT {columns} FROM {quote_identifier(table_name)}")
+        conn.execute(f"DROP TABLE {quote_identifier(table_name)}")
+        conn.execute(f"ALTER TABLE {quote_identifier(rebuilt)} RENAME TO {quote_identifier(table_name)}")
+        for sql in schema_objects:
+            conn.execute(sql)
+
+def fit_chunk(chunk, schema):
+    """
+    Check a chunk against the table's types; returns {column: wider type} for the
+    columns whose values don't fit.
+    """
+    promotions = {}
+    for col in chunk.columns:
+        declared = schema.get(col)
+        if declared not in ("INTEGER", "REAL", "DATETIME") or not chunk[col].notna().any():
+            continue  # TEXT holds anything; unknown declared types are left alone
+        if declared == "DATETIME":
+            if not looks_like_dates(chunk[col]):
+                promotions[col] = "TEXT"
+            continue
+        wider = promote_type(declared, infer_column_type(chunk[col]))
+        if wider != declared:
+            promotions[col] = wider
+    return promotions
+
+def quote_identifier(name):
+    # Column and table names come from CSV headers, so quote them instead of trusting them
+    return '"' + str(name).replace('"', '""') + '"'
+
+def schema_to_sql(schema):
+    """
+    Column definitions for CREATE TABLE, e.g. '"id" INTEGER, "name" TEXT'.
+    """
+    return ", ".join(f"{quote_identifier(col)} {sql_type}" for col, sql_type in schema.items())
+
+def dataframe_rows(df):
+    """
+    Iterate over the rows of a DataFrame as tuples of Python values sqlite3 can bind.
+    Missing values (NaN, NaT, None) become None, i.e. NULL.
+    """
+    import pandas as pd
+    columns = []
+    for col in df.columns:
+        series = df[col]
+        if pd.api.types.is_datetime64_any_dtype(series.dtype):
+            series = series.dt.strftime("%Y-%m-%d %H:%M:%S")
+        columns.append(series.astype(object).where(series.notna(), None).tolist())
+    return zip(*columns)
+
+def insert_sql(table_name, columns):
+    return (f"INSERT INTO {quote_identifier(table_name)} ({', '.join(quote_identifier(c) for c in columns)}) "
+            f"VALUES ({', '.join('?' for _ in columns)})")
+
+def on_conflict_sql(columns, key):
+    """
+    ON CONFLICT (key) DO UPDATE SET every other column to the new value (DO NOTHING if there are none).
+    """
+    updates = [col for col in columns if col not in key]
+    action = ("DO UPDATE SET " + ", ".join(f"{quote_identifier(col)} = excluded.{quote_identifier(col)}"
+                                           for col in updates)) if updates else "DO NOTHING"
+    return f"ON CONFLICT ({', '.join(quote_identifier(col) for col in key)}) {action}"
+
+def upsert_sql(table_name, columns, key):
+    return f"{insert_sql(table_name, columns)} {on_conflict_sql(columns, key)}"
+
+def table_keys(conn, table_name):
+    """
+    Column lists of the table's PRIMARY KEY and unique indexes, i.e. what ON CONFLICT can target.
+    """
+    info = conn.execute(f"PRAGMA table_info({quote_identifier(table_name)})").fetchall()
+    keys = []
+    primary_key = [name for pk, name in sorted((row[5], row[1]) for row in info if row[5])]
+    if primary_key:
+        keys.append(primary_key)
+    for _, name, unique, origin, partial in conn.execute(f"PRAGMA index_list({quote_identifier(table_name)})"):
+        if unique and not partial and origin != "pk":
+            columns = [row[2] for row in conn.execute(f"PRAGMA index_info({quote_identifier(name)})")]
+            if None not in columns:  # None = an expression, not a column
+                keys.append(columns)
+    return keys
+
+def detect_key(sample, table_name=""):
+    """
+    Guess the key column of a CSV from a sample (see read_sample): a non-float column whose
+    values are all present and distinct. Columns named like a key (id, <table>_id, *_id, key,
+    code, uuid) come first, then the leftmost one. Returns [column] or None.
+    """
+    candidates = []
+    for col, values in sample.items():
+        values = list(values)
+        # NaN != NaN, and numpy's float64 is a float too
+        if values and not any(v is None or v != v or isinstance(v, float) for v in values) \
+                and len(set(values)) == len(values):
+            candidates.append(col)
+    def rank(col):
+        name = str(col).lower()
+        if name == "id":
+            return 0
+        if name == f"{str(table_name).lower()}_id":
+            return 1
+        if name.endswith("_id") or name in ("key", "code", "uuid"):
+            return 2
+        return 3
+    return [min(candidates, key=rank)] if candidates else None  # min keeps the leftmost of equal ranks
+
+def ensure_key_index(conn, table_name, key):
+    """
+    Make sure ON CONFLICT (key) has a unique index to work with. Fails with IntegrityError
+    if the rows already in the table repeat a key.
+    """
+    if any(sorted(columns) == sorted(key) for columns in table_keys(conn, table_name)):
+        return
+    conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {quote_identifier(table_name + '__key')} "
+                 f"ON {quote_identifier(table_name)} ({', '.join(quote_identifier(col) for col in key)})")
+
+def resolve_key(conn, table_name, key, sample):
+    """
+    The key to upsert on: `key` if given (a column name or a list), else the table's own
+    key, else detect_key(sample). Raises ValueError if there is none or it isn't a column.
+    """
+    if isinstance(key, str):
+        key = [key]
+    if not key:
+        keys = table_keys(conn, table_name)
+        key = keys[0] if keys else detect_key(sample, table_name)
+    if not key:
+        raise ValueError(f"No key column found for upserting into '{table_name}'; pass key=...")
+    missing = [col for col in key if col not in list(sample)]
+    if missing:
+        raise ValueError(f"Key column(s) not in the CSV: {', '.join(map(str, missing))}")
+    return list(key)
+
+def insert_dataframe(conn, table_name, df, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Insert a DataFrame that is already in memory with executemany, chunk_rows rows per call.
+    The caller owns the transaction (e.g. `with transaction(conn):`).
+    """
+    sql = insert_sql(table_name, list(df.columns))
+    for start in range(0, len(df), chunk_rows):
+        conn.executemany(sql, dataframe_rows(df.iloc[start:start + chunk_rows]))
+
+def check_engine(engine):
+    if engine not in ENGINES:
+        raise ValueError(f"engine must be one of: {', '.join(ENGINES)}")
+
+# --- csv engine: stdlib csv.reader + typed converters, no pandas ---
+
+def _unique_names(header):
+    # Header cells as pandas names them: blank -> 'Unnamed: i', repeats -> 'a.1', 'a.2'
+    names, seen = [], {}
+    for i, name in enumerate(header):
+        name = name or f"Unnamed: {i}"
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        seen.setdefault(name, 0)
+        names.append(name)
+    return names
+
+def csv_reader(f, read_kwargs):
+    """
+    csv.reader over a binary file from open_csv; returns (column names, reader positioned after the header).
+    """
+    reader = csv.reader(io.TextIOWrapper(f, encoding="utf-8" if read_kwargs else "utf-8-sig", newline=""))
+    header = read_kwargs["names"] if read_kwargs else next((row for row in reader if row), None)
+    if header is None:
+        raise ValueError("No columns to parse from file")
+    return _unique_names(header), reader
+
+def raw_chunks(reader, width, chunk_rows):
+    """
+    Lists of up to chunk_rows rows of strings. Blank lines are skipped and short rows padded
+    with empty (missing) values, as pd.read_csv does; a row with too many fields is an error.
+    """
+    rows = []
+    while True:
+        batch = list(itertools.islice(reader, chunk_rows - len(rows) if chunk_rows else None))
+        if not batch:
+            break
+        if set(map(len, batch)) != {width}:  # one C-level pass instead of a check per row
+            batch = [_fit_row(row, width) for row in batch if row]
+        rows = rows + batch if rows else batch
+        if chunk_rows and len(rows) == chunk_rows:
+            yield rows
+            rows = []
+    if rows:
+        yield rows
+
+def _fit_row(row, width):
+    if len(row) > width:
+        raise ValueError(f"Expected {width} fields in a row, saw {len(row)}: {row!r}")
+    return row + [""] * (width - len(row))
+
+def _check_number(values):
+    # int() and float() accept '1_000' and non-ASCII digits such as '١٢'; pandas doesn't read those as numbers
+    joined = "".join(values)
+    if "_" in joined or not joined.isascii():
+        raise ValueError("not a number")
+
+def _check_range(integers):
+    present = [i for i in integers if i is not None] if None in integers else integers
+    if present and (min(present) < INT64_MIN or max(present) > INT64_MAX):
+        raise ValueError("integer out of SQLite's 64-bit range")
+    return integers
+
+def to_integer(values):
+    _check_number(values)
+    try:
+        return _check_range(list(map(int, values)))  # a column without gaps converts in one C loop
+    except ValueError:
+        pass
+    nulls = NULL_VALUES.intersection(values)
+    try:
+        integers = [None if v in nulls else int(v) for v in values]
+    except ValueError:
+        integers = None
+    if integers is not None:
+        return _check_range(integers)
+    if not nulls:
+        if BOOL_VALUES.keys() >= set(values):  # pandas' bool dtype, which only has no gaps
+            return [BOOL_VALUES[v] for v in values]
+        raise ValueError("not integers")  # 2.0 without gaps is REAL, as pandas reads it
+    # Whole numbers written as 2.0, e.g. by pandas for an int column with gaps
+    numbers = [None if v in nulls else float(v) for v in values]
+    try:
+        whole = [None if n is None else int(n) for n in numbers]
+    except OverflowError:  # inf
+        raise ValueError("not integers")
+    if whole != numbers:  # 2 == 2.0 but 2 != 2.5; compared in C
+        raise ValueError("not integers")
+    # Passed on as floats like the pandas engine does: SQLite's INTEGER affinity stores 2.0 as 2,
+    # and a value too large for 64 bits stays REAL instead of overflowing
+    return numbers
+
+def to_real(values):
+    _check_number(values)
+    try:
+        return list(map(float, values))
+    except ValueError:
+        return [None if v in NULL_VALUES else float(v) for v in values]
+
+def to_text(values):
+    if NULL_VALUES.isdisjoint(values):
+        return values
+    return [None if v in NULL_VALUES else v for v in values]
+
+def to_datetime(values):
+    values = to_text(values)
+    present = set(values)
+    present.discard(None)
+    if present and ISO_DATES.fullmatch("\x00".join(present)) is None:
+        raise ValueError("not ISO dates")
+    return values  # kept as written, like the pandas engine
+
+# Converter per declared type; they raise ValueError when a value doesn't fit. Other declared
+# types get the text as is and SQLite's column affinity converts it.
+CONVERTERS = {"INTEGER": to_integer, "REAL": to_real, "DATETIME": to_datetime, "TEXT": to_text}
+
+def infer_raw_type(values):
+    """
+    SQLite type of a column of CSV strings, by the rules infer_column_type applies to pandas'
+    dtypes: whole numbers -> INTEGER (also with gaps), other numbers -> REAL, True/False ->
+    INTEGER (TEXT with gaps), ISO dates -> DATETIME, anything else -> TEXT (also integers
+    beyond 64 bits and non-ASCII digits). An all-missing column is REAL.
+    """
+    if not values:
+        return "TEXT"
+    present = [v for v in values if v not in NULL_VALUES]
+    if not present:
+        return "REAL"
+    if all(v in BOOL_VALUES for v in present):
+        # With gaps pandas reads True/False as an object column, which is TEXT
+        return "INTEGER" if len(present) == len(values) else "TEXT"
+    try:
+        _check_number(present)
+        integers = list(map(int, present))
+    except ValueError:
+        integers = None
+    if integers is not None:
+        # Beyond 64 bits pandas gives uint64 or Python ints, which infer_column_type makes TEXT
+        return "INTEGER" if INT64_MIN <= min(integers) and max(integers) <= INT64_MAX else "TEXT"
+    try:
+        numbers = to_real(present)
+    except ValueError:
+        return "DATETIME" if ISO_DATES.fullmatch("\x00".join(set(present))) else "TEXT"
+    if len(present) < len(values) and all(n.is_integer() for n in numbers):
+        return "INTEGER"
+    return "REAL"
+
+class RawChunk:
+    """
+    One chunk of the csv engine: the raw strings column by column, and the values converted
+    to the table's types by fit().
+    """
+    def __init__(self, names, rows):
+        self.names = names
+        self.columns = list(zip(*rows)) or [()] * len(names)
+        self.values = {}
+
+    def __len__(self):
+        return len(self.columns[0]) if self.columns else 0
+
+    def fit(self, schema):
+        """
+        Convert every column to its type in schema, like fit_chunk: returns {column: wider type}
+        for the columns whose values don't fit (those are converted to the wider type).
+        """
+        promotions = {}
+        for col, raw in zip(self.names, self.columns):
+            declared = schema.get(col)
+            try:
+                self.values[col] = CONVERTERS.get(declared, to_text)(raw)
+                continue
+            except ValueError:
+                pass
+            wider = promote_type(declared, infer_raw_type(raw))
+            if wider == declared:
+                wider = "TEXT"  # e.g. True/False in a REAL column, or non-dates in a DATETIME one
+            promotions[col] = wider
+            self.values[col] = CONVERTERS[wider](raw)
+        return promotions
+
+    def rows(self):
+        return zip(*(self.values[col] for col in self.names))
+
+def _chunks(f, read_kwargs, chunk_rows, schema, engine):
+    # The file's chunks: DataFrames for the pandas engine, RawChunks for the csv engine
+    if engine == "csv":
+        names, reader = csv_reader(f, read_kwargs)
+        for rows in raw_chunks(reader, len(names), chunk_rows):
+            yield RawChunk(names, rows)
+        return
+    import pandas as pd
+    # Columns that are TEXT in the table are read as strings, which also skips pandas' type guessing for them
+    text_columns = {col: str for col, sql_type in schema.items() if sql_type == "TEXT"}
+    yield from pd.read_csv(f, chunksize=chunk_rows, dtype=text_columns, **read_kwargs)
+
+def stream_csv_to_sqlite(csv_path, db_path, table_name, chunk_rows=DEFAULT_CHUNK_ROWS, if_exists="append",
+                         sample_rows=DEFAULT_SAMPLE_ROWS, offset=0, end=None, key=None, engine="pandas"):
+    """
+    Load a CSV file into a SQLite table chunk by chunk, in a single transaction.
+
+    Parameters:
+        csv_path (str): Path to the CSV file.
+        db_path (str): Path to the SQLite database.
+        table_name (str): Table to load into; created from the inferred schema if missing.
+        chunk_rows (int): Rows read and inserted at a time.
+        if_exists (str): 'append' (default) adds to an existing table, 'replace' drops it first,
+            'upsert' updates the rows whose key is already in the table and inserts the rest.
+        sample_rows (int): Rows used to infer the column types (None = the first chunk).
+        offset, end (int): Only load the bytes [offset, end) of the file, e.g. the new tail of a
+            file that grew (see csv_manifest.py); offset must be at the start of a line.
+        key (str or list): Key column(s) for 'upsert' (default: the table's key, else detect_key).
+        engine (str): 'pandas' (default) or 'csv' (see the module docstring).
+
+    Returns:
+        dict: {"rows", "chunks", "schema", "type_changes", "migrations", "seconds", "rows_per_sec"},
+              plus "key", "inserted" and "updated" for 'upsert'
+    """
+    if if_exists not in ("append", "replace", "upsert"):
+        raise ValueError("if_exists must be 'append', 'replace' or 'upsert'")
+    check_engine(engine)
+    start = time.perf_counter()
+    stats = {"rows": 0, "chunks": 0, "schema": None, "type_changes": {}, "migrations": 0}
+    sample_values, sample = read_sample(csv_path, sample_rows or chunk_rows, engine, offset, end)
+    conn = get_connection(db_path)
+    with transaction(conn, immediate=True):
+        if if_exists == "replace":
+            from csv_manifest import forget_table  # csv_manifest imports this module
+            conn.execute(f"DROP TABLE IF EXISTS {quote_identifier(table_name)}")
+            forget_table(conn, table_name)
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {quote_identifier(table_name)} ({schema_to_sql(sample)})")
+        schema = table_schema(conn, table_name)
+        sql = insert_sql(table_name, list(sample))
+        if if_exists == "upsert":
+            stats["key"] = resolve_key(conn, table_name, key, sample_values)
+            ensure_key_index(conn, table_name, stats["key"])
+            sql = upsert_sql(table_name, list(sample), stats["key"])
+            count_sql = f"SELECT COUNT(*) FROM {quote_identifier(table_name)}"
+            rows_before = conn.execute(count_sql).fetchone()[0]
+        # The columns _chunks doesn't read as strings for the pandas engine
+        parsed = [col for col in sample if schema.get(col) != "TEXT"]
+        with open_csv(csv_path, offset, end) as (f, read_kwargs):
+            for chunk in _chunks(f, read_kwargs, chunk_rows, {col: schema.get(col) for col in sample}, engine):
+                promotions = chunk.fit(schema) if engine == "csv" else fit_chunk(chunk, schema)
+                if promotions:
+                    migrate_column_types(conn, table_name, promotions)
+                    if if_exists == "upsert":
+                        ensure_key_index(conn, table_name, stats["key"])  # ON CONFLICT needs it on the rebuilt table
+                    for col, sql_type in promotions.items():
+                        stats["type_changes"][col] = [stats["type_changes"].get(col, [schema[col]])[0], sql_type]
+                        schema[col] = sql_type
+                    stats["migrations"] += 1
+                if engine == "pandas":
+                    for col in parsed:
+                        if schema.get(col) == "TEXT":
+                            # Promoted after the reader started, so bind as strings: ints beyond 64 bits
+                            # would overflow sqlite3 and True/False would become 1/0 otherwise
+                            chunk[col] = chunk[col].astype(object).where(chunk[col].isna(), chunk[col].astype(str))
+                conn.executemany(sql, chunk.rows() if engine == "csv" else dataframe_rows(chunk))
+                stats["rows"] += len(chunk)
+                stats["chunks"] += 1
+        if if_exists == "upsert":
+            stats["inserted"] = conn.execute(count_sql).fetchone()[0] - rows_before
+            stats["updated"] = stats["rows"] - stats["inserted"]
+    stats["schema"] = {col: schema.get(col, sql_type) for col, sql_type in sample.items()}
+    stats["seconds"] = time.perf_counter() - start
+    stats["rows_per_sec"] = stats["rows"] / stats["seconds"] if stats["seconds"] > 0 else 0.0
+    return stats
@@ -0,0 +1,175 @@
+"""
+csv_manifest.py
+
+Incremental, idempotent re-loading of CSV files.
+
+Every load records the file in a manifest table inside the target database:
+path, size, mtime, SHA-256 of the content and the rows loaded so far, per
+(file, table). Re-running a load then only does the work that is needed:
+
+    unchanged   same size and mtime (or same hash after a touch) -> skipped
+    grown       the first `size` bytes still hash the same, so the file was
+                only appended to -> just the new tail is loaded
+    new         never loaded into this table -> loaded in full
+    changed     rewritten in place or truncated -> reported and skipped, since
+                its old rows can't be told apart from other rows; pass
+                on_change="reload" to load it again anyway; with
+                if_exists="upsert" a changed file is always loaded again,
+                since upserting the same rows twice doesn't duplicate them
+
+The data and its manifest entry are written in the same transaction, so a
+failed load leaves the manifest unchanged and the next run retries it. Only
+the bytes that were hashed are loaded, so rows appended while a load is
+running wait for the next run. Those bytes always end on a "\n": a last line
+without one may still be being written, so it is left for the next run too
+(reported as "pending_bytes"), and a recorded size that doesn't end a line
+makes the file count as changed.
+
+Usage:
+    from csv_manifest import load_csv_incremental
+    stats = load_csv_incremental("sample_data.csv", "example.db", "data_table")
+    print(stats["action"])  # 'load', 'append' or 'skip'
+"""
+
+import os
+import hashlib
+
+from sqlite_pool import get_connection, transaction
+from csv_loader import stream_csv_to_sqlite, DEFAULT_CHUNK_ROWS, DEFAULT_SAMPLE_ROWS
+
+MANIFEST_TABLE = "csv_manifest"
+HASH_BLOCK_BYTES = 1024 * 1024
+TAIL_BLOCK_BYTES = 64 * 1024
+
+def ensure_manifest(conn):
+    conn.execute(f"""CREATE TABLE IF NOT EXISTS {MANIFEST_TABLE} (
+        path TEXT NOT NULL, table_name TEXT NOT NULL, size INTEGER, mtime_ns INTEGER,
+        sha256 TEXT, rows INTEGER, loaded_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (path, table_name))""")
+
+def _hash_range(f, digest, length):
+    # Feed the next `length` bytes of f into digest
+    while length > 0:
+        block = f.read(min(HASH_BLOCK_BYTES, length))
+        if not block:
+            break
+        digest.update(block)
+        length -= len(block)
+
+def _complete_size(f, size):
+    # Length of the first `size` bytes of f up to and including their last "\n" (0 if there is none); rewinds f
+    end = size
+    while end > 0:
+        start = max(0, end - TAIL_BLOCK_BYTES)
+        f.seek(start)
+        newline = f.read(end - start).rfind(b"\n")
+        if newline >= 0:
+            end = start + newline + 1
+            break
+        end = start
+    f.seek(0)
+    return end
+
+def _ends_line(f, size):
+    # Whether the first `size` bytes of f end on a "\n" (or are empty); rewinds f
+    f.seek(max(0, size - 1))
+    ends_line = size == 0 or f.read(1) == b"\n"
+    f.seek(0)
+    return ends_line
+
+def plan_load(conn, csv_path, table_name):
+    """
+    Compare a CSV file with its manifest entry and decide what to load.
+
+    Returns:
+        dict: {"path", "action" ('skip', 'append', 'load' or 'changed'), "offset", "size",
+               "mtime_ns" (None if the manifest is already current), "sha256", "rows" (loaded before),
+               "pending" (bytes of an unfinished last line, left out of "size")}
+    """
+    ensure_manifest(conn)
+    path = os.path.abspath(csv_path)
+    stat = os.stat(path)
+    entry = conn.execute(f"SELECT size, mtime_ns, sha256, rows FROM {MANIFEST_TABLE} WHERE path = ? AND table_name = ?",
+                         (path, table_name)).fetchone()
+    if entry is not None and not conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?",
+                                              (table_name,)).fetchone():
+        entry = None  # the table was dropped since, so its rows are gone
+    plan = {"path": path, "action": "load", "offset": 0, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+            "sha256": None, "rows": 0, "pending": 0}
+    if entry is not None:
+        old_size, old_mtime_ns, old_sha256, plan["rows"] = entry
+        if (old_size, old_mtime_ns) == (stat.st_size, stat.st_mtime_ns):
+            plan.update(action="skip", sha256=old_sha256, mtime_ns=None)  # None: nothing to update
+            return plan
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        # Only whole lines: a row cut off mid-write would be loaded half now and its rest as a bogus row later
+        plan["size"] = _complete_size(f, stat.st_size)
+        plan["pending"] = stat.st_size - plan["size"]
+        if entry is not None and plan["size"] >= old_size and _ends_line(f, old_size):
+            _hash_range(f, digest, old_size)
+            if digest.hexdigest() == old_sha256:
+                plan.update(action="skip" if plan["size"] == old_size else "append", offset=old_size)
+            else:
+                plan["action"] = "changed"
+        elif entry is not None:
+            plan["action"] = "changed"  # truncated, or last loaded up to the middle of a line
+        _hash_range(f, digest, plan["size"] - f.tell())
+    plan["sha256"] = digest.hexdigest()
+    return plan
+
+def record_load(conn, plan, table_name, rows):
+    """
+    Store the file state the plan was made from, with `rows` rows loaded from it in total.
+    """
+    ensure_manifest(conn)
+    conn.execute(f"INSERT OR REPLACE INTO {MANIFEST_TABLE} (path, table_name, size, mtime_ns, sha256, rows) "
+                 f"VALUES (?, ?, ?, ?, ?, ?)",
+                 (plan["path"], table_name, plan["size"], plan["mtime_ns"], plan["sha256"], rows))
+
+def forget_table(conn, table_name):
+    """
+    Drop the manifest entries of a table whose rows were thrown away (DROP TABLE / replace),
+    so its files are loaded in full again next time.
+    """
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (MANIFEST_TABLE,)).fetchone():
+        conn.execute(f"DELETE FROM {MANIFEST_TABLE} WHERE table_name = ?", (table_name,))
+
+def load_csv_incremental(csv_path, db_path, table_name, chunk_rows=DEFAULT_CHUNK_ROWS,
+                         sample_rows=DEFAULT_SAMPLE_ROWS, on_change="skip", if_exists="append", key=None,
+                         engine="pandas"):
+    """
+    Load only what is new in csv_path since the last load into table_name (see the module docstring).
+
+    Parameters:
+        on_change (str): 'skip' (default) or 'reload' for files that were rewritten in place.
+        if_exists (str): 'append' (default) or 'upsert' on `key` (see stream_csv_to_sqlite), e.g.
+            for a snapshot file that is rewritten every day.
+        engine (str): 'pandas' (default) or 'csv' (see csv_loader.py).
+
+    Returns:
+        dict: stream_csv_to_sqlite's stats (zero rows when nothing was loaded) plus "action",
+              "offset", "total_rows" (rows loaded from this file over all runs) and "pending_bytes"
+              (an unfinished last line left for the next run).
+    """
+    if on_change not in ("skip", "reload"):
+        raise ValueError("on_change must be 'skip' or 'reload'")
+    if if_exists not in ("append", "upsert"):
+        raise ValueError("if_exists must be 'append' or 'upsert'")
+    conn = get_connection(db_path)
+    with transaction(conn, immediate=True):
+        plan = plan_load(conn, csv_path, table_name)
+        stats = {"rows": 0, "chunks": 0, "schema": None, "type_changes": {}, "migrations": 0,
+                 "seconds": 0.0, "rows_per_sec": 0.0}
+        total_rows = plan["rows"]
+        if plan["action"] == "skip":
+            if plan["mtime_ns"] is not None:
+                record_load(conn, plan, table_name, total_rows)  # only touched: remember the new mtime
+        elif plan["action"] != "changed" or on_change == "reload" or if_exists == "upsert":
+            offset = plan["offset"] if plan["action"] == "append" else 0
+            stats = stream_csv_to_sqlite(csv_path, db_path, table_name, chunk_rows, if_exists, sample_rows,
+                                         offset, plan["size"], key, engine)
+            total_rows = (total_rows if plan["action"] == "append" else 0) + stats["rows"]
+            record_load(conn, plan, table_name, total_rows)
+    stats.update(action=plan["action"], offset=plan["offset"], total_rows=total_rows, pending_bytes=plan["pending"])
+    return stats
@@ -0,0 +1,256 @@
+"""
+parallel_ingest.py
+
+Load a whole directory of CSV files (e.g. daily drops) into one SQLite table.
+
+Parsing and type conversion run in parallel: a process pool streams each file
+into its own temporary staging database with stream_csv_to_sqlite (separate
+files, so the workers never wait on each other's locks). SQLite allows only one
+writer per database, so a single writer thread merges the staged files into
+the target table as they finish:
+
+    ATTACH staging.db; INSERT INTO table SELECT ... FROM staging; DETACH
+
+The copy runs inside SQLite, so the writer doesn't bind a single Python value.
+Each file is merged in its own transaction, which isolates errors: a file that
+fails to parse or merge is reported and leaves no rows behind, and the other
+files still load. Column types are reconciled per file with the same rules as
+csv_loader (promote INTEGER -> REAL -> TEXT, add new columns). Files are
+merged in the order they finish, not in name order.
+
+With if_exists="upsert" the merge becomes INSERT ... SELECT ... ON CONFLICT (key)
+DO UPDATE, so a directory of snapshot files refreshes the table in place (see
+csv_loader.py); when files repeat a key, the one merged last wins.
+
+Each file's merge also records it in the manifest (see csv_manifest.py), so
+running the ingest again on the same directory skips the files that haven't
+changed and only parses the new rows of files that were appended to.
+
+Usage:
+    from parallel_ingest import ingest_directory
+    stats = ingest_directory("drops/", "example.db", "data_table", workers=4)
+"""
+
+import os
+import glob
+import time
+import queue
+import shutil
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+import sqlite_pool
+from sqlite_pool import get_connection, transaction
+from csv_loader import (stream_csv_to_sqlite, quote_identifier, schema_to_sql, table_schema, promote_type,
+                        migrate_column_types, on_conflict_sql, table_keys, detect_key, ensure_key_index,
+                        read_sample, check_engine,
+                        DEFAULT_CHUNK_ROWS, DEFAULT_SAMPLE_ROWS)
+from csv_manifest import plan_load, record_load
+
+STAGED_TABLE = "staged_rows"
+
+def stage_file(csv_path, staged_path, chunk_rows=DEFAULT_CHUNK_ROWS, sample_rows=DEFAULT_SAMPLE_ROWS, offset=0, end=None,
+               engine="pandas"):
+    """
+    Worker: parse one CSV file (or its bytes [offset, end)) into a fresh staging database. Runs in a pool process.
+    """
+    start = time.perf_counter()
+    try:
+        stats = stream_csv_to_sqlite(csv_path, staged_path, STAGED_TABLE, chunk_rows, sample_rows=sample_rows,
+                                     offset=offset, end=end, engine=engine)
+    finally:
+        sqlite_pool.close(staged_path)  # the writer deletes the file once it is merged
+    return {"file": csv_path, "staged": staged_path, "rows": stats["rows"], "schema": stats["schema"],
+            "parse_seconds": time.perf_counter() - start}
+
+def _has_values(conn, column):
+    return conn.execute(f"SELECT 1 FROM staged.{STAGED_TABLE} WHERE {quote_identifier(column)} IS NOT NULL "
+                        f"LIMIT 1").fetchone() is not None
+
+def merge_staged(conn, staged, table_name, plan=None, key=None):
+    """
+    Writer: copy one staged file into table_name in a single transaction, creating the table,
+    adding new columns and promoting column types first when needed, and record the file in
+    the manifest when a plan (csv_manifest.plan_load) is given. With a key (list of columns)
+    the rows are upserted on it. Returns the type changes.
+    """
+    type_changes = {}
+    missing = [col for col in key or [] if col not in staged["schema"]]
+    if missing:
+        raise ValueError(f"Key column(s) not in the CSV: {', '.join(missing)}")
+    conn.execute("ATTACH DATABASE ? AS staged", (staged["staged"],))
+    try:
+        with transaction(conn, immediate=True):
+            schema = staged["schema"]
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {quote_identifier(table_name)} ({schema_to_sql(schema)})")
+            target = table_schema(conn, table_name)
+            promotions = {}
+            for col, sql_type in schema.items():
+                if col not in target:
+                    conn.execute(f"ALTER TABLE {quote_identifier(table_name)} ADD COLUMN {quote_identifier(col)} {sql_type}")
+                    continue
+                wider = promote_type(target[col], sql_type) if target[col] in ("INTEGER", "REAL", "DATETIME") else target[col]
+                # A column that is empty in this file says nothing about its type
+                if wider != target[col] and _has_values(conn, col):
+                    promotions[col] = wider
+                    type_changes[col] = [target[col], wider]
+            if promotions:
+                migrate_column_types(conn, table_name, promotions)
+            columns = ", ".join(quote_identifier(col) for col in schema)
+            upsert = ""
+            if key:
+                ensure_key_index(conn, table_name, key)  # after the migration, which rebuilds the table
+                # "WHERE true" tells SQLite's parser the ON CONFLICT belongs to the INSERT, not to a join
+                upsert = f" WHERE true {on_conflict_sql(list(schema), key)}"
+            conn.execute(f"INSERT INTO {quote_identifier(table_name)} ({columns}) "
+                         f"SELECT {columns} FROM staged.{STAGED_TABLE}{upsert}")
+            if plan is not None:
+                previous = plan["rows"] if plan["action"] == "append" else 0
+                record_load(conn, plan, table_name, previous + staged["rows"])
+    finally:
+        conn.execute("DETACH DATABASE staged")
+    return type_changes
+
+def _writer(db_path, table_name, staged_queue, results, progress, total, key=None):
+    # The only thread that writes to db_path
+    conn = get_connection(db_path)
+    while True:
+        staged = staged_queue.get()
+        if staged is None:
+            break
+        info = {"file": staged["file"], "rows": 0, "status": staged.get("status", "failed"), "error": staged.get("error"),
+                "parse_seconds": staged.get("parse_seconds"), "merge_seconds": None, "type_changes": {}}
+        if info["error"] is None and "status" not in staged:
+            start = time.perf_counter()
+            try:
+                info["type_changes"] = merge_staged(conn, staged, table_name, staged.get("plan"), key)
+                info["rows"] = staged["rows"]
+                info["status"] = "loaded"
+            except Exception as e:
+                info["error"] = f"{type(e).__name__}: {e}"
+            info["merge_seconds"] = time.perf_counter() - start
+        if staged.get("staged") and os.path.exists(staged["staged"]):
+            os.remove(staged["staged"])
+        results.append(info)
+        if progress:
+            progress(len(results), total, info)
+
+def print_progress(done, total, info):
+    """
+    Default progress callback: one line per file.
+    """
+    name = os.path.basename(info["file"])
+    if info["status"] == "loaded":
+        print(f"[{done}/{total}] {name}: {info['rows']} rows "
+              f"(parsed in {info['parse_seconds']:.2f}s, merged in {info['merge_seconds']:.2f}s)")
+        for col, (old_type, new_type) in info["type_changes"].items():
+            print(f"    column '{col}' widened from {old_type} to {new_type}")
+    elif info["status"] == "skipped":
+        print(f"[{done}/{total}] {name}: unchanged since the last load, skipped")
+    elif info["status"] == "changed":
+        print(f"[{done}/{total}] {name}: changed since the last load (not only appended to), skipped")
+    else:
+        print(f"[{done}/{total}] {name}: FAILED - {info['error']}")
+
+def _pick_key(conn, table_name, key, paths, sample_rows, engine):
+    # Same order as csv_loader.resolve_key: given, the table's own, else guessed from the first readable file
+    if isinstance(key, str):
+        return [key]
+    if key:
+        return list(key)
+    keys = table_keys(conn, table_name)
+    if keys:
+        return keys[0]
+    for path in paths:
+        try:
+            sample = read_sample(path, sample_rows, engine)[0]
+        except (OSError, ValueError):  # pandas' EmptyDataError/ParserError are ValueErrors too
+            continue  # reported as failed by its worker
+        return detect_key(sample, table_name)
+    return None
+
+def ingest_directory(directory, db_path, table_name, workers=None, pattern="*.csv", chunk_rows=DEFAULT_CHUNK_ROWS,
+                     sample_rows=DEFAULT_SAMPLE_ROWS, progress=None, on_change="skip", if_exists="append", key=None,
+                     engine="pandas"):
+    """
+    Load every file matching `pattern` in `directory` into table_name.
+
+    Parameters:
+        workers (int): Parsing processes (default: all cores). 1 parses in a thread of this process.
+        progress (callable): progress(done, total, info) after each file, e.g. print_progress.
+        on_change (str): 'skip' (default) or 'reload' for files rewritten since their last load.
+        if_exists (str): 'append' (default) or 'upsert' on `key` (default: the table's key, else
+            guessed from the first file); rewritten files are always reloaded when upserting.
+        engine (str): 'pandas' (default) or 'csv', the parser the workers use (see csv_loader.py).
+
+    Returns:
+        dict: {"files": [{"file", "rows", "status" ('loaded', 'failed', 'skipped' or 'changed'), "error",
+               "parse_seconds", "merge_seconds", "type_changes"}, ...] in merge order, "rows", "failed",
+               "seconds", "rows_per_sec"}
+    """
+    if if_exists not in ("append", "upsert"):
+        raise ValueError("if_exists must be 'append' or 'upsert'")
+    check_engine(engine)
+    start = time.perf_counter()
+    files = sorted(path for path in glob.glob(os.path.join(directory, pattern)) if os.path.isfile(path))
+    # Decide per file what is new before any worker starts (see csv_manifest.py)
+    conn = get_connection(db_path)
+    plans, todo = {}, []
+    for path in files:
+        try:
+            plans[path] = plan_load(conn, path, table_name)
+        except OSError as e:
+            plans[path] = {"action": "failed", "error": f"{type(e).__name__}: {e}"}
+        action = plans[path]["action"]
+        if action == "skip" and plans[path]["mtime_ns"] is not None:
+            # Only touched: remember the new mtime so the next run doesn't hash the file again
+            record_load(conn, plans[path], table_name, plans[path]["rows"])
+        if action in ("load", "append") or (action == "changed" and (on_change == "reload" or if_exists == "upsert")):
+            todo.append(path)
+    if if_exists == "upsert":
+        key = _pick_key(conn, table_name, key, todo, sample_rows, engine)
+        if not key:
+            raise ValueError(f"No key column found for upserting into '{table_name}'; pass key=...")
+    else:
+        key = None
+    workers = max(1, min(workers or os.cpu_count() or 1, len(todo) or 1))
+    results = []
+    staged_queue = queue.Queue()
+    staging_dir = tempfile.mkdtemp(prefix="csvllm_ingest_")
+    writer = threading.Thread(target=_writer, name="sqlite-writer",
+                              args=(db_path, table_name, staged_queue, results, progress, len(files), key))
+    try:
+        if workers == 1:
+            pool = ThreadPoolExecutor(max_workers=1)
+        else:
+            # spawn, not fork: the parent already has threads and open SQLite connections
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        with pool:
+            futures = {}
+            for i, path in enumerate(todo):
+                plan = plans[path]
+                offset = plan["offset"] if plan["action"] == "append" else 0
+                futures[pool.submit(stage_file, path, os.path.join(staging_dir, f"{i}.db"), chunk_rows, sample_rows,
+                                    offset, plan["size"], engine)] = path
+            writer.start()
+            queued = set(todo)
+            for path in files:
+                if path not in queued:
+                    status = {"skip": "skipped", "changed": "changed"}.get(plans[path]["action"], "failed")
+                    staged_queue.put({"file": path, "status": status, "error": plans[path].get("error")})
+            for future in as_completed(futures):
+                try:
+                    staged_queue.put(dict(future.result(), plan=plans[futures[future]]))
+                except Exception as e:
+                    staged_queue.put({"file": futures[future], "error": f"{type(e).__name__}: {e}"})
+    finally:
+        staged_queue.put(None)
+        if writer.is_alive():
+            writer.join()
+        shutil.rmtree(staging_dir, ignore_errors=True)
+    seconds = time.perf_counter() - start
+    rows = sum(info["rows"] for info in results)
+    return {"files": results, "rows": rows, "failed": sum(info["status"] == "failed" for info in results),
+            "seconds": seconds, "rows_per_sec": rows / seconds if seconds > 0 else 0.0}
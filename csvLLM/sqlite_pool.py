@@ -0,0 +1,196 @@
+"""
+sqlite_pool.py
+
+Shared SQLite connection layer for the csvLLM steps.
+
+Every helper used to open and close its own sqlite3.connect, so one load opened
+4-6 connections and SQLite re-read the schema each time. get_connection() hands
+out one connection per (thread, database file) and keeps it open. Each new
+connection gets the PRAGMAs in `settings`: a 64 MB page cache, memory-mapped
+I/O and in-memory temp tables. Python's per-connection statement cache
+(`cached_statements`) is enlarged, so the INSERT/PRAGMA statements the steps
+repeat are prepared once per connection.
+
+The step CLIs also switch to WAL with synchronous=NORMAL (configure(**WAL_PRAGMAS)):
+readers don't block the writer and commits skip an fsync. It is not the default
+because a WAL database leaves -wal/-shm files beside it, and deleting only the
+.db file (as the tests do) can pair a new database with an old WAL file.
+
+Connections are in autocommit mode (isolation_level=None). Wrap writes that
+belong together in `with transaction(conn):`. Don't close pooled connections
+yourself; close_all() runs at exit.
+
+A pooled connection is reopened when its database file was deleted or replaced
+(the tests remove their .db files between runs), so it never points at a stale
+file.
+
+Usage:
+    from sqlite_pool import get_connection, transaction
+    conn = get_connection("example.db")
+    with transaction(conn):
+        conn.executemany("INSERT INTO t VALUES (?, ?)", rows)
+"""
+
+import os
+import atexit
+import sqlite3
+import threading
+import contextlib
+
+# PRAGMAs applied to every new connection; set a value to None to keep SQLite's default
+DEFAULT_PRAGMAS = {
+    "journal_mode": None,
+    "synchronous": None,
+    "cache_size": -64000,         # negative = KB, so 64 MB of page cache
+    "mmap_size": 256 * 1024 * 1024,
+    "temp_store": "MEMORY",
+}
+# Readers don't block the writer and commits are cheaper; NORMAL is safe with WAL
+WAL_PRAGMAS = {"journal_mode": "WAL", "synchronous": "NORMAL"}
+DEFAULT_CACHED_STATEMENTS = 256
+
+settings = {"pragmas": dict(DEFAULT_PRAGMAS), "cached_statements": DEFAULT_CACHED_STATEMENTS}
+stats = {"opened": 0, "reused": 0}
+
+_local = threading.local()
+_lock = threading.Lock()
+_open = {}  # id(entry) -> (thread, entry), so close_all() can reach every thread's connections
+
+class _Entry:
+    def __init__(self, conn, identity):
+        self.conn = conn
+        self.identity = identity
+
+def _pool_key(db_path):
+    return db_path if db_path == ":memory:" else os.path.abspath(os.path.expanduser(db_path))
+
+def _file_identity(path):
+    # (device, inode) of the database file, or None when it doesn't exist (yet)
+    if path == ":memory:":
+        return ":memory:"
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_dev, stat.st_ino)
+
+def _is_usable(conn):
+    try:
+        conn.in_transaction  # raises ProgrammingError once the connection is closed
+        return True
+    except sqlite3.ProgrammingError:
+        return False
+
+def apply_pragmas(conn, pragmas=None):
+    """
+    Run `PRAGMA name = value` for each setting that isn't None.
+    """
+    for name, value in (settings["pragmas"] if pragmas is None else pragmas).items():
+        if value is not None:
+            conn.execute(f"PRAGMA {name} = {value}").fetchall()
+
+def configure(cached_statements=None, **pragmas):
+    """
+    Change the settings used for new connections, e.g. configure(journal_mode="WAL", cache_size=-16000).
+    Open pooled connections are closed so every later get_connection() uses the new settings.
+    """
+    unknown = set(pragmas) - set(DEFAULT_PRAGMAS)
+    if unknown:
+        raise ValueError(f"Unknown PRAGMA setting(s): {', '.join(sorted(unknown))}")
+    settings["pragmas"].update(pragmas)
+    if cached_statements is not None:
+        settings["cached_statements"] = cached_statements
+    close_all()
+
+def connect(db_path):
+    """
+    Open a new, unpooled connection with the configured PRAGMAs (autocommit mode).
+    """
+    conn = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False,
+                           cached_statements=settings["cached_statements"])
+    apply_pragmas(conn)
+    return conn
+
+def get_connection(db_path):
+    """
+    Return this thread's open connection to db_path, opening (and pooling) it on first use.
+    """
+    key = _pool_key(db_path)
+    pool = getattr(_local, "pool", None)
+    if pool is None:
+        pool = _local.pool = {}
+    entry = pool.get(key)
+    if entry is not None:
+        if _is_usable(entry.conn) and entry.identity == _file_identity(key):
+            stats["reused"] += 1
+            return entry.conn
+        _discard(entry)  # closed by the caller, or the file was deleted/replaced underneath us
+        del pool[key]
+    conn = connect(key)
+    entry = pool[key] = _Entry(conn, _file_identity(key))
+    with _lock:
+        _open[id(entry)] = (threading.current_thread(), entry)
+        # Forget connections of threads that have finished
+        for entry_id, (thread, other) in list(_open.items()):
+            if not thread.is_alive():
+                _discard(other)
+    stats["opened"] += 1
+    return conn
+
+def _discard(entry):
+    with contextlib.suppress(sqlite3.Error):
+        entry.conn.close()
+    _open.pop(id(entry), None)
+
+@contextlib.contextmanager
+def transaction(conn, immediate=False):
+    """
+    Run the block in one transaction: COMMIT on success, ROLLBACK on error.
+    Nested use becomes a SAVEPOINT. immediate=True takes the write lock up front (bulk loads).
+    """
+    if conn.in_transaction:
+        conn.execute("SAVEPOINT nested")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK TO nested")
+            conn.execute("RELEASE nested")
+            raise
+        conn.execute("RELEASE nested")
+        return
+    conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+    try:
+        yield conn
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    # Code like DataFrame.to_sql commits on its own, so only commit what is still open
+    if conn.in_transaction:
+        conn.execute("COMMIT")
+
+def close(db_path):
+    """
+    Close this thread's pooled connection to db_path, if any (e.g. before deleting the file).
+    """
+    pool = getattr(_local, "pool", None)
+    entry = pool.pop(_pool_key(db_path), None) if pool is not None else None
+    if entry is not None:
+        with _lock:
+            _discard(entry)
+
+def close_all():
+    """
+    Close every pooled connection (all threads); the next get_connection() reopens.
+    """
+    with _lock:
+        entries = [entry for _, entry in _open.values()]
+        _open.clear()
+    for entry in entries:
+        with contextlib.suppress(sqlite3.Error):
+            entry.conn.close()
+    pool = getattr(_local, "pool", None)
+    if pool is not None:
+        pool.clear()
+
+atexit.register(close_all)
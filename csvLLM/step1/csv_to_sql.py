@@ -5,12 +5,17 @@ csv_to_sql.py
 This script loads a CSV file into a SQLite database.
 It manually creates a table, uses pandas.read_csv to load data,
 inserts the data into SQLite via DataFrame.to_sql, and runs a basic query.
+Database access goes through the shared pooled connection (../sqlite_pool.py).
 """
 
 import os
-import sqlite3
+import sys
 import pandas as pd
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))) #set parent path
+
+from sqlite_pool import get_connection, transaction, configure, WAL_PRAGMAS
+
 def create_table_manually(db_path, table_name, schema):#essentially get table shape
     """
     Create a table manually in the SQLite database using the given schema.
@@ -20,12 +25,9 @@ def create_table_manually(db_path, table_name, schema):#essentially get table sh
         table_name (str): Name of the table to create.
         schema (str): A string defining the schema in SQL.
     """
-    conn = sqlite3.connect(db_path) #connect to database
-    cursor = conn.cursor()
+    conn = get_connection(db_path) #connect to database (pooled, stays open)
     create_table_sql = f"CREATE TABLE IF NOT EXISTS {table_name} ({schema});"
-    cursor.execute(create_table_sql)
-    conn.commit()
-    conn.close()
+    conn.execute(create_table_sql)
 
 def load_csv_to_dataframe(csv_path):
     """
@@ -50,9 +52,9 @@ def load_dataframe_to_sqlite(df, db_path, table_name, if_exists='replace'):#get
         table_name (str): Name of the target table.
         if_exists (str): Behavior if the table already exists (default 'replace').
     """
-    conn = sqlite3.connect(db_path)
-    df.to_sql(table_name, conn, if_exists=if_exists, index=False)
-    conn.close()
+    conn = get_connection(db_path)
+    with transaction(conn):  # pooled connections autocommit, so group the inserts
+        df.to_sql(table_name, conn, if_exists=if_exists, index=False)
 
 def run_basic_query(db_path, table_name, query):
     """
@@ -66,14 +68,12 @@ def run_basic_query(db_path, table_name, query):
     Returns:
         list: List of rows returned by the query.
     """
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    cursor.execute(query)
-    rows = cursor.fetchall()
-    conn.close()
+    conn = get_connection(db_path)
+    rows = conn.execute(query).fetchall()
     return rows
 
 def main():
+    configure(**WAL_PRAGMAS)  # WAL + synchronous=NORMAL for the CLI (see sqlite_pool.py)
     # Set file names and parameters
     csv_path = "sample_data.csv"
     db_path = "example.db"
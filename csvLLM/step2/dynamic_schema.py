@@ -4,26 +4,49 @@ csv_to_sqlite_dynamic.py
 
 This script loads a CSV file into a SQLite database by dynamically creating
 the table based on the CSV schema. It performs the following:
-1. Loads a CSV file using pandas.read_csv.
-2. Infers each column's SQLite type from the DataFrame's dtypes.
+1. Streams the CSV file in chunks (see ../csv_loader.py), so memory stays flat
+   however large the CSV is.
+2. Infers each column's SQLite type from a sample of the rows.
 3. Constructs and executes a CREATE TABLE statement dynamically.
-4. Inserts the CSV data into the SQLite table using DataFrame.to_sql.
+4. Inserts the rows chunk by chunk with executemany, in one transaction.
 5. Runs a basic query to verify the inserted data.
+load_csv_and_create_table is the small in-memory version of steps 1-4 (one
+pandas DataFrame for the whole file); it is kept for callers that want the
+DataFrame back, and the command line doesn't use it.
+All database access goes through the shared pooled connection (../sqlite_pool.py).
+Pass a directory instead of a file to load every *.csv in it in parallel (see
+../parallel_ingest.py).
+Loads are recorded in a manifest table (see ../csv_manifest.py), so running the
+script again skips unchanged files and only loads new rows appended to a file.
+With --upsert (or --upsert=<key column>) rows whose key is already in the table
+are updated instead of added again, so a full snapshot CSV refreshes the table.
+--engine=csv parses with the stdlib csv module instead of pandas (see
+../csv_loader.py); pandas is then never imported, so short runs start faster.
 Usage:
-    python3 csv_to_sqlite_dynamic.py <csv_path> <db_path> <table_name>
+    python3 csv_to_sqlite_dynamic.py <csv_path or directory> <db_path> <table_name> [chunk_rows] [workers] [--upsert[=key]] [--engine=csv]
 Example:
     python3 csv_to_sqlite_dynamic.py sample_data.csv example.db data_table
+    python3 csv_to_sqlite_dynamic.py daily_drops/ example.db data_table 50000 4
+    python3 csv_to_sqlite_dynamic.py customers_snapshot.csv example.db customers --upsert=customer_id
+    python3 csv_to_sqlite_dynamic.py sample_data.csv example.db data_table --engine=csv
 """
 
 import os
 import sys
-import sqlite3
-import pandas as pd
+import argparse
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))) #set parent path
+
+from csv_loader import insert_dataframe, DEFAULT_CHUNK_ROWS, ENGINES
+from parallel_ingest import ingest_directory, print_progress
+from csv_manifest import load_csv_incremental
+from sqlite_pool import get_connection, transaction, configure, WAL_PRAGMAS
 
 def map_dtype_to_sql(dtype):
     """
     Map a pandas dtype to a SQLite data type.
     """
+    import pandas as pd  # only here, so the CLI doesn't pay for importing pandas
     if pd.api.types.is_integer_dtype(dtype):
         return "INTEGER"
     elif pd.api.types.is_float_dtype(dtype):
@@ -52,19 +75,19 @@ def create_table_dynamically(db_path, table_name, schema):
     """
     Create a table in SQLite dynamically using the inferred schema.
     """
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
+    conn = get_connection(db_path)
     create_table_sql = f"CREATE TABLE IF NOT EXISTS {table_name} ({schema});"
-    cursor.execute(create_table_sql)
-    conn.commit()
-    conn.close()
+    conn.execute(create_table_sql)
 
 def load_csv_and_create_table(csv_path, db_path, table_name):
     """
     Loads a CSV file into a DataFrame, infers the table schema,
-    creates the table dynamically, and inserts the data.
+    creates the table dynamically, and inserts the data. Returns the DataFrame.
+    The whole file is held in memory, so this is for small files only; the command
+    line (and anything loading large files) uses csv_loader.stream_csv_to_sqlite.
     """
     # Load CSV file into DataFrame
+    import pandas as pd
     df = pd.read_csv(csv_path)
     
     # Infer schema from DataFrame
@@ -75,9 +98,9 @@ def load_csv_and_create_table(csv_path, db_path, table_name):
     create_table_dynamically(db_path, table_name, schema)
     
     # Insert data into the SQLite table (using 'append' since table now exists)
-    conn = sqlite3.connect(db_path)
-    df.to_sql(table_name, conn, if_exists="append", index=False)
-    conn.close()
+    conn = get_connection(db_path)
+    with transaction(conn):  # one transaction for all rows
+        insert_dataframe(conn, table_name, df)
     
     return df
 
@@ -85,29 +108,71 @@ def run_basic_query(db_path, table_name, query):
     """
     Run a basic SQL query against the SQLite database.
     """
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    cursor.execute(query)
-    rows = cursor.fetchall()
-    conn.close()
+    conn = get_connection(db_path)
+    rows = conn.execute(query).fetchall()
     return rows
 
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Load a CSV file (or a directory of them) into a SQLite table.")
+    parser.add_argument("csv_path", help="CSV file, or a directory of *.csv files")
+    parser.add_argument("db_path")
+    parser.add_argument("table_name")
+    parser.add_argument("chunk_rows", nargs="?", type=int, default=DEFAULT_CHUNK_ROWS)
+    parser.add_argument("workers", nargs="?", type=int, default=None, help="parsing processes for a directory")
+    parser.add_argument("--upsert", nargs="?", const="", default=None, metavar="KEY",
+                        help="update rows whose key is already in the table (key detected when omitted)")
+    parser.add_argument("--engine", choices=ENGINES, default="pandas")
+    return parser.parse_args(argv)
+
 def main():
-    if len(sys.argv) < 4:
-        print("Usage: python3 csv_to_sqlite_dynamic.py <csv_path> <db_path> <table_name>")
-        sys.exit(1)
-    
-    csv_path = sys.argv[1]
-    db_path = sys.argv[2]
-    table_name = sys.argv[3]
+    configure(**WAL_PRAGMAS)  # WAL + synchronous=NORMAL for the CLI (see sqlite_pool.py)
+    args = parse_args(sys.argv[1:])
+    csv_path = args.csv_path
+    db_path = args.db_path
+    table_name = args.table_name
+    chunk_rows = args.chunk_rows
+    workers = args.workers
+    engine = args.engine
+    if_exists = "upsert" if args.upsert is not None else "append"
+    key = args.upsert or None  # None = detect it
     
     if not os.path.exists(csv_path):
         print(f"CSV file '{csv_path}' not found.")
         sys.exit(1)
     
-    print(f"Loading CSV file '{csv_path}' into database '{db_path}' with table '{table_name}'")
-    
-    load_csv_and_create_table(csv_path, db_path, table_name)
+    if os.path.isdir(csv_path):
+        print(f"Loading every CSV file in '{csv_path}' into database '{db_path}' with table '{table_name}'")
+        stats = ingest_directory(csv_path, db_path, table_name, workers, chunk_rows=chunk_rows, progress=print_progress,
+                                 if_exists=if_exists, key=key, engine=engine)
+        print(f"Inserted {stats['rows']} rows from {len(stats['files']) - stats['failed']} files "
+              f"({stats['failed']} failed, {stats['rows_per_sec']:.0f} rows/sec)")
+    else:
+        print(f"Loading CSV file '{csv_path}' into database '{db_path}' with table '{table_name}'")
+        
+        # Stream the file (or just its new rows) in chunks instead of reading it all into one DataFrame
+        stats = load_csv_incremental(csv_path, db_path, table_name, chunk_rows, if_exists=if_exists, key=key,
+                                     engine=engine)
+        if stats["action"] == "skip":
+            print(f"'{csv_path}' has not changed since it was loaded ({stats['total_rows']} rows), nothing to do.")
+        elif stats["action"] == "changed" and if_exists != "upsert":
+            print(f"'{csv_path}' was changed since it was loaded, not only appended to; skipping it "
+                  f"so its rows aren't duplicated. Drop the table to load it again.")
+        else:
+            if stats["action"] == "append":
+                print(f"'{csv_path}' grew since it was loaded, loading only the new rows after byte {stats['offset']}.")
+            elif stats["action"] == "changed":
+                print(f"'{csv_path}' was changed since it was loaded; upserting all of it again.")
+            schema = ", ".join(f"{col} {sql_type}" for col, sql_type in (stats["schema"] or {}).items())
+            print(f"Inferred schema for table '{table_name}': {schema}")
+            if if_exists == "upsert":
+                print(f"Upserted {stats['rows']} rows on {', '.join(stats['key'])}: {stats['inserted']} new, "
+                      f"{stats['updated']} updated ({stats['rows_per_sec']:.0f} rows/sec)")
+            else:
+                print(f"Inserted {stats['rows']} rows in {stats['chunks']} chunks ({stats['rows_per_sec']:.0f} rows/sec)")
+            for col, (old_type, new_type) in stats["type_changes"].items():
+                print(f"Column '{col}' was widened from {old_type} to {new_type} by later rows.")
+        if stats["pending_bytes"]:
+            print(f"The last line of '{csv_path}' has no newline yet, so it is loaded by the next run.")
     
     # Run a basic query: SELECT * FROM table LIMIT 5
     query = f"SELECT * FROM {table_name} LIMIT 5;"
@@ -7,7 +7,7 @@ import pandas as pd
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))) #set parent path
 
-from dynamic_schema import map_dtype_to_sql, infer_schema_from_dataframe, create_table_dynamically, load_csv_and_create_table, run_basic_query
+from dynamic_schema import map_dtype_to_sql, infer_schema_from_dataframe, create_table_dynamically, load_csv_and_create_table, run_basic_query, parse_args, DEFAULT_CHUNK_ROWS
 
 class TestCSVtoSQLiteDynamic(unittest.TestCase):
     def setUp(self):
@@ -56,5 +56,14 @@ class TestCSVtoSQLiteDynamic(unittest.TestCase):
         # SQLite stores booleans as 1 (True) or 0 (False)
         self.assertEqual(rows[0], (1, "Alice", 3.14, 1))
     
+    def test_parse_args(self):
+        args = parse_args(["data.csv", "example.db", "t"])
+        self.assertEqual((args.chunk_rows, args.workers, args.upsert, args.engine), (DEFAULT_CHUNK_ROWS, None, None, "pandas"))
+        args = parse_args(["drops/", "example.db", "t", "500", "4", "--upsert", "--engine=csv"])
+        self.assertEqual((args.chunk_rows, args.workers, args.upsert, args.engine), (500, 4, "", "csv"))
+        self.assertEqual(parse_args(["data.csv", "example.db", "t", "--upsert=customer_id"]).upsert, "customer_id")
+        with self.assertRaises(SystemExit):
+            parse_args(["data.csv", "example.db", "t", "--engine=arrow"])
+    
 if __name__ == "__main__":
     unittest.main()
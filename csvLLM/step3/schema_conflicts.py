@@ -11,7 +11,12 @@ It dynamically infers the CSV schema and then:
            - (R)ename the new column (and update the CSV data accordingly), or
            - (S)kip inserting data for that column.
   - Errors and conflicts are logged to error_log.txt.
-  - Finally, the CSV data is inserted.
+  - Finally, the CSV data is inserted. The file is read in chunks of DEFAULT_CHUNK_ROWS rows
+    (see ../csv_loader.py): the first chunk decides the schema and the conflict answers,
+    which are then applied to every chunk, so memory doesn't grow with the file.
+  - Loads are recorded in a manifest table (see ../csv_manifest.py): running it again on
+    an unchanged file does nothing, and a file that was appended to only loads its new rows.
+All database access goes through the shared pooled connection (../sqlite_pool.py).
 
 Usage:
     python3 schema_conflicts.py <csv_path> <db_path> <table_name>
@@ -21,10 +26,15 @@ Example:
 
 import os
 import sys
-import sqlite3
 import pandas as pd
 import logging
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))) #set parent path
+
+from csv_loader import insert_dataframe, open_csv, DEFAULT_CHUNK_ROWS
+from csv_manifest import plan_load, record_load, forget_table
+from sqlite_pool import get_connection, transaction, configure, WAL_PRAGMAS
+
 # Configure logging to file.
 logging.basicConfig(filename='error_log.txt', level=logging.ERROR,
                     format='%(asctime)s - %(levelname)s - %(message)s')
@@ -62,27 +72,21 @@ def create_table_dynamically(db_path, table_name, schema_str):
     """
     Create a table in SQLite dynamically using the inferred schema.
     """
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
+    conn = get_connection(db_path)
     create_table_sql = f"CREATE TABLE IF NOT EXISTS {table_name} ({schema_str});"
     try:
-        cursor.execute(create_table_sql)
-        conn.commit()
+        conn.execute(create_table_sql)
     except Exception as e:
         logging.error("Error creating table: %s", e)
         print(f"Error creating table: {e}")
-    finally:
-        conn.close()
 
 def table_exists(db_path, table_name):
     """
     Check if a table exists in the SQLite database.
     """
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?;", (table_name,))
+    conn = get_connection(db_path)
+    cursor = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?;", (table_name,))
     exists = cursor.fetchone() is not None
-    conn.close()
     return exists
 
 def get_existing_schema(db_path, table_name):
@@ -90,11 +94,8 @@ def get_existing_schema(db_path, table_name):
     Retrieve the existing schema of a table as a dictionary mapping column names to types.
     Uses PRAGMA table_info().
     """
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    cursor.execute(f"PRAGMA table_info({table_name});")
-    rows = cursor.fetchall()
-    conn.close()
+    conn = get_connection(db_path)
+    rows = conn.execute(f"PRAGMA table_info({table_name});").fetchall()
     # rows: (cid, name, type, notnull, dflt_value, pk)
     return {row[1]: row[2] for row in rows}
 
@@ -102,11 +103,9 @@ def drop_table(db_path, table_name):
     """
     Drop the table from the SQLite database.
     """
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    cursor.execute(f"DROP TABLE IF EXISTS {table_name};")
-    conn.commit()
-    conn.close()
+    conn = get_connection(db_path)
+    conn.execute(f"DROP TABLE IF EXISTS {table_name};")
+    forget_table(conn, table_name)  # its files have to be loaded in full again
     print(f"Table '{table_name}' has been dropped.")
 
 def prompt_conflict_resolution(conflict_col, existing_type, inferred_type):
@@ -130,7 +129,7 @@ def prompt_conflict_resolution(conflict_col, existing_type, inferred_type):
         else:
             print("Invalid input. Please enter O, R, or S.")
 
-def handle_schema_conflicts_interactive(db_path, table_name, inferred_schema_dict, df):
+def handle_schema_conflicts_interactive(db_path, table_name, inferred_schema_dict, df, decisions=None):
     """
     Compare the inferred schema with the existing table schema and handle conflicts interactively.
     If a conflict is found for a column:
@@ -138,9 +137,11 @@ def handle_schema_conflicts_interactive(db_path, table_name, inferred_schema_dic
       - Overwriting means dropping the existing table and recreating it.
       - Renaming adds a new column with a provided name (and renames the dataframe column).
       - Skipping removes that column from the dataframe insertion.
+    If a dict is given as `decisions`, the renames and skips are also stored in it as
+    {"rename": {old: new}, "drop": [column, ...]}, to apply them to later chunks.
     """
     existing_schema = get_existing_schema(db_path, table_name)
-    conn = sqlite3.connect(db_path)
+    conn = get_connection(db_path)
     cursor = conn.cursor()
 
     # We will collect columns to drop from the DataFrame if the user chooses "skip"
@@ -156,7 +157,6 @@ def handle_schema_conflicts_interactive(db_path, table_name, inferred_schema_dic
                     # Overwrite: drop the table and return an indicator to recreate.
                     drop_table(db_path, table_name)
                     print("Overwriting the table with new schema...")
-                    conn.close()
                     return "OVERWRITE"
                 elif choice == 'R':
                     # Rename: prompt for a new column name and update both the table and dataframe.
@@ -170,6 +170,8 @@ def handle_schema_conflicts_interactive(db_path, table_name, inferred_schema_dic
                         try:
                             cursor.execute(alter_sql)
                             df.rename(columns={col: new_name}, inplace=True)
+                            if decisions is not None:
+                                decisions.setdefault("rename", {})[col] = new_name
                             print(f"Column '{col}' will be inserted as '{new_name}'.")
                         except Exception as e:
                             logging.error("Error renaming column '%s': %s", col, e)
@@ -188,42 +190,86 @@ def handle_schema_conflicts_interactive(db_path, table_name, inferred_schema_dic
             except Exception as e:
                 logging.error("Error adding column '%s': %s", col, e)
                 print(f"Error adding column '{col}': {e}")
-    conn.commit()
-    conn.close()
 
     # Remove columns from dataframe that the user chose to skip.
     if cols_to_drop:
         df.drop(columns=cols_to_drop, inplace=True)
+    if decisions is not None:
+        decisions.setdefault("drop", []).extend(cols_to_drop)
     return "OK"
 
+def read_csv_chunks(csv_path, offset=0, end=None, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Read the bytes [offset, end) of a CSV file as DataFrames of chunk_rows rows (at least one, maybe empty).
+    """
+    with open_csv(csv_path, offset, end) as (f, read_kwargs):
+        yield from pd.read_csv(f, chunksize=chunk_rows, **read_kwargs)
+
 def load_csv_and_create_table_with_interactive_conflict(csv_path, db_path, table_name):
     """
     Load CSV into DataFrame, handle schema conflicts interactively, and insert data into SQLite.
+    Only rows not loaded before are read (see ../csv_manifest.py), chunk by chunk. Returns the
+    first chunk with the chosen renames and skips applied, or None if there is nothing to load.
     """
-    # Load CSV into DataFrame.
-    df = pd.read_csv(csv_path)
-    schema_str, inferred_schema_dict = infer_schema_from_dataframe(df)
+    conn = get_connection(db_path)
+    plan = plan_load(conn, csv_path, table_name)
+    if plan["action"] == "skip":
+        print(f"'{csv_path}' has not changed since it was loaded into '{table_name}'. Nothing to insert.")
+        return None
+    if plan["action"] == "changed":
+        logging.error("'%s' changed since it was loaded into '%s'; skipped to avoid duplicate rows.", csv_path, table_name)
+        print(f"'{csv_path}' was changed since it was loaded, not only appended to. Skipping it so its rows "
+              f"aren't duplicated; overwrite or drop the table to load it again.")
+        return None
 
-    # If the table exists, check for conflicts; otherwise, create the table.
-    if table_exists(db_path, table_name):
-        print(f"Table '{table_name}' exists. Checking for schema conflicts...")
-        result = handle_schema_conflicts_interactive(db_path, table_name, inferred_schema_dict, df)
-        if result == "OVERWRITE":
-            # Recreate the table with new schema.
-            create_table_dynamically(db_path, table_name, schema_str)
-    else:
-        create_table_dynamically(db_path, table_name, schema_str)
-        print(f"Created table '{table_name}' with schema: {schema_str}")
-        
-    # Insert data into the table using 'append' mode.
+    # Read the CSV in chunks: the whole file, or only the rows appended since the last load.
+    offset = plan["offset"] if plan["action"] == "append" else 0
+    if offset:
+        print(f"'{csv_path}' grew since it was loaded. Loading only the new rows.")
+    chunks = read_csv_chunks(csv_path, offset, plan["size"])
     try:
-        conn = sqlite3.connect(db_path)
-        df.to_sql(table_name, conn, if_exists="append", index=False)
-        conn.close()
-        print("Data inserted successfully.")
-    except Exception as e:
-        logging.error("Error inserting data: %s", e)
-        print(f"Error inserting data: {e}")
+        # The first chunk decides the schema, and the answers to the conflict prompts hold for every chunk.
+        df = next(chunks)
+        schema_str, inferred_schema_dict = infer_schema_from_dataframe(df)
+        decisions = {}
+
+        # If the table exists, check for conflicts; otherwise, create the table.
+        if table_exists(db_path, table_name):
+            print(f"Table '{table_name}' exists. Checking for schema conflicts...")
+            result = handle_schema_conflicts_interactive(db_path, table_name, inferred_schema_dict, df, decisions)
+            if result == "OVERWRITE":
+                # Start over with the new table, dropping renames answered before the overwrite; the old
+                # rows are gone with the table, so an appended file has to go in again in full.
+                chunks.close()
+                if offset:
+                    plan = plan_load(conn, csv_path, table_name)
+                    offset = 0
+                chunks = read_csv_chunks(csv_path, 0, plan["size"])
+                df = next(chunks)
+                schema_str, inferred_schema_dict = infer_schema_from_dataframe(df)
+                decisions = {}
+                # Recreate the table with new schema.
+                create_table_dynamically(db_path, table_name, schema_str)
+        else:
+            create_table_dynamically(db_path, table_name, schema_str)
+            print(f"Created table '{table_name}' with schema: {schema_str}")
+
+        # Insert data into the table using 'append' mode.
+        try:
+            with transaction(conn):  # one transaction for all rows and the manifest entry
+                insert_dataframe(conn, table_name, df)
+                rows = len(df)
+                for chunk in chunks:
+                    chunk = chunk.drop(columns=decisions.get("drop", [])).rename(columns=decisions.get("rename", {}))
+                    insert_dataframe(conn, table_name, chunk)
+                    rows += len(chunk)
+                record_load(conn, plan, table_name, (plan["rows"] if offset else 0) + rows)
+            print("Data inserted successfully.")
+        except Exception as e:
+            logging.error("Error inserting data: %s", e)
+            print(f"Error inserting data: {e}")
+    finally:
+        chunks.close()
 
     return df
 
@@ -231,14 +277,12 @@ def run_basic_query(db_path, table_name, query):
     """
     Run a basic SQL query and return the results.
     """
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    cursor.execute(query)
-    rows = cursor.fetchall()
-    conn.close()
+    conn = get_connection(db_path)
+    rows = conn.execute(query).fetchall()
     return rows
 
 def main():
+    configure(**WAL_PRAGMAS)  # WAL + synchronous=NORMAL for the CLI (see sqlite_pool.py)
     if len(sys.argv) < 4:
         print("Usage: python3 csv_to_sqlite_dynamic_conflict_interactive.py <csv_path> <db_path> <table_name>")
         sys.exit(1)
@@ -2,6 +2,7 @@ import os
 import sys
 import sqlite3
 import unittest
+import functools
 import pandas as pd
 from unittest.mock import patch
 
@@ -11,7 +12,8 @@ from schema_conflicts import (
     create_table_dynamically,
     table_exists,
     get_existing_schema,
-    load_csv_and_create_table_with_interactive_conflict
+    load_csv_and_create_table_with_interactive_conflict,
+    read_csv_chunks
 )
 
 class TestCSVtoSQLiteDynamicConflictInteractive(unittest.TestCase):
@@ -80,6 +82,18 @@ class TestCSVtoSQLiteDynamicConflictInteractive(unittest.TestCase):
         columns = [col_info[1] for col_info in schema_info]
         self.assertIn("value_new", columns)
     
+    @patch('builtins.input', side_effect=["R", "value_new"])
+    def test_answers_apply_to_every_chunk(self, mock_input):
+        # One row per chunk: the rename answered for the first chunk must hold for the later ones
+        with patch("schema_conflicts.read_csv_chunks", functools.partial(read_csv_chunks, chunk_rows=1)):
+            df = load_csv_and_create_table_with_interactive_conflict(self.csv_path, self.db_path, self.table_name)
+        self.assertEqual(len(df), 1)
+        conn = sqlite3.connect(self.db_path)
+        rows = conn.execute(f"SELECT id, value, value_new FROM {self.table_name} ORDER BY id").fetchall()
+        conn.close()
+        self.assertEqual(rows, [(1, None, 3.14), (2, None, 2.71)])
+        self.assertEqual(mock_input.call_count, 2)  # asked once, not once per chunk
+
     @patch('builtins.input', side_effect=["O"])
     def test_handle_conflict_overwrite(self, mock_input):
         # With simulated input "O", the table will be dropped and recreated.
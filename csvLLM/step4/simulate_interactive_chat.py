@@ -10,6 +10,8 @@ The assistant lets you:
   5. Exit.
 
 It uses pandas to load CSV files and sqlite3 to manage the SQLite database.
+CSV files are streamed into the database in chunks (see ../csv_loader.py), and
+every action reuses one pooled connection (see ../sqlite_pool.py).
 
 Usage:
     python3 step4/interactive_assistant.py
@@ -18,8 +20,13 @@ Usage:
 """
 
 import os
-import sqlite3
-import pandas as pd
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))) #set parent path
+
+from csv_loader import stream_csv_to_sqlite, sample_schema
+from sqlite_pool import get_connection, configure, WAL_PRAGMAS
+from csv_manifest import forget_table
 
 # Use this constant for our database.
 DB_PATH = "assistant.db"
@@ -36,50 +43,36 @@ def load_csv_to_db():
         table_name = "data_table"
 
     try:
-        df = pd.read_csv(csv_path)
+        # Only a sample of rows is read here, the whole file is streamed in below
+        schema = sample_schema(csv_path)
     except Exception as e:
         print(f"Error reading CSV file: {e}")
         return
 
     # Show inferred schema.
-    schema_elements = []
-    for col in df.columns:
-        if pd.api.types.is_integer_dtype(df[col]):
-            sql_type = "INTEGER"
-        elif pd.api.types.is_float_dtype(df[col]):
-            sql_type = "REAL"
-        elif pd.api.types.is_bool_dtype(df[col]):
-            sql_type = "INTEGER"
-        elif pd.api.types.is_datetime64_any_dtype(df[col]):
-            sql_type = "DATETIME"
-        else:
-            sql_type = "TEXT"
-        schema_elements.append(f"{col} {sql_type}")
-    inferred_schema = ", ".join(schema_elements)
+    inferred_schema = ", ".join(f"{col} {sql_type}" for col, sql_type in schema.items())
     print(f"\nInferred schema for '{table_name}':")
     print(inferred_schema)
     
     # For simplicity, if table exists, ask if the user wants to overwrite it.
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?;", (table_name,))
+    conn = get_connection(DB_PATH)
+    cursor = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?;", (table_name,))
     exists = cursor.fetchone() is not None
     if exists:
         choice = input(f"Table '{table_name}' already exists. Overwrite? (y/n): ").strip().lower()
         if choice == "y":
-            cursor.execute(f"DROP TABLE {table_name};")
-            conn.commit()
+            conn.execute(f"DROP TABLE {table_name};")
+            forget_table(conn, table_name)
             print(f"Existing table '{table_name}' dropped.")
         else:
             print("Appending data to the existing table.")
-    conn.close()
     
     try:
         # This automatically creates the table if it does not exist.
-        conn = sqlite3.connect(DB_PATH)
-        df.to_sql(table_name, conn, if_exists="append", index=False)
-        conn.close()
-        print(f"Data from '{csv_path}' loaded into table '{table_name}'.")
+        stats = stream_csv_to_sqlite(csv_path, DB_PATH, table_name)
+        print(f"Data from '{csv_path}' loaded into table '{table_name}' ({stats['rows']} rows).")
+        for col, (old_type, new_type) in stats["type_changes"].items():
+            print(f"Column '{col}' was widened from {old_type} to {new_type} by later rows.")
     except Exception as e:
         print(f"Error inserting data into SQLite: {e}")
 
@@ -87,12 +80,8 @@ def run_sql_query():
     """Prompts the user for a SQL query, then executes and prints the results."""
     query = input("Enter your SQL query: ").strip()
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute(query)
-        results = cursor.fetchall()
-        conn.commit()
-        conn.close()
+        conn = get_connection(DB_PATH)  # autocommit, so writes are saved right away
+        results = conn.execute(query).fetchall()
         if results:
             print("Query results:")
             # Print results row by row
@@ -106,11 +95,8 @@ def run_sql_query():
 def list_tables():
     """Lists all tables in the SQLite database using sqlite_master."""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        tables = cursor.fetchall()
-        conn.close()
+        conn = get_connection(DB_PATH)
+        tables = conn.execute("SELECT name FROM sqlite_master WHERE type='table';").fetchall()
         if tables:
             print("Tables in the database:")
             for (tbl,) in tables:
@@ -152,6 +138,7 @@ def analyze_schema():
 
 def main_menu():
     """Main interactive loop for the assistant."""
+    configure(**WAL_PRAGMAS)  # WAL + synchronous=NORMAL for the CLI (see sqlite_pool.py)
     print("Welcome to the AI-Assisted SQLite Assistant.")
     print("I can help you load CSV data, run SQL queries, list tables, or even analyze a schema.\n")
     
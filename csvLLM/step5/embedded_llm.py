@@ -10,6 +10,7 @@ It performs the following:
   5. Optionally displays the generated SQL.
   6. Executes the generated SQL against the database and displays the results.
   7. The CLI continues to run in a loop until the user chooses to exit.
+The schema lookup and every generated query share one pooled connection (../sqlite_pool.py).
 
 Usage:
     python3 embedded_llm.py <db_path> <table_name>
@@ -20,9 +21,12 @@ Make sure to set your API key in environment:
 
 import os
 import sys
-import sqlite3
 from google import genai
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))) #set parent path
+
+from sqlite_pool import get_connection, configure, WAL_PRAGMAS
+
 # Set up the Google GenAI client
 API_KEY = os.environ.get("GOOGLE_GENAI_API_KEY")
 if not API_KEY:
@@ -38,11 +42,8 @@ def get_table_schema(db_path, table_name):
     Returns a string such as "id INTEGER, name TEXT, value REAL".
     """
     try:
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        cursor.execute(f"PRAGMA table_info({table_name});")
-        rows = cursor.fetchall()
-        conn.close()
+        conn = get_connection(db_path)
+        rows = conn.execute(f"PRAGMA table_info({table_name});").fetchall()
 
         if not rows:
             return ""
@@ -98,12 +99,8 @@ def execute_sql_query(db_path, query):
     Execute the given SQL query against the SQLite database and return the results.
     """
     try:
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        cursor.execute(query)
-        results = cursor.fetchall()
-        conn.commit()
-        conn.close()
+        conn = get_connection(db_path)  # autocommit, so writes are saved right away
+        results = conn.execute(query).fetchall()
         return results
     except Exception as e:
         print("Error executing SQL query:", e)
@@ -118,6 +115,7 @@ def clean_sql_query(sql_query: str, table_name: str) -> str:
     return sql_query
 
 def main():
+    configure(**WAL_PRAGMAS)  # WAL + synchronous=NORMAL for the CLI (see sqlite_pool.py)
     if len(sys.argv) < 3:
         print("Usage: python3 embedded_llm.py <db_path> <table_name>")
         sys.exit(1)
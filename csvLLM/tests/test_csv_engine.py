@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+import os
+import sys
+import shutil
+import sqlite3
+import tempfile
+import unittest
+import subprocess
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))) #set parent path
+
+from csv_loader import stream_csv_to_sqlite, read_sample, infer_raw_type, to_integer
+from csv_manifest import load_csv_incremental
+from parallel_ingest import ingest_directory
+
+PARENT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+class TestCsvEngine(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.csv_path = os.path.join(self.tmpdir, "data.csv")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, text, path=None):
+        with open(path or self.csv_path, "w") as f:
+            f.write(text)
+
+    def load(self, engine, **kwargs):
+        db_path = os.path.join(self.tmpdir, f"{engine}.db")
+        if os.path.exists(db_path):
+            os.remove(db_path)
+        stats = stream_csv_to_sqlite(self.csv_path, db_path, "t", engine=engine, **kwargs)
+        conn = sqlite3.connect(db_path)
+        rows = conn.execute("SELECT * FROM t").fetchall()
+        types = [row[2] for row in conn.execute("PRAGMA table_info(t)")]
+        conn.close()
+        return stats["schema"], stats["type_changes"], types, rows
+
+    def test_same_result_as_pandas(self):
+        self.write("id,price,qty,name,active,day,empty,a,a\n"
+                   "1,1.5,3.0,apple,True,2024-01-05,,x,y\n"
+                   "2,,,\"pear, green\",False,2024-02-01 10:30,NA,x,y\n"
+                   "\n"
+                   "3,2,5.0,,true,2024-03-01\n"
+                   "4,oops,6,NULL,False,not a date,,x,y\n")
+        result = self.load("csv", chunk_rows=2, sample_rows=2)
+        self.assertEqual(result, self.load("pandas", chunk_rows=2, sample_rows=2))
+        schema, type_changes, _, rows = result
+        self.assertEqual(schema, {"id": "INTEGER", "price": "TEXT", "qty": "REAL", "name": "TEXT", "active": "INTEGER",
+                                  "day": "TEXT", "empty": "REAL", "a": "TEXT", "a.1": "TEXT"})
+        self.assertEqual(type_changes, {"price": ["REAL", "TEXT"], "qty": ["INTEGER", "REAL"], "day": ["DATETIME", "TEXT"]})
+        self.assertEqual(rows[2], (3, "2", 5.0, None, 1, "2024-03-01", None, None, None))
+        # True/False with a gap is an object column in pandas, so TEXT as written
+        self.write("a,b\nTrue,1\n,2\nFalse,3\n")
+        for kwargs in ({}, {"chunk_rows": 2, "sample_rows": 1}):
+            result = self.load("csv", **kwargs)
+            self.assertEqual(result, self.load("pandas", **kwargs))
+        self.assertEqual(self.load("csv")[3], [("True", 1), (None, 2), ("False", 3)])
+
+    def test_same_result_for_big_and_non_ascii_numbers(self):
+        # Beyond SQLite's 64-bit INTEGER, or digits int() accepts but pandas doesn't: TEXT in both engines
+        for value in ("99999999999999999999999", "18446744073709551615", "-9223372036854775809", "١٢"):
+            for sample_rows in (None, 10):  # found in the sample, or only in a later chunk
+                self.write(f"a,b\n1,x\n2,y\n{value},z\n")
+                result = self.load("csv", chunk_rows=2, sample_rows=sample_rows)
+                self.assertEqual(result, self.load("pandas", chunk_rows=2, sample_rows=sample_rows))
+                self.assertEqual(result[0]["a"], "TEXT")
+                self.assertEqual(result[3][2], (value, "z"))
+        self.write("a\n9223372036854775807\n-9223372036854775808\n")
+        self.assertEqual(self.load("csv")[3], [(2**63 - 1,), (-2**63,)])
+        # Appending huge numbers to a column that is already TEXT
+        db_path = os.path.join(self.tmpdir, "append.db")
+        self.write("a\nx\n")
+        stream_csv_to_sqlite(self.csv_path, db_path, "t")
+        self.write("a\n1\n2\n99999999999999999999999\n")
+        for engine in ("pandas", "csv"):
+            stream_csv_to_sqlite(self.csv_path, db_path, "t", chunk_rows=2, sample_rows=2, engine=engine)
+        conn = sqlite3.connect(db_path)
+        self.assertEqual(conn.execute("SELECT a FROM t").fetchall(), [("x",)] + [("1",), ("2",), ("99999999999999999999999",)] * 2)
+        conn.close()
+
+    def test_converters(self):
+        self.assertEqual(to_integer(["1", "", "3"]), [1, None, 3])
+        self.assertEqual(to_integer(["1.0", "NA", "3.0"]), [1, None, 3])  # pandas: floats with gaps
+        self.assertEqual(to_integer(["True", "false"]), [1, 0])
+        for bad in (["True", "false", ""], ["1.5"], ["1.0", "2.0"], ["1_000"], ["inf", ""], ["x"], ["١٢"], [str(2**63)], ["", str(-2**63 - 1)]):
+            with self.assertRaises(ValueError):
+                to_integer(bad)
+        self.assertEqual([infer_raw_type(values) for values in (["1", "2"], ["1.0", ""], ["1.0", "2"], ["", "NA"],
+                                                                ["2024-01-01", ""], ["1_000"], [], ["١٢"], [str(2**64)], ["True", ""])],
+                         ["INTEGER", "INTEGER", "REAL", "REAL", "DATETIME", "TEXT", "TEXT", "TEXT", "TEXT", "TEXT"])
+
+    def test_errors(self):
+        self.write("")
+        with self.assertRaises(ValueError):
+            read_sample(self.csv_path, engine="csv")
+        self.write("a,b\n1,2,3\n")
+        with self.assertRaisesRegex(ValueError, "Expected 2 fields"):
+            self.load("csv")
+        with self.assertRaises(ValueError):
+            self.load("arrow")
+
+    def test_incremental_upsert_and_directory(self):
+        db_path = os.path.join(self.tmpdir, "inc.db")
+        self.write("id,value\n1,10\n2,20\n")
+        load_csv_incremental(self.csv_path, db_path, "t", engine="csv")
+        with open(self.csv_path, "a") as f:
+            f.write("3,30.5\n")
+        stats = load_csv_incremental(self.csv_path, db_path, "t", engine="csv")
+        self.assertEqual((stats["action"], stats["rows"], stats["type_changes"]), ("append", 1, {"value": ["INTEGER", "REAL"]}))
+        self.write("id,value\n2,21\n4,40\n", os.path.join(self.tmpdir, "snapshot.csv"))
+        stats = stream_csv_to_sqlite(os.path.join(self.tmpdir, "snapshot.csv"), db_path, "t", if_exists="upsert", engine="csv")
+        self.assertEqual((stats["key"], stats["inserted"], stats["updated"]), (["id"], 1, 1))
+        drops = os.path.join(self.tmpdir, "drops")
+        os.mkdir(drops)
+        self.write("id,value\n5,50\n", os.path.join(drops, "a.csv"))
+        self.write("", os.path.join(drops, "broken.csv"))
+        stats = ingest_directory(drops, db_path, "t", workers=1, engine="csv")
+        self.assertEqual((stats["rows"], stats["failed"]), (1, 1))
+        conn = sqlite3.connect(db_path)
+        self.assertEqual(conn.execute("SELECT id, value FROM t ORDER BY id").fetchall(),
+                         [(1, 10.0), (2, 21.0), (3, 30.5), (4, 40.0), (5, 50.0)])
+        conn.close()
+
+    def test_import_skips_pandas(self):
+        # The csv engine path must not import pandas (that is what makes short CLI runs fast)
+        code = ("import sys; import csv_loader, csv_manifest, parallel_ingest; "
+                "csv_loader.read_sample(sys.argv[1], engine='csv'); print('pandas' in sys.modules)")
+        self.write("id,value\n1,2\n")
+        out = subprocess.run([sys.executable, "-c", code, self.csv_path], cwd=PARENT, capture_output=True, text=True, check=True)
+        self.assertEqual(out.stdout.strip(), "False")
+
+if __name__ == "__main__":
+    unittest.main()
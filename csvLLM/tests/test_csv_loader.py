@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+import os
+import sys
+import shutil
+import sqlite3
+import tempfile
+import unittest
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))) #set parent path
+
+from csv_loader import stream_csv_to_sqlite, insert_dataframe, infer_schema, dataframe_rows, sample_schema, promote_type
+
+class TestStreamingLoader(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmpdir, "test.db")
+        self.csv_path = os.path.join(self.tmpdir, "data.csv")
+        pd.DataFrame({
+            "id": range(1, 8),
+            "name": ["Alice", "Bob", "Charlie", None, "Eve", "Frank", "Grace"],
+            "value": [3.14, 2.71, 1.41, 0.5, None, 7.0, 8.25],
+            "active": [True, False, True, True, False, True, False]
+        }).to_csv(self.csv_path, index=False)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def query(self, sql):
+        conn = sqlite3.connect(self.db_path)
+        rows = conn.execute(sql).fetchall()
+        conn.close()
+        return rows
+
+    def test_loads_in_chunks(self):
+        stats = stream_csv_to_sqlite(self.csv_path, self.db_path, "data_table", chunk_rows=3)
+        self.assertEqual((stats["rows"], stats["chunks"]), (7, 3))
+        self.assertEqual(stats["schema"], {"id": "INTEGER", "name": "TEXT", "value": "REAL", "active": "INTEGER"})
+        rows = self.query("SELECT * FROM data_table ORDER BY id")
+        self.assertEqual(len(rows), 7)
+        self.assertEqual(rows[0], (1, "Alice", 3.14, 1))
+        # Missing values are stored as NULL
+        self.assertIsNone(rows[3][1])
+        self.assertIsNone(rows[4][2])
+
+    def test_append_and_replace(self):
+        stream_csv_to_sqlite(self.csv_path, self.db_path, "data_table")
+        stream_csv_to_sqlite(self.csv_path, self.db_path, "data_table", chunk_rows=2)
+        self.assertEqual(self.query("SELECT COUNT(*) FROM data_table"), [(14,)])
+        stream_csv_to_sqlite(self.csv_path, self.db_path, "data_table", if_exists="replace")
+        self.assertEqual(self.query("SELECT COUNT(*) FROM data_table"), [(7,)])
+
+    def test_type_changes_are_reported(self):
+        with open(self.csv_path, "w") as f:
+            f.write("id,value\n1,10\n2,20\n3,2.5\n4,oops\n")
+        stats = stream_csv_to_sqlite(self.csv_path, self.db_path, "data_table", chunk_rows=2, sample_rows=2)
+        self.assertEqual(stats["type_changes"], {"value": ["INTEGER", "TEXT"]})
+        self.assertEqual(stats["schema"], {"id": "INTEGER", "value": "TEXT"})
+        # The rows loaded before the promotion are converted too
+        self.assertEqual(self.query("SELECT value FROM data_table ORDER BY id"), [("10",), ("20",), ("2.5",), ("oops",)])
+
+    def test_promotion_keeps_rows_and_indexes(self):
+        with open(self.csv_path, "w") as f:
+            f.write("id,value\n1,10\n2,20\n3,2.5\n4,\n5,7\n")
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('CREATE TABLE data_table ("id" INTEGER NOT NULL, "value" INTEGER, "note" TEXT DEFAULT \'-\')')
+        conn.execute('CREATE UNIQUE INDEX data_table_id ON data_table ("id")')
+        conn.execute("INSERT INTO data_table (id, value) VALUES (0, 5)")
+        conn.commit()
+        conn.close()
+        stats = stream_csv_to_sqlite(self.csv_path, self.db_path, "data_table", chunk_rows=2, sample_rows=2)
+        self.assertEqual((stats["type_changes"], stats["migrations"]), ({"value": ["INTEGER", "REAL"]}, 1))
+        self.assertEqual(self.query("SELECT id, value, note FROM data_table ORDER BY id"),
+                         [(0, 5.0, "-"), (1, 10.0, "-"), (2, 20.0, "-"), (3, 2.5, "-"), (4, None, "-"), (5, 7.0, "-")])
+        self.assertEqual(self.query("SELECT name FROM sqlite_master WHERE type='index'"), [("data_table_id",)])
+        with self.assertRaises(sqlite3.IntegrityError):
+            stream_csv_to_sqlite(self.csv_path, self.db_path, "data_table")
+
+    def test_promotion_keeps_constraints_and_triggers(self):
+        with open(self.csv_path, "w") as f:
+            f.write("code,value\nA,1\nb,2\nc,2.5\n")
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("CREATE TABLE data_table (code TEXT COLLATE NOCASE UNIQUE, -- the key\n"
+                     "  value INTEGER CHECK (value >= 0), seen INTEGER DEFAULT 0)")
+        conn.execute("CREATE TABLE audit (code TEXT)")
+        conn.execute("CREATE TRIGGER data_table_audit AFTER INSERT ON data_table BEGIN "
+                     "INSERT INTO audit VALUES (new.code); END")
+        conn.commit()
+        conn.close()
+        stats = stream_csv_to_sqlite(self.csv_path, self.db_path, "data_table", chunk_rows=2, sample_rows=2)
+        self.assertEqual(stats["type_changes"], {"value": ["INTEGER", "REAL"]})
+        self.assertEqual(self.query("SELECT sql FROM sqlite_master WHERE name = 'data_table'"),
+                         [('CREATE TABLE "data_table" (code TEXT COLLATE NOCASE UNIQUE, -- the key\n'
+                           '  value REAL CHECK (value >= 0), seen INTEGER DEFAULT 0)',)])
+        self.assertEqual(self.query("SELECT code FROM audit"), [("A",), ("b",), ("c",)])
+        conn = sqlite3.connect(self.db_path)
+        for row in (("a", 1), ("d", -1)):  # the UNIQUE (with its collation) and CHECK constraints still hold
+            with self.assertRaises(sqlite3.IntegrityError):
+                conn.execute("INSERT INTO data_table (code, value) VALUES (?, ?)", row)
+        conn.close()
+
+    def test_sample_inference_and_dates(self):
+        with open(self.csv_path, "w") as f:
+            f.write("id,day,count,label\n1,2024-01-05,3,a\n2,2024-01-06 10:30,,b\n3,,5,c\n4,2024-02-01T08:00:00,6,d\n")
+        self.assertEqual(sample_schema(self.csv_path, 3), {"id": "INTEGER", "day": "DATETIME", "count": "INTEGER", "label": "TEXT"})
+        stats = stream_csv_to_sqlite(self.csv_path, self.db_path, "data_table", chunk_rows=2, sample_rows=1)
+        self.assertEqual(stats["type_changes"], {})
+        self.assertEqual(self.query("SELECT day, count FROM data_table ORDER BY id"),
+                         [("2024-01-05", 3), ("2024-01-06 10:30", None), (None, 5), ("2024-02-01T08:00:00", 6)])
+        # A value that is not a date turns the column into TEXT
+        with open(self.csv_path, "a") as f:
+            f.write("5,soon,7,e\n")
+        stats = stream_csv_to_sqlite(self.csv_path, self.db_path, "data_table", chunk_rows=2, if_exists="replace")
+        self.assertEqual(stats["schema"]["day"], "TEXT")
+        stats = stream_csv_to_sqlite(self.csv_path, self.db_path, "other_table", chunk_rows=2, sample_rows=2)
+        self.assertEqual(stats["type_changes"], {"day": ["DATETIME", "TEXT"]})
+        self.assertEqual(sample_schema(self.csv_path, 2)["day"], "DATETIME")
+        self.assertEqual(infer_schema(pd.DataFrame({"day": ["2024-13-01"]}))["day"], "TEXT")
+        self.assertEqual(promote_type("INTEGER", "REAL"), "REAL")
+        self.assertEqual(promote_type("REAL", "INTEGER"), "REAL")
+        self.assertEqual(promote_type("DATETIME", "INTEGER"), "TEXT")
+
+    def test_failed_load_rolls_back(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('CREATE TABLE data_table ("id" INTEGER PRIMARY KEY, "name" TEXT, "value" REAL, "active" INTEGER)')
+        conn.execute("INSERT INTO data_table VALUES (7, 'Existing', 0, 0)")
+        conn.commit()
+        conn.close()
+        # id 7 collides in the third chunk, so the rows of the first two chunks must not stay either
+        with self.assertRaises(sqlite3.IntegrityError):
+            stream_csv_to_sqlite(self.csv_path, self.db_path, "data_table", chunk_rows=3)
+        self.assertEqual(self.query("SELECT COUNT(*) FROM data_table"), [(1,)])
+
+    def test_insert_dataframe(self):
+        df = pd.read_csv(self.csv_path)
+        self.assertEqual(list(dataframe_rows(df.head(1))), [(1, "Alice", 3.14, True)])
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("CREATE TABLE data_table (id INTEGER, name TEXT, value REAL, active INTEGER)")
+        with conn:
+            insert_dataframe(conn, "data_table", df, chunk_rows=2)
+        conn.close()
+        self.assertEqual(self.query("SELECT COUNT(*) FROM data_table"), [(7,)])
+        self.assertEqual(infer_schema(df)["active"], "INTEGER")
+
+if __name__ == "__main__":
+    unittest.main()
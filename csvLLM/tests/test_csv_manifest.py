@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+import os
+import sys
+import time
+import shutil
+import hashlib
+import sqlite3
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))) #set parent path
+
+from csv_manifest import load_csv_incremental, MANIFEST_TABLE
+from parallel_ingest import ingest_directory
+
+class TestCsvManifest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmpdir, "manifest.db")
+        self.csv_path = os.path.join(self.tmpdir, "data.csv")
+        self.writes = 0
+        self.write("id,value\n1,10\n2,20\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, text, mode="w", path=None):
+        path = path or self.csv_path
+        with open(path, mode) as f:
+            f.write(text)
+        # Make sure the mtime moves even on filesystems with coarse timestamps
+        self.writes += 1
+        mtime = time.time_ns() + self.writes * 10**9
+        os.utime(path, ns=(mtime, mtime))
+
+    def query(self, sql):
+        conn = sqlite3.connect(self.db_path)
+        rows = conn.execute(sql).fetchall()
+        conn.close()
+        return rows
+
+    def test_skip_append_and_changed(self):
+        self.assertEqual(load_csv_incremental(self.csv_path, self.db_path, "t")["action"], "load")
+        stats = load_csv_incremental(self.csv_path, self.db_path, "t")
+        self.assertEqual((stats["action"], stats["rows"], stats["total_rows"]), ("skip", 0, 2))
+        # Touched but not changed: still skipped, and the new mtime is remembered
+        self.write("id,value\n1,10\n2,20\n")
+        self.assertEqual(load_csv_incremental(self.csv_path, self.db_path, "t")["action"], "skip")
+        self.assertEqual(self.query(f"SELECT mtime_ns FROM {MANIFEST_TABLE}"), [(os.stat(self.csv_path).st_mtime_ns,)])
+        # Appended to: only the new rows are loaded
+        self.write("3,30\n4,40.5\n", mode="a")
+        stats = load_csv_incremental(self.csv_path, self.db_path, "t", chunk_rows=1)
+        self.assertEqual((stats["action"], stats["rows"], stats["total_rows"]), ("append", 2, 4))
+        self.assertEqual(stats["type_changes"], {"value": ["INTEGER", "REAL"]})
+        self.assertEqual(self.query("SELECT id, value FROM t ORDER BY id"), [(1, 10), (2, 20), (3, 30), (4, 40.5)])
+        # Rewritten in place: skipped unless asked to reload
+        self.write("id,value\n1,11\n2,20\n3,30\n4,40.5\n")
+        self.assertEqual(load_csv_incremental(self.csv_path, self.db_path, "t")["action"], "changed")
+        self.assertEqual(self.query("SELECT COUNT(*) FROM t"), [(4,)])
+        stats = load_csv_incremental(self.csv_path, self.db_path, "t", on_change="reload")
+        self.assertEqual((stats["rows"], stats["total_rows"]), (4, 4))
+        self.assertEqual(load_csv_incremental(self.csv_path, self.db_path, "t")["action"], "skip")
+        # Each table has its own manifest entry
+        self.assertEqual(load_csv_incremental(self.csv_path, self.db_path, "other")["action"], "load")
+
+    def test_partial_last_line(self):
+        # Snapshotted while a row was being written: the cut-off row waits for the next run
+        self.write("id,name\n1,alice\n2,bo")
+        stats = load_csv_incremental(self.csv_path, self.db_path, "t")
+        self.assertEqual((stats["rows"], stats["pending_bytes"]), (1, 4))
+        self.write("b\n3,carol\n", mode="a")
+        stats = load_csv_incremental(self.csv_path, self.db_path, "t")
+        self.assertEqual((stats["action"], stats["rows"], stats["pending_bytes"]), ("append", 2, 0))
+        self.assertEqual(self.query("SELECT id, name FROM t ORDER BY id"), [(1, "alice"), (2, "bob"), (3, "carol")])
+        # A manifest entry that ends mid-line (recorded before this check existed) can't be appended to
+        head = b"id,name\n1,al"
+        conn = sqlite3.connect(self.db_path)
+        conn.execute(f"UPDATE {MANIFEST_TABLE} SET size = ?, sha256 = ?", (len(head), hashlib.sha256(head).hexdigest()))
+        conn.commit()
+        conn.close()
+        self.assertEqual(load_csv_incremental(self.csv_path, self.db_path, "t")["action"], "changed")
+
+    def test_dropped_table_and_failed_load(self):
+        load_csv_incremental(self.csv_path, self.db_path, "t")
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("DROP TABLE t")
+        conn.commit()
+        conn.close()
+        # The table was dropped, so the whole file goes in again
+        self.assertEqual(load_csv_incremental(self.csv_path, self.db_path, "t")["action"], "load")
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("CREATE UNIQUE INDEX t_id ON t (id)")
+        conn.execute("INSERT INTO t VALUES (3, 0)")
+        conn.commit()
+        conn.close()
+        self.write("3,30\n", mode="a")
+        with self.assertRaises(sqlite3.IntegrityError):
+            load_csv_incremental(self.csv_path, self.db_path, "t")
+        # The failed tail load left the manifest as it was, so it is retried next time
+        self.assertEqual(self.query(f"SELECT rows FROM {MANIFEST_TABLE}"), [(2,)])
+        self.assertEqual(self.query("SELECT COUNT(*) FROM t"), [(3,)])
+
+    def test_directory_rerun(self):
+        drops = os.path.join(self.tmpdir, "drops")
+        os.mkdir(drops)
+        for day in range(3):
+            self.write(f"id,value\n{day},{day * 10}\n", path=os.path.join(drops, f"day{day}.csv"))
+        self.assertEqual(ingest_directory(drops, self.db_path, "t", workers=1)["rows"], 3)
+        self.write("7,70\n8,80\n", mode="a", path=os.path.join(drops, "day1.csv"))
+        stats = ingest_directory(drops, self.db_path, "t", workers=1)
+        statuses = sorted((os.path.basename(info["file"]), info["status"], info["rows"]) for info in stats["files"])
+        self.assertEqual(statuses, [("day0.csv", "skipped", 0), ("day1.csv", "loaded", 2), ("day2.csv", "skipped", 0)])
+        self.assertEqual([row[0] for row in self.query("SELECT id FROM t ORDER BY id")], [0, 1, 2, 7, 8])
+        self.assertEqual(ingest_directory(drops, self.db_path, "t", workers=1)["rows"], 0)
+        # A touched file is skipped and its new mtime stored, so the next run needn't hash it
+        os.utime(os.path.join(drops, "day0.csv"), ns=(time.time_ns(), time.time_ns() + 100 * 10**9))
+        ingest_directory(drops, self.db_path, "t", workers=1)
+        mtime_ns = os.stat(os.path.join(drops, "day0.csv")).st_mtime_ns
+        self.assertEqual(self.query(f"SELECT mtime_ns FROM {MANIFEST_TABLE} WHERE path LIKE '%day0.csv'"), [(mtime_ns,)])
+
+if __name__ == "__main__":
+    unittest.main()
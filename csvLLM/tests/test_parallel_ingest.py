@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+import os
+import sys
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))) #set parent path
+
+from parallel_ingest import ingest_directory
+
+class TestParallelIngest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.drops = os.path.join(self.tmpdir, "drops")
+        os.mkdir(self.drops)
+        self.db_path = os.path.join(self.tmpdir, "ingest.db")
+        self.write("day1.csv", "id,value\n1,10\n2,20\n3,30\n")
+        self.write("day2.csv", "id,value,note\n4,40,new column\n5,,\n")
+        self.write("day3.csv", "id,value\n6,6.5\n7,70\n")
+        self.write("broken.csv", "")  # no header at all
+        self.write("notes.txt", "not a csv")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, name, text):
+        with open(os.path.join(self.drops, name), "w") as f:
+            f.write(text)
+
+    def query(self, sql):
+        conn = sqlite3.connect(self.db_path)
+        rows = conn.execute(sql).fetchall()
+        conn.close()
+        return rows
+
+    def check_loaded(self, stats):
+        self.assertEqual((stats["rows"], stats["failed"], len(stats["files"])), (7, 1, 4))
+        failed = [info for info in stats["files"] if info["status"] == "failed"]
+        self.assertEqual(os.path.basename(failed[0]["file"]), "broken.csv")
+        self.assertIn("EmptyDataError", failed[0]["error"])
+        self.assertEqual(self.query("SELECT id, value, note FROM data_table ORDER BY id"),
+                         [(1, 10.0, None), (2, 20.0, None), (3, 30.0, None), (4, 40.0, "new column"),
+                          (5, None, None), (6, 6.5, None), (7, 70.0, None)])
+        types = {row[1]: row[2] for row in self.query("PRAGMA table_info(data_table)")}
+        self.assertEqual(types["value"], "REAL")
+
+    def test_process_pool(self):
+        progress = []
+        stats = ingest_directory(self.drops, self.db_path, "data_table", workers=2,
+                                 progress=lambda done, total, info: progress.append((done, total, info["status"])))
+        self.check_loaded(stats)
+        self.assertEqual([(done, total) for done, total, _ in progress], [(1, 4), (2, 4), (3, 4), (4, 4)])
+
+    def test_single_worker(self):
+        self.check_loaded(ingest_directory(self.drops, self.db_path, "data_table", workers=1, chunk_rows=1))
+
+    def test_failed_merge_leaves_no_rows(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("CREATE TABLE data_table (id INTEGER, value INTEGER)")
+        conn.execute("CREATE UNIQUE INDEX data_table_id ON data_table (id)")
+        conn.execute("INSERT INTO data_table VALUES (7, 0)")
+        conn.commit()
+        conn.close()
+        stats = ingest_directory(self.drops, self.db_path, "data_table", workers=1)
+        errors = {os.path.basename(info["file"]): info["error"] for info in stats["files"] if info["error"]}
+        self.assertEqual(sorted(errors), ["broken.csv", "day3.csv"])
+        self.assertIn("IntegrityError", errors["day3.csv"])
+        # Nothing from day3.csv (id 6 and 7) is kept, and its promotion to REAL was rolled back
+        self.assertEqual([row[0] for row in self.query("SELECT id FROM data_table ORDER BY id")], [1, 2, 3, 4, 5, 7])
+        self.assertEqual({row[1]: row[2] for row in self.query("PRAGMA table_info(data_table)")}["value"], "INTEGER")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+import os
+import sys
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))) #set parent path
+
+import sqlite_pool
+from sqlite_pool import get_connection, transaction, configure, close_all, DEFAULT_PRAGMAS, WAL_PRAGMAS
+
+class TestSqlitePool(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmpdir, "pool.db")
+
+    def tearDown(self):
+        configure(**DEFAULT_PRAGMAS)  # also closes everything this test opened
+        shutil.rmtree(self.tmpdir)
+
+    def test_connection_is_reused_per_thread(self):
+        conn = get_connection(self.db_path)
+        self.assertIs(get_connection(os.path.join(self.tmpdir, ".", "pool.db")), conn)
+        other = []
+        thread = threading.Thread(target=lambda: other.append(get_connection(self.db_path)))
+        thread.start()
+        thread.join()
+        self.assertIsNot(other[0], conn)
+
+    def test_pragmas(self):
+        conn = get_connection(self.db_path)
+        self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "delete")
+        self.assertEqual(conn.execute("PRAGMA cache_size").fetchone()[0], -64000)
+        self.assertEqual(conn.execute("PRAGMA temp_store").fetchone()[0], 2)  # MEMORY
+        configure(cache_size=-2000, **WAL_PRAGMAS)
+        conn = get_connection(self.db_path)
+        self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        self.assertEqual(conn.execute("PRAGMA synchronous").fetchone()[0], 1)  # NORMAL
+        self.assertEqual(conn.execute("PRAGMA cache_size").fetchone()[0], -2000)
+        with self.assertRaises(ValueError):
+            configure(page_size=8192)
+
+    def test_reopens_deleted_or_closed(self):
+        conn = get_connection(self.db_path)
+        conn.execute("CREATE TABLE old (x)")
+        close_all()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.db_path + suffix):
+                os.remove(self.db_path + suffix)
+        raw = sqlite3.connect(self.db_path)
+        raw.execute("CREATE TABLE new (x)")
+        raw.commit()
+        raw.close()
+        conn = get_connection(self.db_path)
+        tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master")]
+        self.assertEqual(tables, ["new"])
+        # A pooled connection that is replaced on disk is reopened too
+        os.remove(self.db_path)
+        self.assertEqual(get_connection(self.db_path).execute("SELECT count(*) FROM sqlite_master").fetchone()[0], 0)
+        # ... and so is one that somebody closed
+        opened = sqlite_pool.stats["opened"]
+        get_connection(self.db_path).close()
+        get_connection(self.db_path).execute("SELECT 1")
+        self.assertEqual(sqlite_pool.stats["opened"], opened + 1)
+
+    def test_transaction(self):
+        conn = get_connection(self.db_path)
+        conn.execute("CREATE TABLE t (x INTEGER UNIQUE)")
+        with transaction(conn):
+            conn.executemany("INSERT INTO t VALUES (?)", [(1,), (2,)])
+            with self.assertRaises(sqlite3.IntegrityError):
+                with transaction(conn):  # nested -> savepoint, only this part is undone
+                    conn.execute("INSERT INTO t VALUES (3)")
+                    conn.execute("INSERT INTO t VALUES (1)")
+        with self.assertRaises(sqlite3.IntegrityError):
+            with transaction(conn, immediate=True):
+                conn.execute("INSERT INTO t VALUES (4)")
+                conn.execute("INSERT INTO t VALUES (2)")
+        self.assertFalse(conn.in_transaction)
+        self.assertEqual([row[0] for row in conn.execute("SELECT x FROM t ORDER BY x")], [1, 2])
+
+if __name__ == "__main__":
+    unittest.main()
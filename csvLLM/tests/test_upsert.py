@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+import os
+import sys
+import time
+import shutil
+import sqlite3
+import tempfile
+import unittest
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))) #set parent path
+
+from csv_loader import stream_csv_to_sqlite, detect_key
+from csv_manifest import load_csv_incremental
+from parallel_ingest import ingest_directory
+
+class TestUpsert(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmpdir, "upsert.db")
+        self.csv_path = os.path.join(self.tmpdir, "snapshot.csv")
+        self.writes = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, text, path=None):
+        path = path or self.csv_path
+        with open(path, "w") as f:
+            f.write(text)
+        self.writes += 1  # move the mtime so the manifest sees the rewrite
+        mtime = time.time_ns() + self.writes * 10**9
+        os.utime(path, ns=(mtime, mtime))
+
+    def query(self, sql):
+        conn = sqlite3.connect(self.db_path)
+        rows = conn.execute(sql).fetchall()
+        conn.close()
+        return rows
+
+    def test_detect_key(self):
+        sample = pd.DataFrame({"name": ["a", "b"], "score": [1.5, 2.5], "customer_id": [1, 2], "id": [1, 1]})
+        self.assertEqual(detect_key(sample, "customers"), ["customer_id"])
+        self.assertEqual(detect_key(sample[["score", "name"]]), ["name"])  # floats make bad keys
+        self.assertIsNone(detect_key(pd.DataFrame({"x": [1, 1]})))
+
+    def test_snapshot_refreshes_table(self):
+        self.write("name,customer_id,city\nann,1,Oslo\nbob,2,Rome\n")
+        stats = stream_csv_to_sqlite(self.csv_path, self.db_path, "customers", if_exists="upsert")
+        self.assertEqual((stats["key"], stats["inserted"], stats["updated"]), (["customer_id"], 2, 0))
+        self.write("name,customer_id,city\nann,1,Bergen\ncid,3,Lyon\nbob,2,Rome\n")
+        stats = stream_csv_to_sqlite(self.csv_path, self.db_path, "customers", chunk_rows=1, if_exists="upsert")
+        self.assertEqual((stats["rows"], stats["chunks"], stats["inserted"], stats["updated"]), (3, 3, 1, 2))
+        self.assertEqual(self.query("SELECT name, customer_id, city FROM customers ORDER BY customer_id"),
+                         [("ann", 1, "Bergen"), ("bob", 2, "Rome"), ("cid", 3, "Lyon")])
+        self.assertEqual(self.query("SELECT name FROM sqlite_master WHERE type='index'"), [("customers__key",)])
+
+    def test_existing_key_and_type_promotion(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("CREATE TABLE t (region TEXT, day INTEGER, amount INTEGER, PRIMARY KEY (region, day))")
+        conn.execute("INSERT INTO t VALUES ('north', 1, 5)")
+        conn.commit()
+        conn.close()
+        self.write("region,day,amount\nnorth,1,7\nnorth,2,8\nsouth,1,9.5\n")
+        stats = stream_csv_to_sqlite(self.csv_path, self.db_path, "t", chunk_rows=2, if_exists="upsert")
+        self.assertEqual((stats["key"], stats["inserted"], stats["updated"]), (["region", "day"], 2, 1))
+        self.assertEqual(stats["type_changes"], {"amount": ["INTEGER", "REAL"]})
+        self.assertEqual(self.query("SELECT * FROM t ORDER BY region, day"),
+                         [("north", 1, 7.0), ("north", 2, 8.0), ("south", 1, 9.5)])
+        self.assertEqual(self.query("SELECT name FROM sqlite_master WHERE type='index' AND sql IS NOT NULL"), [])
+
+    def test_upsert_across_type_promotion(self):
+        # The rebuilt table must keep the inline UNIQUE constraint the upsert targets
+        self.write("code,v\na,5\nb,6\nc,7.5\n")
+        for engine in ("pandas", "csv"):
+            table = f"t_{engine}"
+            conn = sqlite3.connect(self.db_path)
+            conn.execute(f"CREATE TABLE {table} (code TEXT UNIQUE, v INTEGER)")
+            conn.execute(f"INSERT INTO {table} VALUES ('a', 1)")
+            conn.commit()
+            conn.close()
+            stats = stream_csv_to_sqlite(self.csv_path, self.db_path, table, chunk_rows=2, sample_rows=2,
+                                         if_exists="upsert", engine=engine)
+            self.assertEqual((stats["key"], stats["inserted"], stats["updated"]), (["code"], 2, 1))
+            self.assertEqual(stats["type_changes"], {"v": ["INTEGER", "REAL"]})
+            self.assertEqual(self.query(f"SELECT * FROM {table} ORDER BY code"), [("a", 5.0), ("b", 6.0), ("c", 7.5)])
+        # Same through a directory ingest, where the type changes while merging a staged file
+        drops = os.path.join(self.tmpdir, "drops")
+        os.mkdir(drops)
+        self.write("code,v\na,5\nb,6\n", os.path.join(drops, "a.csv"))
+        self.write("code,v\nb,6.5\nc,7.5\n", os.path.join(drops, "b.csv"))
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("CREATE TABLE t_dir (code TEXT UNIQUE, v INTEGER)")
+        conn.commit()
+        conn.close()
+        for name in ("a.csv", "b.csv"):
+            stats = ingest_directory(drops, self.db_path, "t_dir", workers=1, pattern=name, if_exists="upsert")
+            self.assertEqual(stats["failed"], 0)
+        self.assertEqual(stats["files"][0]["type_changes"], {"v": ["INTEGER", "REAL"]})
+        self.assertEqual(self.query("SELECT * FROM t_dir ORDER BY code"), [("a", 5.0), ("b", 6.5), ("c", 7.5)])
+
+    def test_errors_leave_table_unchanged(self):
+        self.write("a,b\n1,x\n1,x\n")
+        with self.assertRaises(ValueError):
+            stream_csv_to_sqlite(self.csv_path, self.db_path, "t", if_exists="upsert")
+        with self.assertRaises(ValueError):
+            stream_csv_to_sqlite(self.csv_path, self.db_path, "t", if_exists="upsert", key="missing")
+        stream_csv_to_sqlite(self.csv_path, self.db_path, "t")  # plain append keeps the duplicate
+        with self.assertRaises(sqlite3.IntegrityError):
+            stream_csv_to_sqlite(self.csv_path, self.db_path, "t", if_exists="upsert", key="a")
+        self.assertEqual(self.query("SELECT * FROM t"), [(1, "x"), (1, "x")])
+        self.assertEqual(self.query("SELECT name FROM sqlite_master WHERE type='index'"), [])
+
+    def test_rewritten_snapshot_is_upserted_again(self):
+        self.write("id,value\n1,10\n2,20\n")
+        self.assertEqual(load_csv_incremental(self.csv_path, self.db_path, "t", if_exists="upsert")["action"], "load")
+        self.write("id,value\n1,11\n3,30\n")
+        stats = load_csv_incremental(self.csv_path, self.db_path, "t", if_exists="upsert")
+        self.assertEqual((stats["action"], stats["inserted"], stats["updated"]), ("changed", 1, 1))
+        self.assertEqual(self.query("SELECT id, value FROM t ORDER BY id"), [(1, 11), (2, 20), (3, 30)])
+        self.assertEqual(load_csv_incremental(self.csv_path, self.db_path, "t", if_exists="upsert")["action"], "skip")
+
+    def test_directory_upsert(self):
+        drops = os.path.join(self.tmpdir, "drops")
+        os.mkdir(drops)
+        self.write("id,value\n1,10\n2,20\n", os.path.join(drops, "a.csv"))
+        self.write("id,value,note\n2,21,fixed\n3,30,\n", os.path.join(drops, "b.csv"))
+        stats = ingest_directory(drops, self.db_path, "t", workers=1, if_exists="upsert")
+        self.assertEqual((stats["rows"], stats["failed"]), (4, 0))
+        self.assertEqual(self.query("SELECT id, value, note FROM t ORDER BY id"),
+                         [(1, 10, None), (2, 21, "fixed"), (3, 30, None)])
+        self.write("id,value\n1,12\n", os.path.join(drops, "a.csv"))
+        stats = ingest_directory(drops, self.db_path, "t", workers=1, if_exists="upsert")
+        self.assertEqual(sorted(info["status"] for info in stats["files"]), ["loaded", "skipped"])
+        self.assertEqual(self.query("SELECT id, value FROM t ORDER BY id"), [(1, 12), (2, 21), (3, 30)])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,196 @@
+"""
+bench_matching.py
+
+Benchmarks for the GPS matching pipeline in gpsProgram/scripts.
+
+For each size n it writes a synthetic CSV with n query points and n reference
+points (random lat/lon, with a header row) and times every phase of a request:
+
+    csv_parse      csv_points.read_column_pairs, both column pairs in one pass
+    convert        as_point_array + to_unit_vectors for both sets
+    match          the nearest point for every query point, once per engine:
+                   loop (the original double loop, small sizes only), matrix,
+                   index (build + query), index_query (prebuilt index),
+                   prefilter, and parallel when there is more than one core
+    format         the "Output Array" string and the knn "Output Matches" JSON
+    end_to_end     process_data.run_request on the CSV, without the disk cache
+
+Each timing is the best of --repeat runs. Results are written as JSON together
+with a log-log scaling exponent per phase (about 1 for linear, 2 for n*m work),
+and --compare flags timings that got slower than a previous results file.
+
+Usage:
+    python3 benchmarks/bench_matching.py --sizes 1000 4000 16000 --output results.json
+    python3 benchmarks/bench_matching.py --compare results.json
+"""
+
+import io
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import platform
+import tempfile
+import contextlib
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts'))) #set scripts path
+
+from match_engine import d, as_point_array, to_unit_vectors
+from csv_points import read_column_pairs
+from spatial_index import SphereIndex
+from prefilter import prefilter_nearest
+from parallel_match import parallel_query
+from process_data import two_arrays, query_matches, format_matches, run_request, parse_args
+
+DEFAULT_SIZES = [1000, 4000, 16000]
+
+# The original double loop is only timed up to this size (it is O(n*m) in pure Python)
+LOOP_MAX_SIZE = 1000
+
+# --compare ignores differences smaller than this, they are mostly timer noise
+MIN_REGRESSION_SECONDS = 0.01
+
+def loop_two_arrays(arr1, arr2):
+    # The matcher as it was before match_engine, kept as the baseline
+    closest = []
+    for p in arr1:
+        best = float('inf')
+        best_point = None
+        for q in arr2:
+            dist = d(p[0], p[1], q[0], q[1])
+            if dist < best:
+                best = dist
+                best_point = q
+        closest.append(best_point)
+    return closest
+
+def write_csv(path, n, rng):
+    # Columns: name, query lat, query lon, reference lat, reference lon
+    with open(path, "w") as f:
+        f.write("name,lat,lon,ref_lat,ref_lon\n")
+        for i in range(n):
+            f.write(f"p{i},{rng.uniform(-90, 90)},{rng.uniform(-180, 180)},"
+                    f"{rng.uniform(-90, 90)},{rng.uniform(-180, 180)}\n")
+
+def best_time(fn, repeat):
+    best = math.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def bench_size(n, repeat, scratch, rng):
+    path = os.path.join(scratch, f"points_{n}.csv")
+    write_csv(path, n, rng)
+    (queries, refs), _ = read_column_pairs(path, [(1, 2), (3, 4)])
+    query_list = queries.tolist()
+    ref_list = refs.tolist()
+    index = SphereIndex().build(refs)
+
+    phases = [
+        ("csv_parse", None, lambda: read_column_pairs(path, [(1, 2), (3, 4)])),
+        ("convert", None, lambda: (to_unit_vectors(as_point_array(query_list)),
+                                   to_unit_vectors(as_point_array(ref_list)))),
+        ("match", "matrix", lambda: two_arrays(query_list, ref_list, "matrix")),
+        ("match", "index", lambda: two_arrays(query_list, ref_list, "index")),
+        ("match", "index_query", lambda: index.query(queries)),
+        ("match", "prefilter", lambda: prefilter_nearest(queries, refs)),
+    ]
+    if n <= LOOP_MAX_SIZE:
+        phases.append(("match", "loop", lambda: loop_two_arrays(query_list, ref_list)))
+    if (os.cpu_count() or 1) > 1:
+        phases.append(("match", "parallel", lambda: parallel_query(queries, refs, workers=0)))
+
+    nearest = two_arrays(query_list, ref_list, "matrix")
+    knn = query_matches(query_list, ref_list, "knn", k=3, index=lambda: index)
+    phases += [
+        ("format", "nearest", lambda: f"Output Array: {nearest}"),
+        ("format", "knn", lambda: f"Output Matches: {json.dumps(format_matches(query_list, ref_list, knn))}"),
+    ]
+
+    args = parse_args(["process_data.py", path, "1", "2", "3", "4", "", "", "true", "true", "--no-cache"])
+    def end_to_end():
+        with contextlib.redirect_stdout(io.StringIO()):
+            run_request(args)
+    phases.append(("end_to_end", None, end_to_end))
+
+    results = []
+    for phase, engine, fn in phases:
+        seconds = best_time(fn, repeat)
+        results.append({"size": n, "phase": phase, "engine": engine, "seconds": seconds})
+        print(f"n={n:<8} {key_of(results[-1]):<20} {seconds:10.4f} s", file=sys.stderr)
+    return results
+
+def scaling(results):
+    # Log-log slope of time against n for every phase measured at two or more sizes
+    series = {}
+    for r in results:
+        if r["seconds"] > 0:
+            series.setdefault(key_of(r), []).append((math.log(r["size"]), math.log(r["seconds"])))
+    slopes = {}
+    for key, points in series.items():
+        if len({x for x, _ in points}) > 1:
+            x = np.array([p[0] for p in points])
+            y = np.array([p[1] for p in points])
+            slopes[key] = float(np.polyfit(x, y, 1)[0])
+    return slopes
+
+def key_of(result):
+    return result["phase"] if result["engine"] is None else f"{result['phase']}/{result['engine']}"
+
+def compare(results, previous, tolerance):
+    # Timings more than `tolerance` times slower than the previous run
+    old = {(key_of(r), r["size"]): r["seconds"] for r in previous["results"]}
+    regressions = []
+    for r in results:
+        before = old.get((key_of(r), r["size"]))
+        if before is not None and r["seconds"] > before * tolerance and r["seconds"] - before > MIN_REGRESSION_SECONDS:
+            regressions.append({"phase": key_of(r), "size": r["size"], "before": before, "after": r["seconds"]})
+    return regressions
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Time each phase of the GPS matching pipeline.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="numbers of query (and reference) points")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per timing, the best is kept")
+    parser.add_argument("--seed", type=int, default=2024)
+    parser.add_argument("--output", default="bench_results.json", help="JSON results file")
+    parser.add_argument("--compare", help="previous results file to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=1.5,
+                        help="slowdown factor reported as a regression by --compare")
+    args = parser.parse_args(argv[1:])
+
+    rng = random.Random(args.seed)
+    results = []
+    with tempfile.TemporaryDirectory(prefix="bench_matching_") as scratch:
+        for n in sorted(args.sizes):
+            results += bench_size(n, args.repeat, scratch, rng)
+
+    report = {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "sizes": sorted(args.sizes),
+        "results": results,
+        "scaling": scaling(results),
+    }
+    regressions = []
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        report["regressions"] = regressions
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    for r in regressions:
+        print(f"REGRESSION {r['phase']} n={r['size']}: {r['before']:.4f} s -> {r['after']:.4f} s", file=sys.stderr)
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -2,6 +2,8 @@
 #d = 2rarcsin(sqrthavthet)
 #from resource https://en.wikipedia.org/wiki/Haversine_formula
 import math
+from match_engine import nearest_neighbors
+from spatial_index import SphereIndex
 
 def hav(thet):
   return math.sin(thet / 2) ** 2
@@ -18,19 +20,17 @@ lat1, long1 = 52.5200, 13.4050  # Berlin
 lat2, long2 = 48.8566, 2.3522   # Paris
 print(d(lat1, long1, lat2, long2))#testing w paris berlin
 
-def two_arrays(array1, array2):
-  size1 = len(array1)
-  size2 = len(array2)
-
-  array3= []#will hold the associated closest point from array2 to array1 point
-  for i in range(size1):
-    min = math.inf
-    for j in range(size2):
-      dist = d(array1[i][0], array1[i][1], array2[j][0], array2[j][1])
-      if dist < min:
-        min = dist
-        point = array2[j]
-    array3.append(point)
+def two_arrays(array1, array2, index=None):
+  # closest point from array2 for every point in array1, computed in batch by match_engine
+  # or by a prebuilt SphereIndex over array2 when one is passed in
+  if index is not None:
+    indices = index.query(array1, k=1)[0][:, 0]
+  else:
+    indices, _ = nearest_neighbors(array1, array2)
+  array3 = [array2[j] for j in indices]#will hold the associated closest point from array2 to array1 point
   return array1, array3
 
-print(two_arrays([[52.5200, 13.4050], [45.5, -122.7], [45, -122.7]], [[44, -123],[48.8566, 2.3522]]))
\ No newline at end of file
+print(two_arrays([[52.5200, 13.4050], [45.5, -122.7], [45, -122.7]], [[44, -123],[48.8566, 2.3522]]))
+
+airports = [[44, -123],[48.8566, 2.3522]]
+print(two_arrays([[52.5200, 13.4050], [45.5, -122.7]], airports, SphereIndex().build(airports)))#same matches through the KD-tree
@@ -0,0 +1,106 @@
+"""
+csv_points.py
+
+Single-pass reader that pulls any number of [lat, lon] column pairs out of a
+CSV file.
+
+Each needed column is converted with float() once per row, however many pairs
+use it, and values are appended to typed array('d') buffers (8 bytes per
+value, no per-point Python lists). Quoted numbers such as "24.2617" are
+handled by the csv module. A pair keeps a row only if both of its cells are
+finite numbers, the same rule the original read_csv_columns used (NaN and
+infinity are rejected too). A first row with a non-numeric cell in a pair's
+columns counts as that pair's header, not an invalid row; other pairs still
+read the row as data. iter_column_pairs() yields the points a block of
+rows at a time for files too large to hold in memory.
+"""
+
+import csv
+import math
+from array import array
+import numpy as np
+
+def iter_column_pairs(file_path, pairs, chunk_rows=65536):
+    """
+    Read several (col1, col2) pairs from a CSV file in one pass, a block of rows at a time.
+
+    Parameters:
+        file_path (str): Path to the CSV file.
+        pairs (list): 0-based (col1, col2) column index pairs.
+        chunk_rows (int): Rows read per block (None: the whole file is one block).
+
+    Yields:
+        (points, stats) for each block: points is a list with one (n, 2) float64 array per
+        pair holding that block's valid points; stats is a list with one dict per pair of
+        the running totals (rows read, header rows, short rows and invalid rows so far).
+    """
+    pairs = [(int(col1), int(col2)) for col1, col2 in pairs]
+    columns = sorted({col for pair in pairs for col in pair})
+    slot = {col: i for i, col in enumerate(columns)}
+    # Per pair: output buffer, slots of its two values in `values`, and the row width it needs
+    plan = [[array('d'), slot[col1], slot[col2], max(col1, col2) + 1] for col1, col2 in pairs]
+    short = [0] * len(pairs)
+    invalid = [0] * len(pairs)
+    counts = [0] * len(pairs)
+    values = [None] * len(columns)
+    header_rows = [0] * len(pairs)
+    rows = 0
+    isfinite = math.isfinite
+
+    def block():
+        points = []
+        for p, entry in enumerate(plan):
+            points.append(np.frombuffer(entry[0], dtype=np.float64).reshape(-1, 2))
+            counts[p] += len(points[-1])
+            entry[0] = array('d')
+        stats = [{"rows": rows, "header_rows": header_rows[p], "short_rows": short[p],
+                  "invalid_rows": invalid[p], "points": counts[p]} for p in range(len(pairs))]
+        return points, stats
+
+    with open(file_path, newline='') as csvfile:
+        for row in csv.reader(csvfile):
+            rows += 1
+            length = len(row)
+            for i, col in enumerate(columns):
+                if col < length:
+                    try:
+                        value = float(row[col])
+                        values[i] = value if isfinite(value) else None
+                    except ValueError:
+                        values[i] = None
+                else:
+                    values[i] = None
+            for p, (buffer, slot1, slot2, needed) in enumerate(plan):
+                if rows == 1 and any(values[slot] is None for slot, col in ((slot1, pairs[p][0]), (slot2, pairs[p][1]))
+                                     if col < length):
+                    header_rows[p] = 1  # decided per pair, from its own two columns
+                    continue
+                if length < needed:
+                    short[p] += 1
+                    continue
+                value1 = values[slot1]
+                value2 = values[slot2]
+                if value1 is None or value2 is None:
+                    invalid[p] += 1
+                    continue
+                buffer.append(value1)
+                buffer.append(value2)
+            if chunk_rows and rows % chunk_rows == 0:
+                yield block()
+    yield block()
+
+def read_column_pairs(file_path, pairs):
+    """
+    Read several (col1, col2) pairs from a CSV file in one pass.
+
+    Parameters:
+        file_path (str): Path to the CSV file.
+        pairs (list): 0-based (col1, col2) column index pairs.
+
+    Returns:
+        (points, stats): points is a list with one (n, 2) float64 array per pair;
+        stats is a list with one dict per pair holding the counts of rows read,
+        header rows, short rows (too few columns) and invalid rows (non-numeric cells).
+    """
+    # Without chunk_rows the whole file is a single block, so the points are not copied again
+    return list(iter_column_pairs(file_path, pairs, chunk_rows=None))[0]
@@ -0,0 +1,87 @@
+"""
+dataset_store.py
+
+In-memory cache of parsed CSV point sets and their spatial indexes, used by the
+long-lived worker in process_data.py so repeated requests on the same upload
+skip CSV parsing and index building. Entries are keyed by the file's absolute
+path, size and modification time plus the column pair, so a re-uploaded file
+is parsed again automatically. The least recently used entries are dropped
+once more than `max_entries` are held.
+"""
+
+import os
+from collections import OrderedDict
+from spatial_index import SphereIndex
+
+def build_index(file_path, col1, col2, points):
+    return SphereIndex().build(points)
+
+class DatasetStore:
+    def __init__(self, reader, max_entries=32, index_builder=build_index):
+        """
+        Parameters:
+            reader (callable): reader(file_path, pairs) -> (points, stats), one entry per
+                (col1, col2) pair, like csv_points.read_column_pairs.
+            max_entries (int): Number of parsed column pairs kept in memory.
+            index_builder (callable): index_builder(file_path, col1, col2, points) -> SphereIndex,
+                for example one that loads a tree saved by PointCache.
+        """
+        self.reader = reader
+        self.max_entries = max_entries
+        self.index_builder = index_builder
+        self._entries = OrderedDict()
+
+    def _key(self, file_path, col1, col2):
+        path = os.path.abspath(os.path.expanduser(file_path))
+        stat = os.stat(path)
+        return (path, stat.st_size, stat.st_mtime_ns, col1, col2)
+
+    def _entries_for(self, file_path, pairs):
+        keys = [self._key(file_path, col1, col2) for col1, col2 in pairs]
+        missing = [pair for pair, key in zip(pairs, keys) if key not in self._entries]
+        if missing:
+            # Every missing pair of the file is read in the same pass
+            points, stats = self.reader(keys[0][0], missing)
+            for (col1, col2), pair_points, pair_stats in zip(missing, points, stats):
+                key = self._key(file_path, col1, col2)
+                self._entries[key] = {"points": pair_points, "stats": pair_stats, "index": None}
+        entries = []
+        for key in keys:
+            self._entries.move_to_end(key)
+            entries.append(self._entries[key])
+        while len(self._entries) > max(self.max_entries, len(keys)):
+            self._entries.popitem(last=False)
+        return entries
+
+    def _entry(self, file_path, col1, col2):
+        return self._entries_for(file_path, [(col1, col2)])[0]
+
+    def points_many(self, file_path, pairs):
+        """
+        Return the [lat, lon] points for several column pairs, parsing the file at most once.
+        """
+        return [entry["points"] for entry in self._entries_for(file_path, pairs)]
+
+    def points(self, file_path, col1, col2):
+        """
+        Return the [lat, lon] points read from the given columns, parsing the file only once.
+        """
+        return self._entry(file_path, col1, col2)["points"]
+
+    def stats(self, file_path, col1, col2):
+        """
+        Return the reader's row counts (header, short and invalid rows) for the given columns.
+        """
+        return self._entry(file_path, col1, col2)["stats"]
+
+    def index(self, file_path, col1, col2):
+        """
+        Return a SphereIndex over the given columns, building it only once.
+        """
+        entry = self._entry(file_path, col1, col2)
+        if entry["index"] is None:
+            entry["index"] = self.index_builder(file_path, col1, col2, entry["points"])
+        return entry["index"]
+
+    def __len__(self):
+        return len(self._entries)
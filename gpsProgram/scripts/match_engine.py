@@ -0,0 +1,123 @@
+"""
+match_engine.py
+
+Batched nearest-point matching for the GPS program.
+
+Both point sets are converted once into contiguous float64 arrays of unit
+vectors, so the closest reference point for every query point can be found
+with a matrix product instead of a Python double loop (the cosine of the
+central angle between two unit vectors is their dot product). The query set
+is processed in chunks so the pairwise matrix never holds more than
+`chunk_pairs` values at once. Candidates within rounding distance of the best
+dot product are re-ranked with the scalar haversine `d()`, so the matches and
+distances are exactly the ones the original loop produced.
+"""
+
+import math
+import numpy as np
+
+EARTH_RADIUS_KM = 6371
+
+# Upper bound on the number of pairwise values held in memory per chunk (~32 MB).
+DEFAULT_CHUNK_PAIRS = 4_000_000
+
+# Dot products within this much of the row maximum are re-checked with d().
+DOT_TOLERANCE = 1e-14
+
+# havthet = havdelgam + cosgam1*cosgam2*havdellam
+# d = 2rarcsin(sqrthavthet)
+# from resource https://en.wikipedia.org/wiki/Haversine_formula
+def hav(thet):
+  return math.sin(thet / 2) ** 2
+
+def d(lat1, long1, lat2, long2, R = EARTH_RADIUS_KM):
+  lat1, long1, lat2, long2 = map(math.radians, [lat1, long1, lat2, long2])#needs to be radians
+  a = hav(abs(lat1-lat2)) + math.cos(lat1)*math.cos(lat2)*hav(abs(long1-long2))
+  return 2*R*math.asin(math.sqrt(a))
+
+def as_point_array(points):
+    """
+    Convert a sequence of [lat, lon] pairs (degrees) into a contiguous (n, 2) float64 array.
+    """
+    arr = np.ascontiguousarray(points, dtype=np.float64)
+    if arr.size == 0:
+        return arr.reshape(0, 2)
+    if arr.ndim != 2 or arr.shape[1] != 2:
+        raise ValueError("points must be a sequence of [lat, lon] pairs")
+    return arr
+
+def to_unit_vectors(points):
+    """
+    Convert [lat, lon] pairs in degrees into an (n, 3) array of unit vectors.
+    """
+    rad = np.radians(as_point_array(points))
+    lat = rad[:, 0]
+    lon = rad[:, 1]
+    cos_lat = np.cos(lat)
+    xyz = np.empty((len(rad), 3))
+    xyz[:, 0] = cos_lat * np.cos(lon)
+    xyz[:, 1] = cos_lat * np.sin(lon)
+    xyz[:, 2] = np.sin(lat)
+    return xyz
+
+def _refine(query, ref, rows, cols, indices, distances, offset):
+    """
+    Pick the closest candidate for each query row using the scalar d(), keeping the
+    first index on ties exactly like the original double loop.
+    """
+    row_starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+    row_ends = np.r_[row_starts[1:], len(rows)]
+    rows = rows.tolist()
+    cols = cols.tolist()
+    for start, end in zip(row_starts.tolist(), row_ends.tolist()):
+        i = rows[start] + offset
+        lat1, lon1 = query[i]
+        best = math.inf
+        best_j = -1
+        for j in cols[start:end]:
+            dist = d(lat1, lon1, ref[j][0], ref[j][1])
+            if dist < best:
+                best = dist
+                best_j = j
+        indices[i] = best_j
+        distances[i] = best
+
+def nearest_neighbors(arr1, arr2, chunk_pairs=DEFAULT_CHUNK_PAIRS):
+    """
+    For every point in arr1 find the closest point in arr2 by great-circle distance.
+
+    Returns:
+        (indices, distances): an int array of arr2 row indices and a float array of km.
+    """
+    query = as_point_array(arr1)
+    ref = as_point_array(arr2)
+    n = len(query)
+    m = len(ref)
+    indices = np.empty(n, dtype=np.intp)
+    distances = np.empty(n, dtype=np.float64)
+    if n == 0:
+        return indices, distances
+    if m == 0:
+        raise ValueError("reference set is empty")
+
+    query_xyz = to_unit_vectors(query)
+    ref_xyz_t = np.ascontiguousarray(to_unit_vectors(ref).T)
+    query_list = query.tolist()
+    ref_list = ref.tolist()
+    rows_per_chunk = max(1, chunk_pairs // m)
+    for start in range(0, n, rows_per_chunk):
+        dots = query_xyz[start:start + rows_per_chunk] @ ref_xyz_t
+        chunk_rows = np.arange(len(dots))
+        best = dots.argmax(axis=1)
+        best_dots = dots[chunk_rows, best]
+        threshold = best_dots - DOT_TOLERANCE
+        # Only rows with a runner-up inside the tolerance need every candidate listed.
+        dots[chunk_rows, best] = -np.inf
+        ambiguous = np.flatnonzero(dots.max(axis=1) >= threshold)
+        dots[chunk_rows, best] = best_dots
+        rows, cols = np.nonzero(dots[ambiguous] >= threshold[ambiguous, None])
+        rows = np.concatenate([np.setdiff1d(chunk_rows, ambiguous), ambiguous[rows]])
+        cols = np.concatenate([np.delete(best, ambiguous), cols])
+        order = np.argsort(rows, kind="stable")
+        _refine(query_list, ref_list, rows[order], cols[order], indices, distances, start)
+    return indices, distances
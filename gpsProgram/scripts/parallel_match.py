@@ -0,0 +1,132 @@
+"""
+parallel_match.py
+
+Multi-core nearest-neighbour matching for large query sets.
+
+The query points, the reference points (and, for the index engine, the
+SphereIndex arrays) and the output arrays are placed in
+multiprocessing.shared_memory blocks once. Pool workers attach to those blocks
+by name when they start, so no point data is pickled per worker or per shard.
+Each shard is a [start, end) range of query rows; a worker matches its range
+and writes the results straight into the shared output arrays, so results are
+in input order no matter which shard finishes first.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+from match_engine import as_point_array, nearest_neighbors
+from spatial_index import SphereIndex
+
+# Shards smaller than this are not worth a round trip to a worker
+MIN_SHARD_SIZE = 1024
+
+# Per-process state set up by _init_worker
+_state = {}
+
+def _attach(name):
+    # Attach without registering with the resource tracker; the parent owns and unlinks the block
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 has no track argument. Workers share the parent's tracker, where the
+        # extra registration is a no-op; unregistering here would drop the parent's entry.
+        return shared_memory.SharedMemory(name=name)
+
+def _init_worker(layout, engine, leaf_size):
+    blocks = {}
+    arrays = {}
+    for key, (name, shape, dtype) in layout.items():
+        blocks[key] = _attach(name)
+        arrays[key] = np.ndarray(shape, dtype=dtype, buffer=blocks[key].buf)
+    _state["blocks"] = blocks  # keep the mappings alive
+    _state["arrays"] = arrays
+    _state["engine"] = engine
+    if engine == "index":
+        _state["index"] = SphereIndex.from_arrays(arrays["refs"], arrays["perm"], arrays["nodes"],
+                                                  arrays["split_val"], leaf_size)
+
+def _match_shard(shard):
+    start, end, k = shard
+    arrays = _state["arrays"]
+    queries = arrays["queries"][start:end]
+    if _state["engine"] == "index":
+        indices, distances = _state["index"].query(queries, k=k)
+    else:
+        indices, distances = nearest_neighbors(queries, arrays["refs"])
+        indices = indices.reshape(-1, 1)
+        distances = distances.reshape(-1, 1)
+    arrays["out_indices"][start:end] = indices
+    arrays["out_distances"][start:end] = distances
+    return end - start
+
+def _share(blocks, layout, key, array):
+    # Copy an array into a new shared memory block; no view onto the block is kept,
+    # so it can be closed without "exported pointers exist" errors
+    array = np.ascontiguousarray(array)
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    blocks[key] = shm
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+    layout[key] = (shm.name, array.shape, array.dtype.str)
+
+def _read_shared(blocks, layout, key):
+    _, shape, dtype = layout[key]
+    return np.ndarray(shape, dtype=dtype, buffer=blocks[key].buf).copy()
+
+def parallel_query(arr1, arr2, workers=None, engine="matrix", k=1, index=None, shard_size=None):
+    """
+    Match arr1 against arr2 on a pool of worker processes.
+
+    Parameters:
+        workers (int): Number of processes (default: os.cpu_count()).
+        engine (str): "matrix" (match_engine, k must be 1) or "index" (SphereIndex).
+        k (int): Neighbours per query point for the index engine.
+        index (SphereIndex): Optional prebuilt index over arr2 to share with the workers.
+        shard_size (int): Query rows per task (default: about four tasks per worker).
+
+    Returns:
+        (indices, distances): (n, k) arrays in the same row order as arr1.
+    """
+    queries = as_point_array(arr1)
+    refs = as_point_array(arr2)
+    n = len(queries)
+    if engine == "matrix" and k != 1:
+        raise ValueError("the matrix engine only finds the single nearest point")
+    if len(refs) == 0 and n:
+        raise ValueError("reference set is empty")
+    k = min(k, len(refs))
+    workers = workers or os.cpu_count() or 1
+    if shard_size is None:
+        shard_size = max(MIN_SHARD_SIZE, -(-n // (workers * 4)))
+    if n == 0:
+        return np.empty((0, k), dtype=np.intp), np.empty((0, k), dtype=np.float64)
+
+    blocks = {}
+    layout = {}
+    leaf_size = None
+    try:
+        _share(blocks, layout, "queries", queries)
+        if engine == "index":
+            tree = index if index is not None else SphereIndex().build(refs)
+            points, perm, nodes, split_val, leaf_size = tree.to_arrays()
+            _share(blocks, layout, "refs", points)
+            _share(blocks, layout, "perm", perm)
+            _share(blocks, layout, "nodes", nodes)
+            _share(blocks, layout, "split_val", split_val)
+        else:
+            _share(blocks, layout, "refs", refs)
+        _share(blocks, layout, "out_indices", np.zeros((n, k), dtype=np.intp))
+        _share(blocks, layout, "out_distances", np.zeros((n, k), dtype=np.float64))
+
+        shards = [(start, min(start + shard_size, n), k) for start in range(0, n, shard_size)]
+        with ProcessPoolExecutor(max_workers=min(workers, len(shards)), initializer=_init_worker,
+                                 initargs=(layout, engine, leaf_size)) as pool:
+            done = sum(pool.map(_match_shard, shards))
+        if done != n:
+            raise RuntimeError(f"workers matched {done} of {n} points")
+        return _read_shared(blocks, layout, "out_indices"), _read_shared(blocks, layout, "out_distances")
+    finally:
+        for shm in blocks.values():
+            shm.close()
+            shm.unlink()
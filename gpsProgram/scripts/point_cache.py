@@ -0,0 +1,193 @@
+"""
+point_cache.py
+
+On-disk cache of parsed CSV coordinate columns.
+
+A file is parsed once per column pair. The points are saved as a float64 .npy
+array and memory-mapped on later reads, so repeated process_data.py runs skip
+csv.reader and per-cell float() entirely. Entries are keyed by the SHA-256 of
+the file contents plus the column indices, so a renamed copy of a file reuses
+the same entry and an edited file gets a new one. A SphereIndex built over an
+entry is saved beside it.
+
+Layout:
+    <cache_dir>/hashes.json                   path -> [size, mtime_ns, sha256]
+    <cache_dir>/<sha256>_<col1>_<col2>/points.npy
+    <cache_dir>/<sha256>_<col1>_<col2>/index_*.npy
+
+Eviction is least-recently-used: every read touches the entry directory's
+mtime, and once the cache holds more than `max_bytes` the stalest entries are
+removed.
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import numpy as np
+from spatial_index import SphereIndex
+
+DEFAULT_CACHE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'cache'))
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+class PointCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._hashes = None
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _hashes_path(self):
+        return os.path.join(self.cache_dir, "hashes.json")
+
+    def _load_hashes(self):
+        if self._hashes is None:
+            try:
+                with open(self._hashes_path()) as f:
+                    self._hashes = json.load(f)
+            except (OSError, ValueError):
+                self._hashes = {}
+        return self._hashes
+
+    def _write_atomic(self, path, write):
+        # Write to a temporary file and rename it so concurrent readers never see half a file
+        fd, tmp_path = tempfile.mkstemp(prefix=".", dir=self.cache_dir)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def file_hash(self, file_path):
+        """
+        Return the SHA-256 of a file, reusing the stored value while its size and mtime are unchanged.
+        """
+        path = os.path.abspath(os.path.expanduser(file_path))
+        stat = os.stat(path)
+        hashes = self._load_hashes()
+        known = hashes.get(path)
+        if known and known[0] == stat.st_size and known[1] == stat.st_mtime_ns:
+            return known[2]
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        hashes[path] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+        self._write_atomic(self._hashes_path(), lambda f: f.write(json.dumps(hashes).encode()))
+        return hashes[path][2]
+
+    def entry_dir(self, file_path, col1, col2):
+        """
+        Directory holding the cached arrays for one file and column pair.
+        """
+        return os.path.join(self.cache_dir, f"{self.file_hash(file_path)}_{col1}_{col2}")
+
+    def _touch(self, entry):
+        try:
+            os.utime(entry)
+        except OSError:
+            pass
+
+    def points_many(self, file_path, pairs, reader):
+        """
+        Return (points, stats) for several column pairs; points are read-only memory maps.
+
+        Parameters:
+            reader (callable): reader(file_path, pairs) -> (points, stats), called once
+                with every pair that is not cached yet.
+        """
+        entries = [self.entry_dir(file_path, col1, col2) for col1, col2 in pairs]
+        # Touch everything this call needs before anything is evicted, so cached pairs look fresh
+        for entry in entries:
+            self._touch(entry)
+        points = [None] * len(pairs)
+        stats = [None] * len(pairs)
+        for i, entry in enumerate(entries):
+            points[i], stats[i] = self._read_entry(entry)
+        # Entries without stats.json (older layout) or removed underneath us count as misses
+        missing = [i for i, pair_points in enumerate(points) if pair_points is None]
+        if missing:
+            read_points, read_stats = reader(file_path, [pairs[i] for i in missing])
+            for i, pair_points, pair_stats in zip(missing, read_points, read_stats):
+                pair_points = np.asarray(pair_points, dtype=np.float64).reshape(-1, 2)
+                os.makedirs(entries[i], exist_ok=True)
+                self._write_atomic(os.path.join(entries[i], "stats.json"),
+                                   lambda f: f.write(json.dumps(pair_stats).encode()))
+                self._write_atomic(os.path.join(entries[i], "points.npy"), lambda f: np.save(f, pair_points))
+                points[i] = np.load(os.path.join(entries[i], "points.npy"), mmap_mode="r")
+                stats[i] = pair_stats
+            self.evict(keep=set(entries))
+        return points, stats
+
+    def _read_entry(self, entry):
+        # (points, stats) of a complete entry, or (None, None) if either file is missing
+        try:
+            with open(os.path.join(entry, "stats.json")) as f:
+                stats = json.load(f)
+            return np.load(os.path.join(entry, "points.npy"), mmap_mode="r"), stats
+        except (OSError, ValueError):
+            return None, None
+
+    def points(self, file_path, col1, col2, reader):
+        """
+        Return the (n, 2) float64 points for one column pair as a read-only memory map.
+        """
+        return self.points_many(file_path, [(col1, col2)], reader)[0][0]
+
+    def index(self, file_path, col1, col2, reader):
+        """
+        Return a SphereIndex for a column pair, loading the saved tree when there is one.
+        """
+        entry = self.entry_dir(file_path, col1, col2)
+        if os.path.exists(os.path.join(entry, "index_leaf_size.npy")):
+            self._touch(entry)
+            return SphereIndex.load(entry)
+        index = SphereIndex().build(self.points(file_path, col1, col2, reader))
+        # Save into a scratch directory first; the leaf-size file is written last and marks completion
+        scratch = tempfile.mkdtemp(prefix=".", dir=self.cache_dir)
+        try:
+            index.save(scratch)
+            for name in sorted(os.listdir(scratch), key=lambda n: n == "index_leaf_size.npy"):
+                os.replace(os.path.join(scratch, name), os.path.join(entry, name))
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+        self.evict(keep={entry})
+        return index
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.startswith(".") or not os.path.isdir(path):
+                continue
+            try:
+                size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+                entries.append((os.path.getmtime(path), size, path))
+            except OSError:
+                continue  # removed by another process while listing
+        return entries
+
+    def size_bytes(self):
+        """
+        Total size of all cached entries in bytes.
+        """
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self, keep=()):
+        """
+        Remove least recently used entries until the cache fits in max_bytes.
+        Entries in `keep` (the ones the caller is using) are never removed.
+        """
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path in keep:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
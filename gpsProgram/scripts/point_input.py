@@ -0,0 +1,86 @@
+"""
+point_input.py
+
+Bulk [lat, lon] input for process_data.py, read from a file or stdin instead of
+a command-line argument (argv is limited to a few hundred KB and went through
+ast.literal_eval plus a str() -> float() round trip per number).
+
+Accepted formats, detected automatically:
+    JSON array    [[lat, lon], [lat, lon], ...]   or   [{"lat": ..., "lon": ...}, ...]
+    NDJSON        one [lat, lon] or {"lat": ..., "lon": ...} per line
+
+Text is parsed with the json module's C parser (NDJSON is joined into one
+array and parsed in a single call) and validated with numpy: records that are
+not a pair of finite numbers are dropped and counted, the same way the CSV
+reader counts invalid rows.
+"""
+
+import sys
+import json
+import numpy as np
+
+def points_from_records(records):
+    """
+    Validate parsed records into an (n, 2) float64 array.
+
+    Returns:
+        (points, stats): the valid points in input order, and {"records", "points", "invalid"}.
+    """
+    if not isinstance(records, list):
+        raise ValueError("points must be a list of [lat, lon] pairs")
+    try:
+        # Fast path: every record is already a pair of numbers
+        points = np.array(records, dtype=np.float64)
+        if points.ndim != 2 or points.shape[1] != 2:
+            raise ValueError
+        # numpy reads JSON true/false as 1/0, so those records are rejected here
+        valid = np.array([type(lat) is not bool and type(lon) is not bool for lat, lon in records], dtype=bool)
+    except (ValueError, TypeError):
+        points = np.empty((len(records), 2))
+        valid = np.zeros(len(records), dtype=bool)
+        for i, record in enumerate(records):
+            if isinstance(record, dict):
+                record = [record.get("lat"), record.get("lon")]
+            if not isinstance(record, list) or len(record) != 2 or any(isinstance(v, bool) for v in record):
+                continue
+            try:
+                points[i] = record
+                valid[i] = True
+            except (ValueError, TypeError):
+                continue
+    valid &= np.isfinite(points).all(axis=1)
+    points = np.ascontiguousarray(points[valid]) if not valid.all() else points
+    return points.reshape(-1, 2), {"records": len(records), "points": len(points), "invalid": len(records) - len(points)}
+
+def parse_points(text):
+    """
+    Parse a JSON array or NDJSON text of points; see points_from_records for the result.
+    """
+    text = text.strip()
+    if not text:
+        return points_from_records([])
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError as e:
+        if not e.msg.startswith("Extra data"):
+            raise ValueError(f"invalid JSON points: {e}") from None
+        # NDJSON: one record per line, parsed as a single array
+        lines = [line for line in text.splitlines() if line.strip()]
+        try:
+            data = json.loads("[" + ",".join(lines) + "]")
+        except json.JSONDecodeError as e:
+            raise ValueError(f"invalid NDJSON points: {e}") from None
+    else:
+        # A one-line NDJSON file is a single record, not an array of them
+        if isinstance(data, dict) or (isinstance(data, list) and data and not isinstance(data[0], (list, dict))):
+            data = [data]
+    return points_from_records(data)
+
+def load_points(source, stdin=None):
+    """
+    Read points from a file path, or from stdin when `source` is "-".
+    """
+    if source == "-":
+        return parse_points((stdin or sys.stdin).read())
+    with open(source) as f:
+        return parse_points(f.read())
@@ -0,0 +1,191 @@
+"""
+prefilter.py
+
+Approximate-then-exact nearest-point matching.
+
+The reference points are sorted once by latitude band (bands sized from the
+points' spread so a band-high square holds a few of them), then by longitude.
+The points of one band within a longitude interval are then a single slice,
+found with searchsorted. For each chunk of query points:
+  1. The references in a small square around the query point (doubled while
+     it is empty) give a seed, and the exact haversine distance D to it is an
+     upper bound on the true nearest distance. So the true nearest point lies
+     inside the lat/lon box
+         |dlat| <= D / R
+         |dlon| <= asin(sin(D / R) / cos(lat))   (any dlon if a pole is that close)
+  2. Only the slices of the bands the box spans are visited, so pairs outside
+     it are never built; the references in them are checked against the exact
+     box, which rejects the few left over without computing a haversine.
+  3. The haversine is computed only for the pairs inside the box, and the
+     candidates within rounding distance of the best are re-ranked with the
+     scalar `d()`, so the result is exactly the one the original loop gives.
+
+The box is widened by a small relative margin so rounding never rejects the
+true nearest point. The returned counts show how much the box prunes.
+"""
+
+import math
+import numpy as np
+from match_engine import as_point_array, _refine, EARTH_RADIUS_KM, DEFAULT_CHUNK_PAIRS
+
+# Relative slack on the search box and on the haversine re-rank threshold.
+BOX_MARGIN = 1e-9
+RANK_TOLERANCE = 1e-12
+
+# Bands are sized for about this many reference points per band-high square (if they were
+# spread evenly), and never lower than MIN_BAND radians (see _Bands).
+POINTS_PER_CELL = 2
+MIN_BAND = 1e-4
+# Sort keys are band * KEY_STRIDE + longitude offset (< 2 pi + a band), so each band is one key range.
+KEY_STRIDE = 8.0
+
+def _haversine(lat1, lon1, cos_lat1, lat2, lon2, cos_lat2):
+    # Vectorized haversine in km; inputs in radians
+    a = np.sin((lat1 - lat2) / 2) ** 2 + cos_lat1 * cos_lat2 * np.sin((lon1 - lon2) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+def _ranks(counts):
+    # 0, 1, ..., counts[i] - 1 for every i, concatenated
+    ends = np.cumsum(counts)
+    return np.arange(ends[-1] if len(ends) else 0) - np.repeat(ends - counts, counts)
+
+class _Bands:
+    # The reference points sorted by latitude band (counted from the southernmost point), then
+    # by longitude (offset from the westernmost one), so the points of one band within a
+    # longitude interval are one slice of the sorted keys. MIN_BAND keeps the keys' rounding
+    # (~1e-11 rad) far below the search box margin.
+    def __init__(self, lat, lon):
+        m = len(lat)
+        self.lat0 = lat.min()
+        self.lon0 = lon.min()
+        lat_extent = lat.max() - self.lat0
+        lon_extent = lon.max() - self.lon0
+        band = math.sqrt(max(lat_extent, MIN_BAND) * max(lon_extent, MIN_BAND) / m)
+        # max(...) / m keeps points spread along a line from all landing in one band
+        self.height = max(MIN_BAND, math.sqrt(POINTS_PER_CELL) * max(band, max(lat_extent, lon_extent) / m))
+        self.count = int(lat_extent // self.height) + 1
+        keys = self.band(lat) * KEY_STRIDE + (lon - self.lon0)
+        self.order = np.argsort(keys, kind="stable")
+        self.keys = keys[self.order]
+
+    def band(self, lat):
+        return np.clip(np.floor((lat - self.lat0) / self.height), 0, self.count - 1)
+
+    def pairs(self, rows, band_lo, band_hi, lon_lo, lon_hi):
+        """
+        (row, reference index) for every reference in the bands [band_lo, band_hi] whose
+        longitude offset from the westernmost reference is in [lon_lo, lon_hi] (all inclusive).
+        """
+        band_lo = np.maximum(band_lo, 0)
+        band_hi = np.minimum(band_hi, self.count - 1)
+        bands = np.maximum(band_hi - band_lo + 1, 0).astype(np.intp)
+        owner = np.repeat(np.arange(len(rows)), bands)
+        band = (band_lo[owner] + _ranks(bands)) * KEY_STRIDE
+        # Clipped to the band, so an interval never reaches into the next one
+        starts = np.searchsorted(self.keys, band + np.maximum(lon_lo[owner], 0), "left")
+        ends = np.searchsorted(self.keys, band + np.minimum(lon_hi[owner], 2 * math.pi), "right")
+        counts = np.maximum(ends - starts, 0)
+        refs = self.order[np.repeat(starts, counts) + _ranks(counts)]
+        return rows[np.repeat(owner, counts)], refs
+
+    def lon_intervals(self, lon, max_dlon):
+        """
+        The box's longitudes [lon - max_dlon, lon + max_dlon] as three disjoint intervals of
+        offsets: the interval itself and shifted by -/+ 360 degrees, since it can wrap around
+        the antimeridian (an empty interval has lo > hi).
+        """
+        full = max_dlon >= math.pi
+        low = np.where(full, 0, np.mod(lon - max_dlon - self.lon0, 2 * math.pi))
+        high = np.where(full, 2 * math.pi, low + 2 * max_dlon)
+        # Shorter than a full turn, so the shifted copies can't overlap the interval itself
+        return [(low, high), (np.where(full, 1, 0), high - 2 * math.pi),
+                (low + 2 * math.pi, np.where(full, 0, high + 2 * math.pi))]
+
+def prefilter_nearest(arr1, arr2, chunk_pairs=DEFAULT_CHUNK_PAIRS):
+    """
+    For every point in arr1 find the closest point in arr2, computing the haversine
+    only for pairs that survive the bounding-box prefilter.
+
+    Returns:
+        (indices, distances, stats): arr2 row indices, distances in km, and a dict of
+        counts: "pairs" (all query/reference pairs), "box_rejected" (skipped by the box),
+        "haversine" (exact distances computed) and "refined" (scalar d() re-checks).
+    """
+    query = as_point_array(arr1)
+    ref = as_point_array(arr2)
+    n = len(query)
+    m = len(ref)
+    indices = np.empty(n, dtype=np.intp)
+    distances = np.empty(n, dtype=np.float64)
+    stats = {"pairs": n * m, "box_rejected": 0, "haversine": 0, "refined": 0}
+    if n == 0:
+        return indices, distances, stats
+    if m == 0:
+        raise ValueError("reference set is empty")
+
+    query_rad = np.radians(query)
+    ref_rad = np.radians(ref)
+    ref_lat = ref_rad[:, 0]
+    ref_lon = ref_rad[:, 1]
+    ref_cos = np.cos(ref_lat)
+    query_list = query.tolist()
+    ref_list = ref.tolist()
+    bands = _Bands(ref_lat, ref_lon)
+    # A query point can visit every reference (one far from all of them), so chunks are sized for that
+    rows_per_chunk = max(1, chunk_pairs // m)
+
+    for start in range(0, n, rows_per_chunk):
+        lat = query_rad[start:start + rows_per_chunk, 0]
+        lon = query_rad[start:start + rows_per_chunk, 1]
+        cos_lat = np.cos(lat)
+        chunk_rows = np.arange(len(lat))
+
+        # 1. Seed: the closest reference in the square around the point, doubled until it holds one
+        band = bands.band(lat)
+        offset = lon - bands.lon0
+        seeds = []
+        lonely = chunk_rows
+        reach = 1
+        while len(lonely):
+            width = reach * bands.height
+            seeds.append(bands.pairs(lonely, band[lonely] - reach, band[lonely] + reach,
+                                     offset[lonely] - width, offset[lonely] + width))
+            lonely = np.setdiff1d(lonely, seeds[-1][0])  # empty once the square covers every reference
+            reach *= 2
+        rows = np.concatenate([rows for rows, _ in seeds])
+        cols = np.concatenate([cols for _, cols in seeds])
+        seed_dist = np.full(len(lat), np.inf)
+        np.minimum.at(seed_dist, rows, _haversine(lat[rows], lon[rows], cos_lat[rows],
+                                                  ref_lat[cols], ref_lon[cols], ref_cos[cols]))
+
+        # 2. Search box from the exact distance to the seed
+        delta = seed_dist / EARTH_RADIUS_KM * (1 + BOX_MARGIN) + BOX_MARGIN
+        # The box spans every longitude when the search cap reaches a pole
+        ratio = np.sin(np.minimum(delta, math.pi / 2)) / np.maximum(cos_lat, 1e-300)
+        wraps_pole = (delta >= math.pi / 2 - np.abs(lat)) | (ratio >= 1)
+        max_dlon = np.where(wraps_pole, math.pi, np.arcsin(np.minimum(ratio, 1.0)) * (1 + BOX_MARGIN) + BOX_MARGIN)
+        # Only the references in the box's bands and longitudes are visited, then checked against the box
+        band_lo = bands.band(lat - delta)
+        band_hi = bands.band(lat + delta)
+        candidates = [bands.pairs(chunk_rows, band_lo, band_hi, lon_lo, lon_hi)
+                      for lon_lo, lon_hi in bands.lon_intervals(lon, max_dlon)]
+        rows = np.concatenate([rows for rows, _ in candidates])
+        cols = np.concatenate([cols for _, cols in candidates])
+        dlon = np.abs(lon[rows] - ref_lon[cols]) % (2 * math.pi)
+        np.minimum(dlon, 2 * math.pi - dlon, out=dlon)
+        inside = (np.abs(lat[rows] - ref_lat[cols]) <= delta[rows]) & (dlon <= max_dlon[rows])
+        rows = rows[inside]
+        cols = cols[inside]
+
+        # 3. Exact distances for the survivors, then d() on the near-ties
+        dist = _haversine(lat[rows], lon[rows], cos_lat[rows], ref_lat[cols], ref_lon[cols], ref_cos[cols])
+        best = np.full(len(lat), np.inf)
+        np.minimum.at(best, rows, dist)
+        keep = dist <= best[rows] * (1 + RANK_TOLERANCE) + RANK_TOLERANCE
+        stats["box_rejected"] += len(lat) * m - len(rows)
+        stats["haversine"] += len(rows)
+        stats["refined"] += int(keep.sum())
+        # _refine expects the candidates grouped by row, each row's columns ascending (for ties)
+        order = np.lexsort((cols[keep], rows[keep]))
+        _refine(query_list, ref_list, rows[keep][order], cols[keep][order], indices, distances, start)
+    return indices, distances, stats
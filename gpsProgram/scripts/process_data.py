@@ -2,12 +2,49 @@ import sys
 import csv
 import os
 import ast
-import math
+import io
+import json
+import time
+import struct
+import cProfile
+import argparse
+import contextlib
+import numpy as np
+from match_engine import nearest_neighbors
+from spatial_index import SphereIndex
+from csv_points import read_column_pairs
+from dataset_store import DatasetStore
+from point_cache import PointCache, DEFAULT_CACHE_DIR, DEFAULT_MAX_BYTES
+from parallel_match import parallel_query, MIN_SHARD_SIZE
+from prefilter import prefilter_nearest
+from point_input import load_points, points_from_records
+from simplify import SIMPLIFY_METHODS, simplify_points, expand_matches
+from rtree_index import RTreeIndex, import_csv, is_current
+from result_cache import ResultCache, fingerprint, file_version, DEFAULT_MEMORY_BYTES
+from timing import PhaseTimer
 
-# Get arguments passed from Node.js
-file = sys.argv[1]
-useCSV1 = sys.argv[8] == 'true'  # Convert string 'true'/'false' to boolean
-useCSV2 = sys.argv[9] == 'true'  # Convert string 'true'/'false' to boolean
+# With this many reference points a KD-tree beats the matrix engine, even counting its build
+AUTO_INDEX_MIN_REFS = 20000
+# A worker request's ref_db may be rebuilt (overwritten) in place, so it must live in this directory
+DEFAULT_REF_DB_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'uploads'))
+
+QUERY_MODES = ["nearest", "knn", "radius"]
+
+# text: the original "Output Array: [...]" lines; jsonl: a header line, then one JSON
+# record per query point; binary: a 16-byte header, then fixed-size records
+OUTPUT_FORMATS = ["text", "jsonl", "binary"]
+
+# Structured output is written this many query points at a time, so readers get results incrementally
+OUTPUT_BLOCK = 10000
+
+# Binary output: magic, format version, number of query points, records per query point
+BINARY_HEADER = struct.Struct("<4sIII")
+BINARY_MAGIC = b"GPSM"
+BINARY_RECORD = np.dtype([("index", "<i8"), ("distance_km", "<f8")])
+
+# Fields of an /execute request, in the order server.js passes them on the command line
+REQUEST_FIELDS = ["file", "columnIndex1A", "columnIndex2A", "columnIndex1B", "columnIndex2B",
+                  "manualEntry1", "manualEntry2", "useCSV1", "useCSV2"]
 
 # Function to check if a value is a valid real number
 def is_real_number(value):
@@ -19,82 +56,653 @@ def is_real_number(value):
 
 # Function to read CSV and get the specified columns
 def read_csv_columns(file_path, col1, col2):
-    data = []
-    path = os.path.abspath(os.path.expanduser(file))
-    # if not os.path.exists(path):
-    #     print(f"File does not exist: {path}")
-    #     sys.exit(1)
-    with open(path, newline='') as csvfile:
-        reader = csv.reader(csvfile)
-        for row in reader:
-            if len(row) > max(col1, col2):  # Check if row has enough columns
-                value1 = row[col1]
-                value2 = row[col2]
-                # Only add the pair if both values are valid real numbers
-                if is_real_number(value1) and is_real_number(value2):
-                    data.append([float(value1), float(value2)])
-    return data
-
-# Populate arrays with error checking
-array1 = []
-array2 = []
-
-# If use CSV is enabled for Array 1
-if useCSV1:
-    columnIndex1A = int(sys.argv[2])  # 1-based index, convert to 0-based
-    columnIndex2A = int(sys.argv[3])  # 1-based index, convert to 0-based
-    array1 = read_csv_columns(file, columnIndex1A, columnIndex2A)
-else:
+    path = os.path.abspath(os.path.expanduser(file_path))
+    points, _ = read_column_pairs(path, [(col1, col2)])
+    return points[0].tolist()
+
+# Function to parse a manually entered array like "[[lat,lon],[lat,lon]]"
+def parse_manual_entry(text, label):
+    points = []
     # Check if the manual entry is valid (skip empty or invalid numbers)
     try:
-        manualEntry1 = ast.literal_eval(sys.argv[6])  # Convert string to list
-        if isinstance(manualEntry1, list):  # Ensure it's a list
-            for entry in manualEntry1:
+        try:
+            manualEntry = json.loads(text)  # Much faster than literal_eval for JSON-style lists
+        except ValueError:
+            manualEntry = ast.literal_eval(text)  # Convert string to list
+        if isinstance(manualEntry, list):  # Ensure it's a list
+            for entry in manualEntry:
                 if isinstance(entry, list) and all(is_real_number(str(num)) for num in entry):
-                    array1.append([float(num) for num in entry])
+                    points.append([float(num) for num in entry])
     except (ValueError, SyntaxError):
-        print("Invalid format for manual entry 1")
-
-# If use CSV is enabled for Array 2
-if useCSV2:
-    columnIndex1B = int(sys.argv[4])  # 1-based index, convert to 0-based
-    columnIndex2B = int(sys.argv[5])  # 1-based index, convert to 0-based
-    array2 = read_csv_columns(file, columnIndex1B, columnIndex2B)
-else:
-    # Check if the manual entry is valid (skip empty or invalid numbers)
+        print(f"Invalid format for manual entry {label}")
+    return points
+
+def use_parallel(arr1, workers):
+    # workers: 1 runs in this process, 0 means one process per CPU core.
+    # Small query sets stay serial since starting the pool costs more than it saves.
+    return workers != 1 and len(arr1) > MIN_SHARD_SIZE
+
+def nearest_matches(arr1, arr2, engine="auto", index=None, workers=1, stats=None):
+    # (indices, distances) of the closest arr2 point for every point in arr1
+    # engine: "matrix" (match_engine), "index" (SphereIndex KD-tree), "prefilter"
+    # (bounding-box prefilter, see prefilter.py) or "auto"
+    # index: optional callable returning a prebuilt SphereIndex over arr2
+    # stats: optional dict that receives the prefilter's rejection counts
+    if engine == "auto":
+        engine = "index" if len(arr2) >= AUTO_INDEX_MIN_REFS else "matrix"
+    if engine == "prefilter":
+        indices, distances, counts = prefilter_nearest(arr1, arr2)
+        if stats is not None:
+            stats.update(counts)
+        return indices, distances
+    if use_parallel(arr1, workers):
+        tree = index() if engine == "index" and index is not None else None
+        indices, distances = parallel_query(arr1, arr2, workers, engine, index=tree)
+        return indices[:, 0], distances[:, 0]
+    if engine == "index":
+        tree = index() if index is not None else SphereIndex().build(arr2)
+        indices, distances = tree.query(arr1, k=1)
+        return indices[:, 0], distances[:, 0]
+    return nearest_neighbors(arr1, arr2)
+
+def nearest_indices(arr1, arr2, engine="auto", index=None, workers=1, stats=None):
+    return nearest_matches(arr1, arr2, engine, index, workers, stats)[0]
+
+def two_arrays(arr1, arr2, engine="auto", index=None, workers=1, stats=None):
+  # closest point from arr2 for every point in arr1
+  if len(arr1) == 0:
+    return []
+  indices = nearest_indices(arr1, arr2, engine, index, workers, stats)
+  return points_at(arr2, indices)
+
+def points_at(arr2, indices):
+  # the arr2 points at the given indices, as lists for printing
+  if isinstance(arr2, np.ndarray):
+    return arr2[indices].tolist()
+  return [arr2[j] for j in indices]
+
+def simplified_matches(arr1, arr2, method, tolerance_m, engine="auto", index=None, workers=1, stats=None):
+    # Match only the points of arr1 kept by simplify.py, then give every dropped point the
+    # closer of its kept neighbours' matches. Returns (indices, distances, kept indices).
+    points = np.asarray(arr1, dtype=np.float64).reshape(-1, 2)
+    kept = simplify_points(points, method, tolerance_m)
+    if len(kept) == 0:
+        return np.empty(0, dtype=np.intp), np.empty(0), kept
+    indices, distances = nearest_matches(points[kept], arr2, engine, index, workers, stats)
+    indices, distances = expand_matches(points, arr2, kept, indices, distances)
+    return indices, distances, kept
+
+def query_matches(arr1, arr2, mode, k=1, radius_km=None, index=None, workers=1):
+    # k nearest ("knn") or all within radius_km ("radius") reference points for every point in arr1,
+    # as one (indices, distances) pair per query point, closest first
+    tree = index() if index is not None else SphereIndex().build(arr2)
+    if mode == "knn":
+        if k < 1:
+            raise ValueError("k must be at least 1")
+        if use_parallel(arr1, workers):
+            indices, distances = parallel_query(arr1, arr2, workers, "index", k, index=tree)
+        else:
+            indices, distances = tree.query(arr1, k=k)
+        return list(zip(indices, distances))
+    if mode == "radius":
+        if radius_km is None or radius_km < 0:
+            raise ValueError("radius mode needs a non-negative radius_km")
+        return tree.query_radius(arr1, radius_km)
+    raise ValueError(f"unknown query mode: {mode}")
+
+def pack_matches(matches):
+    # knn/radius matches as flat index and distance arrays plus row offsets, the form ResultCache stores
+    counts = [len(indices) for indices, _ in matches]
+    return {"indices": np.concatenate([np.empty(0, dtype=np.intp)] + [indices for indices, _ in matches]),
+            "distances": np.concatenate([np.empty(0)] + [distances for _, distances in matches]),
+            "offsets": np.concatenate([[0], np.cumsum(counts, dtype=np.intp)])}
+
+def unpack_matches(packed):
+    offsets = packed["offsets"].tolist()
+    return [(packed["indices"][start:stop], packed["distances"][start:stop])
+            for start, stop in zip(offsets[:-1], offsets[1:])]
+
+def result_key(args, array1, array2, ref_version):
+    # ResultCache key of a request: the options that change its matches, the reference set
+    # (the version of the file it came from, or its points when they came with the request)
+    # and the query points
+    options = {"mode": args.mode}
+    if args.mode == "nearest" and getattr(args, "simplify", "none") != "none":
+        options.update(simplify=args.simplify, tolerance_m=args.tolerance_m)
+    elif args.mode == "knn":
+        options["k"] = args.k
+    elif args.mode == "radius":
+        options["radius_km"] = args.radius_km
+    return fingerprint(options, array2 if ref_version is None else ref_version, array1)
+
+def cached_result(results, key, compute):
+    # compute() -> dict of arrays, answered from the ResultCache when the same request was seen before
+    if results is None:
+        return compute()
+    value = results.get(key)
+    if value is None:
+        value = compute()
+        results.put(key, value)
+    return value
+
+def format_matches(arr1, arr2, matches):
+    # Structured result: each query point with its matched reference indices, points and distances
+    return [{"point": point,
+             "matches": [{"index": j, "point": arr2[j], "distance_km": dist}
+                         for j, dist in zip(indices.tolist(), distances.tolist())]}
+            for point, (indices, distances) in zip(arr1, matches)]
+
+def jsonl_blocks(header, arr2, indices=None, distances=None, matches=None):
+    # Header line, then per query point {"i", "index", "point", "distance_km"} (nearest mode)
+    # or {"i", "matches": [...]} (knn and radius modes), OUTPUT_BLOCK records per chunk
+    yield json.dumps(header) + "\n"
+    points = as_list(arr2)
+    n = len(indices) if matches is None else len(matches)
+    for start in range(0, n, OUTPUT_BLOCK):
+        stop = min(start + OUTPUT_BLOCK, n)
+        if matches is None:
+            # float repr is valid JSON for the finite values here, and much faster than json.dumps
+            lines = [f'{{"i": {i}, "index": {j}, "point": [{points[j][0]!r}, {points[j][1]!r}], "distance_km": {dist!r}}}\n'
+                     for i, j, dist in zip(range(start, stop), indices[start:stop].tolist(),
+                                           distances[start:stop].tolist())]
+        else:
+            lines = [json.dumps({"i": i, "matches": [{"index": j, "point": points[j], "distance_km": dist}
+                                                     for j, dist in zip(row_indices.tolist(), row_distances.tolist())]}) + "\n"
+                     for i, (row_indices, row_distances) in zip(range(start, stop), matches[start:stop])]
+        yield "".join(lines)
+
+def binary_blocks(n, k, indices=None, distances=None, matches=None):
+    # BINARY_HEADER, then n * k BINARY_RECORD (int64 index, float64 distance), closest first per query point
+    yield BINARY_HEADER.pack(BINARY_MAGIC, 1, n, k)
+    for start in range(0, n, OUTPUT_BLOCK):
+        stop = min(start + OUTPUT_BLOCK, n)
+        block = np.empty((stop - start, k), dtype=BINARY_RECORD)
+        if matches is None:
+            block["index"][:, 0] = indices[start:stop]
+            block["distance_km"][:, 0] = distances[start:stop]
+        else:
+            for row, (row_indices, row_distances) in enumerate(matches[start:stop]):
+                block["index"][row] = row_indices
+                block["distance_km"][row] = row_distances
+        yield block.tobytes()
+
+def as_list(points):
+    # Cached points are memory-mapped arrays; print them exactly like parsed lists
+    return points.tolist() if isinstance(points, (np.ndarray, RTreeIndex)) else points
+
+def detect_coordinate_columns(file_path):
+    # Find the (latitude, longitude) column pair from header names like "lat"/"latitude" and "lon"/"lng"/"longitude"
+    with open(file_path, newline='') as csvfile:
+        header = [name.strip().lower() for name in next(csv.reader(csvfile), [])]
+    lat = [i for i, name in enumerate(header) if name in ("lat", "latitude")]
+    lon = [i for i, name in enumerate(header) if name in ("lon", "lng", "long", "longitude")]
+    return [(lat[0], lon[0])] if lat and lon else []
+
+def make_store(args):
+    # Parsed columns come from the on-disk PointCache unless --no-cache is given
+    if args.no_cache:
+        return DatasetStore(read_column_pairs)
+    cache = PointCache(args.cache_dir, args.cache_max_mb * 1024 * 1024)
+    return DatasetStore(lambda f, pairs: cache.points_many(f, pairs, read_column_pairs),
+                        index_builder=lambda f, c1, c2, points: cache.index(f, c1, c2, read_column_pairs))
+
+def parse_reference(spec):
+    # --ref "[NAME=]FILE:LAT_COL:LON_COL" -> {"name", "file", "columns"}; an empty FILE means the request's file
+    name = None
+    if "=" in spec and ":" not in spec.split("=", 1)[0]:
+        name, spec = spec.split("=", 1)
+    parts = spec.rsplit(":", 2)
+    if len(parts) != 3:
+        raise argparse.ArgumentTypeError(f"expected [NAME=]FILE:LAT_COL:LON_COL, got {spec!r}")
+    return reference_from_request({"name": name, "file": parts[0], "columns": parts[1:]})
+
+def reference_from_request(ref):
+    # Validate one "references" entry of a request: {"name"?, "file"?, "columns": [lat_col, lon_col]}
     try:
-        manualEntry2 = ast.literal_eval(sys.argv[7])  # Convert string to list
-        if isinstance(manualEntry2, list):  # Ensure it's a list
-            for entry in manualEntry2:
-                if isinstance(entry, list) and all(is_real_number(str(num)) for num in entry):
-                    array2.append([float(num) for num in entry])
-    except (ValueError, SyntaxError):
-        print("Invalid format for manual entry 1")
-
-# Output the arrays as strings for the frontend
-print(f"Array 1 input: {array1}")
-print(f"Array 2 input: {array2}")
-
-def hav(thet):
-  return math.sin(thet / 2) ** 2
-
-def d(lat1, long1, lat2, long2, R = 6371):
-  lat1, long1, lat2, long2 = map(math.radians, [lat1, long1, lat2, long2])#needs to be radians
-  a = hav(abs(lat1-lat2)) + math.cos(lat1)*math.cos(lat2)*hav(abs(long1-long2))
-  return 2*R*math.asin(math.sqrt(a))
-
-def two_arrays(arr1, arr2):
-  size1 = len(arr1)
-  size2 = len(arr2)
-  array3 = []#will hold the associated closest point from array2 to array1 point
-  for i in range(size1):
-    min = math.inf
-    for j in range(size2):
-      dist = d(arr1[i][0], arr1[i][1], arr2[j][0], arr2[j][1])
-      if dist < min:
-        min = dist
-        point = array2[j]
-    array3.append(point)
-  return array3
-
-print(f"Output Array: {two_arrays(array1, array2)}")
\ No newline at end of file
+        columns = [int(col) for col in ref["columns"]]
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("a reference needs \"columns\": [lat_col, lon_col]") from None
+    if len(columns) != 2:
+        raise ValueError("a reference needs \"columns\": [lat_col, lon_col]")
+    file = ref.get("file") or None
+    name = ref.get("name") or (f"{os.path.basename(file)}:" if file else "") + f"{columns[0]}:{columns[1]}"
+    return {"name": str(name), "file": file, "columns": columns}
+
+def make_result_cache(args, memory=True):
+    # Finished results are kept in memory (--result-cache-mb, used by the worker) and,
+    # with --result-cache-dir, on disk for every process; None when both are off
+    max_bytes = args.result_cache_mb * 1024 * 1024 if memory else 0
+    if max_bytes == 0 and not args.result_cache_dir:
+        return None
+    return ResultCache(max_bytes, args.result_cache_dir, args.cache_max_mb * 1024 * 1024)
+
+def parse_args(argv):
+    # Positional arguments are the ones server.js passes, in the same order
+    parser = argparse.ArgumentParser(description="Match every point of array 1 to its closest point in array 2.")
+    for name in REQUEST_FIELDS:
+        parser.add_argument(name, nargs="?")
+    parser.add_argument("--engine", choices=["auto", "matrix", "index", "prefilter"], default="auto",
+                        help="nearest-neighbour engine (default: index for large reference sets); "
+                             "prefilter also reports how many pairs its bounding box rejected")
+    parser.add_argument("--mode", choices=QUERY_MODES, default="nearest",
+                        help="nearest: closest point only; knn: k nearest with distances; "
+                             "radius: every point within --radius-km")
+    parser.add_argument("--k", type=int, default=1, help="number of neighbours in knn mode")
+    parser.add_argument("--radius-km", type=float, help="search radius in radius mode")
+    parser.add_argument("--input1", metavar="FILE",
+                        help="read array 1 from a JSON or NDJSON file ('-' for stdin) instead of the arguments")
+    parser.add_argument("--input2", metavar="FILE",
+                        help="read array 2 from a JSON or NDJSON file ('-' for stdin) instead of the arguments")
+    parser.add_argument("--output", choices=OUTPUT_FORMATS, default="text",
+                        help="text: Output Array/Output Matches lines; jsonl: one JSON record per query point; "
+                             "binary: int64 index + float64 distance records (nearest and knn mode)")
+    parser.add_argument("--simplify", choices=SIMPLIFY_METHODS, default="none",
+                        help="nearest mode: match only the points of array 1 kept by Douglas-Peucker (dp) or "
+                             "distance decimation, and give dropped points a kept neighbour's match")
+    parser.add_argument("--tolerance-m", type=float, default=10.0,
+                        help="simplification tolerance in metres (default: 10)")
+    parser.add_argument("--ref", dest="references", action="append", type=parse_reference,
+                        metavar="[NAME=]FILE:LAT:LON",
+                        help="also match against this column pair (FILE may be left empty for the request's file); "
+                             "repeat for several reference sets, each file is parsed once")
+    parser.add_argument("--ref-db", metavar="DB",
+                        help="take array 2 from a SQLite R*Tree database (see rtree_index.py) shared by every "
+                             "process; with useCSV2 it is imported from the CSV first when missing or outdated")
+    parser.add_argument("--ref-db-dir", default=DEFAULT_REF_DB_DIR,
+                        help="worker mode: directory a request's ref_db must be inside (default: uploads/)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="processes used to match large inputs in nearest and knn mode (0: one per CPU core)")
+    parser.add_argument("--timing", action="store_true",
+                        help="print wall/CPU time and peak RSS per phase as a JSON line on stderr")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="run the request under cProfile and save the stats to FILE (see python3 -m pstats)")
+    parser.add_argument("--worker", action="store_true",
+                        help="serve newline-delimited JSON requests on stdin/stdout instead of one request")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR,
+                        help="directory for parsed CSV columns and saved indexes")
+    parser.add_argument("--cache-max-mb", type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024),
+                        help="size limit of the on-disk cache; least recently used entries are evicted")
+    parser.add_argument("--no-cache", action="store_true", help="always parse the CSV file")
+    parser.add_argument("--result-cache-mb", type=int, default=DEFAULT_MEMORY_BYTES // (1024 * 1024),
+                        help="memory the worker keeps finished results in, to answer repeated requests (0: off)")
+    parser.add_argument("--result-cache-dir",
+                        help="also keep finished results in this directory, shared by every process")
+    args = parser.parse_args(argv[1:])
+    if args.input1 == "-" and args.input2 == "-":
+        parser.error("only one of --input1 and --input2 can read stdin")
+    if not args.worker and args.useCSV2 is None and not (args.input1 and (args.input2 or args.references)):
+        parser.error("the nine positional arguments are required unless --worker or --input1 and "
+                     "--input2 (or --ref) are given")
+    if any(ref["file"] is None for ref in args.references or []) and not args.file:
+        parser.error("--ref needs a FILE when no file argument is given")
+    if args.tolerance_m < 0:
+        parser.error("--tolerance-m must not be negative")
+    if args.result_cache_mb < 0:
+        parser.error("--result-cache-mb must be 0 or more")
+    if args.workers < 0:
+        parser.error("--workers must be 0 or more")
+    if args.mode == "radius" and args.radius_km is None:
+        parser.error("--mode radius requires --radius-km")
+    if args.profile and args.worker:
+        parser.error("--profile covers a single request, send \"timing\": true to the worker instead")
+    if args.output == "binary" and args.worker:
+        parser.error("the worker replies in JSON, use --output text or jsonl")
+    if args.output == "binary" and args.mode == "radius":
+        parser.error("--output binary needs a fixed number of matches, use nearest or knn mode")
+    if args.ref_db and args.input2:
+        parser.error("--ref-db replaces array 2, it cannot be combined with --input2")
+    return args
+
+def bulk_points(args, which):
+    # Array `which` from inline "points1"/"points2" records (worker requests) or an
+    # --input1/--input2 file; (None, None) when the array comes from the usual arguments
+    records = getattr(args, f"points{which}", None)
+    if records is not None:
+        return points_from_records(records)
+    source = getattr(args, f"input{which}", None)
+    if source:
+        return load_points(source)
+    return None, None
+
+def open_ref_db(args, useCSV2):
+    # The RTreeIndex at --ref-db, imported from the request's second column pair first if the
+    # database is missing or was built from another version of the file. Returns (index, stats).
+    imported = False
+    if useCSV2:
+        col1, col2 = int(args.columnIndex1B), int(args.columnIndex2B)
+        if not is_current(args.ref_db, args.file, col1, col2):
+            import_csv(args.ref_db, args.file, col1, col2)
+            imported = True
+    elif not os.path.exists(args.ref_db):
+        raise ValueError(f"reference database not found: {args.ref_db}")
+    tree = RTreeIndex(args.ref_db)
+    return tree, {"path": args.ref_db, "points": len(tree), "imported": imported}
+
+def output_writer(args):
+    # Where structured output goes: text chunks to stdout, binary chunks to its byte stream
+    if args.output == "binary":
+        buffer = getattr(sys.stdout, "buffer", None)
+        if buffer is None:
+            raise ValueError("binary output is only available on the command line")
+        return lambda chunk: (buffer.write(chunk), buffer.flush())
+    return lambda chunk: (sys.stdout.write(chunk), sys.stdout.flush())
+
+def run_request(args, store=None, emit=None, results=None, timer=None):
+    # Handle one matching request and print the result for the frontend.
+    # store: DatasetStore that keeps parsed CSV columns and indexes between requests
+    # emit: callable that receives jsonl/binary output chunks (default: stdout)
+    # results: ResultCache of finished matches (default: the --result-cache-dir tier only)
+    # timer: PhaseTimer for --timing (default: a new one, enabled by args.timing)
+    if timer is None:
+        timer = PhaseTimer(getattr(args, "timing", False))
+    output = getattr(args, "output", "text")
+    if output != "text" and emit is None:
+        emit = output_writer(args)
+    if store is None:
+        store = make_store(args)
+    if results is None:
+        results = make_result_cache(args, memory=False)
+    file = args.file
+    with timer.phase("validation"):
+        bulk1, input1_stats = bulk_points(args, 1)
+        bulk2, input2_stats = bulk_points(args, 2)
+    useCSV1 = bulk1 is None and str(args.useCSV1).lower() == 'true'  # Convert string 'true'/'false' to boolean
+    useCSV2 = bulk2 is None and str(args.useCSV2).lower() == 'true'  # Convert string 'true'/'false' to boolean
+    ref_db = getattr(args, "ref_db", None)
+    if ref_db and bulk2 is not None:
+        raise ValueError("--ref-db replaces array 2, do not send points2 as well")
+    # Extra reference sets (--ref); array 2 is only matched as well when it was given
+    extra = [dict(ref, file=ref["file"] or file) for ref in getattr(args, "references", None) or []]
+    if any(not ref["file"] for ref in extra):
+        raise ValueError("a reference without a file needs the request's file")
+    use_array2 = (not extra or ref_db or bulk2 is not None or useCSV2
+                  or bool(str(args.manualEntry2 or "").strip()))
+
+    # Every column pair of a file is read in a single pass, each file only once
+    file_pairs = {}
+    requested = []
+    def want(path, pair):
+        requested.append((path, pair))
+        if pair not in file_pairs.setdefault(path, []):
+            file_pairs[path].append(pair)
+    if useCSV1:
+        want(file, (int(args.columnIndex1A), int(args.columnIndex2A)))  # 0-based indices
+    if use_array2 and useCSV2 and not ref_db:
+        want(file, (int(args.columnIndex1B), int(args.columnIndex2B)))  # 0-based indices
+    for ref in extra:
+        want(ref["file"], tuple(ref["columns"]))
+    csv_points = {}
+    with timer.phase("read_csv"):
+        for path, pairs in file_pairs.items():
+            csv_points.update(zip([(path, pair) for pair in pairs], store.points_many(path, pairs)))
+    info = {"csv_stats": [store.stats(path, *pair) for path, pair in requested]}
+
+    # Messages about invalid manual entries go to stderr when stdout carries structured output
+    references = []
+    with timer.phase("validation"), \
+         contextlib.redirect_stdout(sys.stderr) if output != "text" else contextlib.nullcontext():
+        # If use CSV is enabled for Array 1
+        if bulk1 is not None:
+            array1 = bulk1
+        elif useCSV1:
+            array1 = csv_points[(file, (int(args.columnIndex1A), int(args.columnIndex2A)))]
+        else:
+            array1 = parse_manual_entry(args.manualEntry1, 1)
+
+        # If use CSV is enabled for Array 2
+        # ref_version None: the reference points themselves are part of the result cache key
+        array2 = {"name": "array2", "index": None, "version": None, "engine": args.engine, "workers": args.workers}
+        if not use_array2:
+            pass
+        elif ref_db:
+            # Every query goes through the database's R*Tree, in this process
+            tree, info["ref_db"] = open_ref_db(args, useCSV2)
+            array2.update(points=tree, index=lambda: tree, version=["ref_db"] + file_version(ref_db),
+                          engine="index", workers=1)
+        elif bulk2 is not None:
+            array2["points"] = bulk2
+        elif useCSV2:
+            pair = (int(args.columnIndex1B), int(args.columnIndex2B))
+            array2.update(points=csv_points[(file, pair)], index=lambda: store.index(file, *pair),
+                          version=["csv"] + file_version(file) + list(pair))
+        else:
+            array2["points"] = parse_manual_entry(args.manualEntry2, 2)
+        if use_array2:
+            references.append(array2)
+    for ref in extra:
+        pair = tuple(ref["columns"])
+        references.append({"name": ref["name"], "points": csv_points[(ref["file"], pair)],
+                           "index": lambda path=ref["file"], pair=pair: store.index(path, *pair),
+                           "version": ["csv"] + file_version(ref["file"]) + list(pair),
+                           "engine": args.engine, "workers": args.workers})
+
+    if output == "text":
+        # Output the arrays as strings for the frontend
+        with timer.phase("output"):
+            print(f"Array 1 input: {as_list(array1)}")
+
+    if bulk1 is not None or bulk2 is not None:
+        info["input_stats"] = [input1_stats, input2_stats]
+    hits = []
+    reference_stats = []
+    for ref in references:
+        # With several reference sets every output line or section is labelled with the set's name
+        label = ref["name"] if len(references) > 1 else None
+        stats = match_reference(args, array1, ref, output, emit, results, label, timer)
+        hits.append(stats.pop("result_cache_hit", False))
+        reference_stats.append({"name": ref["name"], "points": len(ref["points"]), **stats})
+    if len(references) == 1:
+        reference_stats[0].pop("name")
+        reference_stats[0].pop("points")
+        info.update(reference_stats[0])
+    else:
+        info["references"] = reference_stats
+    if results is not None:
+        info["result_cache"] = {"hit": all(hits), **results.summary()}
+    if timer.enabled:
+        info["timing"] = timer.report()
+    return info
+
+def match_reference(args, array1, ref, output, emit, results, label=None, timer=None):
+    # Match array1 against one reference set and write its output. ref holds the set's
+    # "points", its "index" callable, its "version" for the result cache key and the
+    # "engine" and "workers" to use. Returns the stats for the reply.
+    array2, index, engine, workers = ref["points"], ref["index"], ref["engine"], ref["workers"]
+    timer = timer or PhaseTimer(enabled=False)
+    suffix = f" [{label}]" if label else ""
+    if output == "text":
+        with timer.phase("output"):
+            print(f"Array 2 input{suffix}: {as_list(array2)}")
+    stats = {}
+    key = None
+    if results is not None:
+        key = result_key(args, array1, array2, ref["version"])
+        misses = results.stats["misses"]
+    try:
+        if args.mode == "nearest":
+            prefilter_stats = {}
+            simplify = getattr(args, "simplify", "none")
+            def match():
+                if simplify != "none":
+                    return dict(zip(("indices", "distances", "kept"),
+                                    simplified_matches(array1, array2, simplify, args.tolerance_m,
+                                                       engine, index, workers, prefilter_stats)))
+                if len(array1) == 0:
+                    return {"indices": np.empty(0, dtype=np.intp), "distances": np.empty(0)}
+                return dict(zip(("indices", "distances"),
+                                nearest_matches(array1, array2, engine, index, workers, prefilter_stats)))
+            with timer.phase("match"):
+                found = cached_result(results, key, match)
+            indices, distances = found["indices"], found["distances"]
+            if "kept" in found:
+                stats["simplify_stats"] = {"points": len(indices), "matched": len(found["kept"])}
+            with timer.phase("output"):
+                if output == "text":
+                    print(f"Output Array{suffix}: {points_at(array2, indices)}")
+                else:
+                    write_structured(output, emit, args.mode, array2, 1, indices=indices, distances=distances,
+                                     reference=label)
+            if prefilter_stats:
+                stats["prefilter_stats"] = prefilter_stats
+        else:
+            with timer.phase("match"):
+                matches = unpack_matches(cached_result(results, key, lambda: pack_matches(
+                    query_matches(array1, array2, args.mode, args.k, args.radius_km, index, workers))))
+            with timer.phase("output"):
+                if output == "text":
+                    print(f"Output Matches{suffix}: {json.dumps(format_matches(as_list(array1), as_list(array2), matches))}")
+                else:
+                    write_structured(output, emit, args.mode, array2, min(args.k, len(array2)), matches=matches,
+                                     reference=label)
+    except ValueError as e:
+        if output == "text":
+            print(f"Cannot match points{suffix}: {e}")
+        elif output == "jsonl":
+            error = {"error": f"Cannot match points: {e}"}
+            emit(json.dumps({**error, "reference": label} if label else error) + "\n")
+        else:
+            raise
+    if results is not None:
+        stats["result_cache_hit"] = results.stats["misses"] == misses
+    return stats
+
+def write_structured(output, emit, mode, arr2, k, indices=None, distances=None, matches=None, reference=None):
+    # With several reference sets each one gets its own header and records, one set after another
+    n = len(indices) if matches is None else len(matches)
+    if output == "jsonl":
+        header = {"mode": mode, "queries": n, "references": len(arr2)}
+        if reference is not None:
+            header["reference"] = reference
+        blocks = jsonl_blocks(header, arr2, indices, distances, matches)
+    else:
+        blocks = binary_blocks(n, k, indices, distances, matches)
+    for chunk in blocks:
+        emit(chunk)
+
+def request_ref_db(ref_db, defaults):
+    # A request may only name a reference database inside --ref-db-dir; anything else (.., absolute
+    # paths, symlinks out of it) is refused, since open_ref_db can replace the file
+    if not ref_db:
+        return defaults.ref_db
+    allowed = os.path.realpath(defaults.ref_db_dir)
+    path = os.path.realpath(str(ref_db))
+    if os.path.commonpath([allowed, path]) != allowed or path == allowed:
+        raise ValueError(f"ref_db must be a file inside {defaults.ref_db_dir}: {ref_db}")
+    return path
+
+def request_args(request, defaults):
+    # Turn a JSON request (the /execute body) into the same namespace parse_args builds
+    args = argparse.Namespace(**vars(defaults))
+    for name in REQUEST_FIELDS:
+        value = request.get(name, "")
+        setattr(args, name, "" if value is None else str(value))
+    args.engine = request.get("engine", defaults.engine)
+    args.mode = request.get("mode", defaults.mode)
+    args.k = int(request.get("k", defaults.k))
+    args.workers = int(request.get("workers", defaults.workers))
+    args.ref_db = request_ref_db(request.get("ref_db"), defaults)
+    references = request.get("references")
+    if references is not None:
+        if not isinstance(references, list):
+            raise ValueError("references must be a list of {\"file\", \"columns\"} objects")
+        args.references = [reference_from_request(ref) for ref in references]
+    args.output = request.get("output", defaults.output)
+    args.simplify = request.get("simplify", defaults.simplify)
+    args.timing = bool(request.get("timing", defaults.timing))
+    args.tolerance_m = float(request.get("tolerance_m", defaults.tolerance_m))
+    # Bulk points: "points1"/"points2" as JSON arrays, or "input1"/"input2" file paths (never stdin here)
+    for which in (1, 2):
+        setattr(args, f"points{which}", request.get(f"points{which}"))
+        source = request.get(f"input{which}", getattr(defaults, f"input{which}"))
+        if source == "-":
+            raise ValueError("the worker's stdin carries requests, send points inline instead")
+        setattr(args, f"input{which}", source)
+    if args.output not in ("text", "jsonl"):
+        raise ValueError("worker requests support text and jsonl output")
+    radius_km = request.get("radius_km", defaults.radius_km)
+    args.radius_km = None if radius_km is None else float(radius_km)
+    return args
+
+def handle_worker_message(message, defaults, store, send=None, results=None):
+    # A message is one request, or {"id": ..., "requests": [...]} for a batch.
+    # send: callable for partial replies; with it, jsonl output is streamed as
+    # {"id", "chunk"} messages before the final reply instead of collected in "response"
+    if not isinstance(message, dict):
+        return {"id": None, "error": "A request must be a JSON object"}
+    if "requests" in message:
+        return {"id": message.get("id"),
+                "responses": [handle_worker_message(r, defaults, store, results=results) for r in message["requests"]]}
+    output = io.StringIO()
+    try:
+        if "preprocess" in message:
+            return {"id": message.get("id"), "preprocessed": preprocess(message, store)}
+        args = request_args(message, defaults)
+        emit = None
+        if send is not None and args.output == "jsonl":
+            emit = lambda chunk: send({"id": message.get("id"), "chunk": chunk})
+        with contextlib.redirect_stdout(output):
+            info = run_request(args, store, emit, results)
+    except Exception as e:
+        return {"id": message.get("id"), "error": f"{type(e).__name__}: {e}"}
+    return {"id": message.get("id"), "response": output.getvalue(), **info}
+
+def preprocess(message, store):
+    # {"preprocess": file, "columns": [[col1, col2], ...]} parses an upload and builds its
+    # indexes ahead of time; without "columns" the lat/lon pair is found from the header
+    file = message["preprocess"]
+    pairs = message.get("columns") or detect_coordinate_columns(file)
+    done = []
+    for col1, col2 in pairs:
+        store.index(file, int(col1), int(col2))
+        done.append([int(col1), int(col2), len(store.points(file, int(col1), int(col2)))])
+    return done
+
+def run_worker(defaults, stdin=sys.stdin, stdout=sys.stdout):
+    # Serve newline-delimited JSON requests until stdin closes, one JSON response line each.
+    # Parsed CSV columns, spatial indexes and finished results stay in memory between requests.
+    store = make_store(defaults)
+    results = make_result_cache(defaults)
+    def send(reply):
+        stdout.write(json.dumps(reply) + "\n")
+        stdout.flush()
+    for line in stdin:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            message = json.loads(line)
+        except json.JSONDecodeError as e:
+            reply = {"id": None, "error": f"Invalid JSON request: {e}"}
+        else:
+            reply = handle_worker_message(message, defaults, store, send, results)
+        send(reply)
+
+def main(argv):
+    # Get arguments passed from Node.js
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    args = parse_args(argv)
+    if args.worker:
+        run_worker(args)
+    else:
+        timer = PhaseTimer(args.timing)
+        timer.add("parse_args", time.perf_counter() - wall, time.process_time() - cpu)
+        if args.profile:
+            profiler = cProfile.Profile()
+            try:
+                info = profiler.runcall(run_request, args, timer=timer)
+            finally:
+                profiler.dump_stats(args.profile)
+        else:
+            info = run_request(args, timer=timer)
+        if "prefilter_stats" in info:
+            # Keep stdout in the format the frontend parses
+            print(f"Prefilter stats: {json.dumps(info['prefilter_stats'])}", file=sys.stderr)
+        if "result_cache" in info:
+            print(f"Result cache: {json.dumps(info['result_cache'])}", file=sys.stderr)
+        if "timing" in info:
+            # Always the last line on stderr, so callers can split it off
+            print(json.dumps({"timing": info["timing"]}), file=sys.stderr)
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,157 @@
+"""
+result_cache.py
+
+Cache of finished match results, so a request that was already answered (same
+reference data, same columns, same query points, same options) skips matching.
+
+A result is a dict of numpy arrays (for example {"indices", "distances"}) and
+is keyed by fingerprint(): the SHA-256 of the request options, the reference
+set's version and the raw bytes of the query points. Two tiers:
+
+    memory  an LRU dict bounded by `max_bytes`, kept by the long-lived worker
+    disk    optional, one <key>.npz per result in `cache_dir`, shared by every
+            process and bounded by `disk_max_bytes` (least recently used first)
+
+Hits and misses are counted in `stats`.
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+from collections import OrderedDict
+import numpy as np
+
+DEFAULT_MEMORY_BYTES = 128 * 1024 * 1024
+DEFAULT_DISK_BYTES = 512 * 1024 * 1024
+
+def file_version(file_path):
+    # A file's identity for cache keys: path, size and modification time, like DatasetStore's keys
+    path = os.path.abspath(os.path.expanduser(file_path))
+    stat = os.stat(path)
+    return [path, stat.st_size, stat.st_mtime_ns]
+
+def fingerprint(*parts):
+    """
+    SHA-256 hex digest of the given parts; numpy arrays are hashed by dtype, shape and
+    contents, anything else must be JSON serialisable.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            part = np.ascontiguousarray(part)
+            digest.update(f"array:{part.dtype.str}:{part.shape}:".encode())
+            digest.update(part.tobytes())
+        else:
+            digest.update(b"json:" + json.dumps(part, sort_keys=True).encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+def _nbytes(value):
+    return sum(array.nbytes for array in value.values())
+
+class ResultCache:
+    def __init__(self, max_bytes=DEFAULT_MEMORY_BYTES, cache_dir=None, disk_max_bytes=DEFAULT_DISK_BYTES):
+        """
+        Parameters:
+            max_bytes (int): Size limit of the in-memory tier; 0 turns it off.
+            cache_dir (str): Directory of the on-disk tier, or None for memory only.
+            disk_max_bytes (int): Size limit of the on-disk tier.
+        """
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def _remember(self, key, value):
+        size = _nbytes(value)
+        if size > self.max_bytes:
+            return
+        if key in self._memory:
+            self._memory_bytes -= _nbytes(self._memory.pop(key))
+        self._memory[key] = value
+        self._memory_bytes += size
+        while self._memory_bytes > self.max_bytes:
+            _, dropped = self._memory.popitem(last=False)
+            self._memory_bytes -= _nbytes(dropped)
+
+    def get(self, key):
+        """
+        Return the cached result for `key`, or None; the tier that answered is counted in stats.
+        """
+        value = self._memory.get(key)
+        if value is not None:
+            self._memory.move_to_end(key)
+            self.stats["memory_hits"] += 1
+            return value
+        if self.cache_dir:
+            try:
+                with np.load(self._path(key)) as data:
+                    value = {name: data[name] for name in data.files}
+                os.utime(self._path(key))
+            except (OSError, ValueError):
+                value = None
+            if value is not None:
+                self.stats["disk_hits"] += 1
+                self._remember(key, value)
+                return value
+        self.stats["misses"] += 1
+        return None
+
+    def put(self, key, value):
+        """
+        Store a result (a dict of numpy arrays) in memory and, when there is a cache_dir, on disk.
+        """
+        value = {name: np.asarray(array) for name, array in value.items()}
+        self._remember(key, value)
+        if not self.cache_dir:
+            return
+        # Write to a temporary file and rename it so concurrent readers never see half a file
+        fd, tmp_path = tempfile.mkstemp(prefix=".", suffix=".npz", dir=self.cache_dir)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, **value)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.evict(keep=self._path(key))
+
+    def evict(self, keep=None):
+        """
+        Remove the least recently used result files until the disk tier fits in disk_max_bytes.
+        """
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.startswith(".") or not name.endswith(".npz"):
+                continue
+            try:
+                entries.append((os.path.getmtime(path), os.path.getsize(path), path))
+            except OSError:
+                continue  # removed by another process while listing
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.disk_max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def summary(self):
+        """
+        Counters plus the current size of the memory tier, for worker replies.
+        """
+        return {**self.stats, "entries": len(self._memory), "memory_bytes": self._memory_bytes}
@@ -0,0 +1,230 @@
+"""
+rtree_index.py
+
+Reference point sets stored in a SQLite database with an R*Tree index.
+
+A reference set (for example uploads/iata-icao.csv) is imported once; after
+that any number of processes can open the database read-only and share it
+through the OS page cache instead of parsing the CSV again. Tables:
+
+    points(id, lat, lon)                      id is the point's index in the source
+    points_rtree(id, min_lat, max_lat, min_lon, max_lon)   SQLite R*Tree
+    meta(key, value)                          source file, size, mtime and columns
+
+The R*Tree only answers bounding-box questions, so every query runs in two
+steps. A box sized from the point density (grown until it holds k points)
+gives an upper bound D on the k-th nearest distance. Then the lat/lon box that
+must contain every point within D,
+
+    |dlat| <= D / R,   |dlon| <= asin(sin(D / R) / cos(lat))   (all longitudes near a pole)
+
+is fetched and each candidate is checked with the exact haversine d(). Results
+are sorted by (distance, index), so they match SphereIndex and the brute-force
+loop, ties included. Longitudes are stored wrapped into [-180, 180) and boxes
+that cross the antimeridian are split in two.
+
+Usage:
+    python3 rtree_index.py import refs.db uploads/iata-icao.csv 5 6
+    index = RTreeIndex("refs.db")
+    indices, distances = index.query(array1, k=1)
+"""
+
+import os
+import sys
+import math
+import json
+import sqlite3
+import argparse
+import tempfile
+import numpy as np
+from match_engine import d, as_point_array, EARTH_RADIUS_KM
+from csv_points import read_column_pairs
+
+# Search boxes are widened by this relative margin so rounding never drops a boundary point
+BOX_MARGIN = 1e-9
+
+# Square degrees on the sphere, used to size the first search box from the point density
+SPHERE_SQ_DEG = 41253
+
+def _wrap(lon):
+    return (lon + 180) % 360 - 180
+
+def import_points(db_path, points, meta=None):
+    """
+    Write `points` into a new database at db_path, replacing any existing one.
+    The database is built under a temporary name and renamed into place, so
+    processes that have the old file open keep reading it undisturbed.
+    """
+    points = as_point_array(points)
+    directory = os.path.dirname(os.path.abspath(db_path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".rtree_", suffix=".db", dir=directory)
+    os.close(fd)
+    try:
+        conn = sqlite3.connect(tmp_path)
+        with conn:
+            conn.execute("CREATE TABLE points (id INTEGER PRIMARY KEY, lat REAL NOT NULL, lon REAL NOT NULL)")
+            conn.execute("CREATE VIRTUAL TABLE points_rtree USING rtree(id, min_lat, max_lat, min_lon, max_lon)")
+            conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+            rows = [(i, lat, lon) for i, (lat, lon) in enumerate(points.tolist())]
+            conn.executemany("INSERT INTO points VALUES (?, ?, ?)", rows)
+            conn.executemany("INSERT INTO points_rtree VALUES (?, ?, ?, ?, ?)",
+                             [(i, lat, lat, _wrap(lon), _wrap(lon)) for i, lat, lon in rows])
+            conn.executemany("INSERT INTO meta VALUES (?, ?)",
+                             [(key, json.dumps(value)) for key, value in (meta or {}).items()])
+        conn.close()
+        os.replace(tmp_path, db_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return len(points)
+
+def source_meta(file_path, col1, col2):
+    path = os.path.abspath(os.path.expanduser(file_path))
+    stat = os.stat(path)
+    return {"source": path, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "columns": [col1, col2]}
+
+def import_csv(db_path, file_path, col1, col2):
+    """
+    Import one (lat, lon) column pair of a CSV file. Returns the number of points.
+    """
+    points, _ = read_column_pairs(file_path, [(col1, col2)])
+    return import_points(db_path, points[0], source_meta(file_path, col1, col2))
+
+def is_current(db_path, file_path, col1, col2):
+    """
+    True if db_path holds this column pair of file_path as it is now (same size and mtime).
+    """
+    if not os.path.exists(db_path):
+        return False
+    try:
+        index = RTreeIndex(db_path)
+    except sqlite3.DatabaseError:
+        return False
+    try:
+        return index.meta == source_meta(file_path, col1, col2)
+    finally:
+        index.close()
+
+class RTreeIndex:
+    """
+    Read-only view of an imported reference set, with the same query interface as SphereIndex.
+    """
+
+    def __init__(self, db_path):
+        uri = "file:" + os.path.abspath(db_path) + "?mode=ro"
+        self.conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        self.size = self.conn.execute("SELECT COUNT(*) FROM points").fetchone()[0]
+        self.meta = {key: json.loads(value) for key, value in self.conn.execute("SELECT key, value FROM meta")}
+
+    def close(self):
+        self.conn.close()
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, j):
+        row = self.conn.execute("SELECT lat, lon FROM points WHERE id = ?", (int(j),)).fetchone()
+        if row is None:
+            raise IndexError(j)
+        return list(row)
+
+    def tolist(self):
+        return [list(row) for row in self.conn.execute("SELECT lat, lon FROM points ORDER BY id")]
+
+    def _fetch(self, lat_lo, lat_hi, lon_ranges):
+        rows = []
+        for lon_lo, lon_hi in lon_ranges:
+            rows += self.conn.execute(
+                "SELECT p.id, p.lat, p.lon FROM points_rtree r JOIN points p ON p.id = r.id "
+                "WHERE r.max_lat >= ? AND r.min_lat <= ? AND r.max_lon >= ? AND r.min_lon <= ?",
+                (lat_lo, lat_hi, lon_lo, lon_hi)).fetchall()
+        return rows
+
+    def _lon_ranges(self, lon, half_width):
+        # [lon - half_width, lon + half_width] in wrapped longitudes, split at the antimeridian
+        if half_width >= 180:
+            return [(-180.0, 180.0)]
+        lon = _wrap(lon)
+        lo, hi = lon - half_width, lon + half_width
+        ranges = [(max(lo, -180.0), min(hi, 180.0))]
+        if lo <= -180:
+            ranges.append((lo + 360, 180.0))
+        if hi >= 180:
+            ranges.append((-180.0, hi - 360))
+        return ranges
+
+    def _within_box(self, lat, lon, dist_km):
+        # Every point that can be within dist_km of (lat, lon)
+        delta = dist_km / EARTH_RADIUS_KM * (1 + BOX_MARGIN) + BOX_MARGIN
+        lat_lo = lat - math.degrees(delta)
+        lat_hi = lat + math.degrees(delta)
+        cos_lat = math.cos(math.radians(lat))
+        if lat_hi >= 90 or lat_lo <= -90 or math.sin(min(delta, math.pi / 2)) >= cos_lat:
+            half_width = 180.0
+        else:
+            half_width = math.degrees(math.asin(math.sin(delta) / cos_lat)) * (1 + BOX_MARGIN) + BOX_MARGIN
+        return self._fetch(lat_lo, lat_hi, self._lon_ranges(lon, half_width))
+
+    def _ranked(self, lat, lon, rows):
+        return sorted((d(lat, lon, p_lat, p_lon), j) for j, p_lat, p_lon in rows)
+
+    def query(self, points, k=1):
+        """
+        Find the k nearest reference points for every query point.
+
+        Returns:
+            (indices, distances): (n, k) arrays of reference indices and distances in km, closest first.
+        """
+        query = as_point_array(points)
+        n = len(query)
+        if self.size == 0 and n:
+            raise ValueError("reference set is empty")
+        k = min(k, self.size)
+        indices = np.empty((n, k), dtype=np.intp)
+        distances = np.empty((n, k), dtype=np.float64)
+        start = math.sqrt(k * SPHERE_SQ_DEG / max(self.size, 1))
+        for i, (lat, lon) in enumerate(query.tolist()):
+            # Grow a plain degree box until it holds k points; its k-th distance bounds the answer
+            half = start
+            while True:
+                rows = self._fetch(lat - half, lat + half, self._lon_ranges(lon, half))
+                if len(rows) >= k or half >= 180:
+                    break
+                half *= 4
+            bound = self._ranked(lat, lon, rows)[k - 1][0]
+            ranked = self._ranked(lat, lon, self._within_box(lat, lon, bound))[:k]
+            for col, (dist, j) in enumerate(ranked):
+                indices[i, col] = j
+                distances[i, col] = dist
+        return indices, distances
+
+    def query_radius(self, points, radius_km):
+        """
+        Find every reference point within `radius_km` of each query point.
+
+        Returns:
+            A list with one (indices, distances) pair of arrays per query point, closest first.
+        """
+        results = []
+        for lat, lon in as_point_array(points).tolist():
+            ranked = [(dist, j) for dist, j in self._ranked(lat, lon, self._within_box(lat, lon, radius_km))
+                      if dist <= radius_km]
+            results.append((np.array([j for _, j in ranked], dtype=np.intp),
+                            np.array([dist for dist, _ in ranked], dtype=np.float64)))
+        return results
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Import a reference point set into a SQLite R*Tree database.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    imp = sub.add_parser("import", help="import one (lat, lon) column pair of a CSV file")
+    imp.add_argument("db")
+    imp.add_argument("file")
+    imp.add_argument("col1", type=int)
+    imp.add_argument("col2", type=int)
+    args = parser.parse_args(argv[1:])
+    count = import_csv(args.db, args.file, args.col1, args.col2)
+    print(f"Imported {count} points into {args.db}")
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,159 @@
+"""
+simplify.py
+
+Optional simplification of array 1 (a GPS trace) before matching.
+
+    dp        Douglas-Peucker on the sphere: a point is dropped when it is within
+              the tolerance of the great-circle segment between the kept points
+              around it (cross-track distance, or the distance to the nearer
+              end when it lies beyond the segment).
+    decimate  Keep a point only once it is at least the tolerance away from the
+              last kept point.
+
+The first and last points are always kept. Only the kept points are matched;
+every dropped point then takes whichever of its kept neighbours' matches (the
+kept points just before and after it in the trace) is closer to it, with the
+distance computed exactly with d(). Douglas-Peucker only bounds the distance
+to the simplified line, so where it drops a point farther than the tolerance
+from both kept neighbours (on long straight runs) that stretch is thinned
+like decimate instead.
+With either method every dropped point is then within the tolerance of a kept
+neighbour, so by the triangle inequality its reported distance is at most
+2 * tolerance more than the true nearest distance.
+"""
+
+import numpy as np
+from match_engine import d, as_point_array, to_unit_vectors, EARTH_RADIUS_KM
+
+SIMPLIFY_METHODS = ["none", "dp", "decimate"]
+
+def _angles_to_segment(xyz, a, b):
+    # Central angle from each row of xyz to the great-circle segment a-b (unit vectors)
+    def chord_angle(u, v):
+        return 2 * np.arcsin(np.clip(np.linalg.norm(u - v, axis=-1) / 2, 0.0, 1.0))
+    to_ends = np.minimum(chord_angle(xyz, a), chord_angle(xyz, b))
+    normal = np.cross(a, b)
+    length = np.linalg.norm(normal)
+    if length < 1e-15:  # a and b coincide (or are antipodal): no segment direction
+        return to_ends
+    normal /= length
+    cross_track = np.abs(np.arcsin(np.clip(xyz @ normal, -1.0, 1.0)))
+    # Points between the great circles through a and b perpendicular to the segment
+    inside = (xyz @ np.cross(normal, a) >= 0) & (xyz @ np.cross(b, normal) >= 0)
+    return np.where(inside, cross_track, to_ends)
+
+def douglas_peucker(points, tolerance_m):
+    """
+    Indices of the points kept by Douglas-Peucker with a tolerance in metres, ascending.
+    """
+    points = as_point_array(points)
+    n = len(points)
+    if n <= 2:
+        return np.arange(n)
+    xyz = to_unit_vectors(points)
+    tolerance = tolerance_m / 1000 / EARTH_RADIUS_KM  # as a central angle
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        angles = _angles_to_segment(xyz[start + 1:end], xyz[start], xyz[end])
+        worst = int(np.argmax(angles))
+        if angles[worst] > tolerance:
+            split = start + 1 + worst
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return np.flatnonzero(keep)
+
+def decimate(points, tolerance_m):
+    """
+    Indices of the points at least tolerance_m metres from the previously kept point, plus the last point.
+    """
+    points = as_point_array(points).tolist()
+    if not points:
+        return np.arange(0)
+    tolerance_km = tolerance_m / 1000
+    kept = [0]
+    last_lat, last_lon = points[0]
+    for i in range(1, len(points) - 1):
+        lat, lon = points[i]
+        if d(last_lat, last_lon, lat, lon) >= tolerance_km:
+            kept.append(i)
+            last_lat, last_lon = lat, lon
+    if len(points) > 1:
+        kept.append(len(points) - 1)
+    return np.array(kept, dtype=np.intp)
+
+def keep_near(points, kept, tolerance_m):
+    """
+    kept plus enough dropped points that each dropped point is within tolerance_m metres
+    of one of its kept neighbours. In a gap with a point farther than that from both ends,
+    a point is kept once it is farther than the tolerance from the last kept one (as in
+    decimate), so every dropped point there is within the tolerance of the kept point before it.
+    """
+    points = as_point_array(points).tolist()
+    tolerance_km = tolerance_m / 1000
+    result = []
+    for start, end in zip(kept[:-1].tolist(), kept[1:].tolist()):
+        result.append(start)
+        start_lat, start_lon = points[start]
+        end_lat, end_lon = points[end]
+        if all(d(lat, lon, start_lat, start_lon) <= tolerance_km or d(lat, lon, end_lat, end_lon) <= tolerance_km
+               for lat, lon in points[start + 1:end]):
+            continue
+        last_lat, last_lon = start_lat, start_lon
+        for i in range(start + 1, end):
+            lat, lon = points[i]
+            if d(last_lat, last_lon, lat, lon) > tolerance_km:
+                result.append(i)
+                last_lat, last_lon = lat, lon
+    result.extend(kept[-1:].tolist())
+    return np.array(result, dtype=np.intp)
+
+def simplify_points(points, method, tolerance_m):
+    """
+    Indices of the points to match for a SIMPLIFY_METHODS method. Every other point is
+    within tolerance_m metres of the kept point just before or after it.
+    """
+    if tolerance_m < 0:
+        raise ValueError("the simplification tolerance must not be negative")
+    if method == "dp":
+        return keep_near(points, douglas_peucker(points, tolerance_m), tolerance_m)
+    if method == "decimate":
+        return decimate(points, tolerance_m)
+    if method == "none":
+        return np.arange(len(points))
+    raise ValueError(f"unknown simplification method: {method}")
+
+def expand_matches(points, refs, kept, kept_indices, kept_distances):
+    """
+    Full-length (indices, distances) from the matches of the kept points.
+    Each dropped point takes the closer of its two kept neighbours' matches (the earlier one on a tie).
+    """
+    points = as_point_array(points)
+    n = len(points)
+    indices = np.empty(n, dtype=np.intp)
+    distances = np.empty(n, dtype=np.float64)
+    indices[kept] = kept_indices
+    distances[kept] = kept_distances
+    dropped = np.setdiff1d(np.arange(n), kept)
+    if len(dropped) == 0:
+        return indices, distances
+    after = np.searchsorted(kept, dropped)
+    points_list = points.tolist()
+    # Any indexable reference set works (RTreeIndex looks points up one at a time)
+    refs_list = refs.tolist() if isinstance(refs, np.ndarray) else refs
+    for i, prev, nxt in zip(dropped.tolist(), kept[after - 1].tolist(), kept[after].tolist()):
+        lat, lon = points_list[i]
+        j_prev = int(indices[prev])
+        j_next = int(indices[nxt])
+        to_prev = d(lat, lon, refs_list[j_prev][0], refs_list[j_prev][1])
+        to_next = d(lat, lon, refs_list[j_next][0], refs_list[j_next][1])
+        if to_prev <= to_next:
+            indices[i], distances[i] = j_prev, to_prev
+        else:
+            indices[i], distances[i] = j_next, to_next
+    return indices, distances
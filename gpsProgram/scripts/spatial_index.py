@@ -0,0 +1,263 @@
+"""
+spatial_index.py
+
+Reusable spatial index over a reference set of [lat, lon] points.
+
+Points are stored as unit vectors in a 3D KD-tree. The straight-line (chord)
+distance between two unit vectors grows monotonically with the great-circle
+distance, so the tree's nearest neighbours are the great-circle nearest
+neighbours. Every candidate within rounding distance of the k-th best chord is
+re-ranked with the scalar haversine `d()`, which makes the results identical
+to the brute-force loop, ties included (the lowest reference index wins).
+
+Usage:
+    index = SphereIndex().build(array2)
+    indices, distances = index.query(array1, k=1)
+    within = index.query_radius(array1, radius_km=50)
+"""
+
+import os
+import heapq
+import math
+import numpy as np
+from match_engine import d, as_point_array, to_unit_vectors, EARTH_RADIUS_KM
+
+# Chords within this distance of the k-th best are re-checked with d().
+CHORD_TOLERANCE = 1e-12
+
+class SphereIndex:
+    """
+    KD-tree on unit-sphere xyz coordinates with exact haversine re-ranking.
+    """
+
+    def __init__(self, leaf_size=16):
+        self.leaf_size = leaf_size
+        self.size = 0
+
+    def build(self, points):
+        """
+        Build the tree over `points` (a sequence of [lat, lon] pairs) and return self.
+        """
+        self.points = as_point_array(points)
+        self.size = len(self.points)
+        xyz = to_unit_vectors(self.points)
+
+        split_dim, split_val, left, right, start, end = [], [], [], [], [], []
+        perm = np.arange(self.size)
+
+        def new_node(lo, hi):
+            split_dim.append(-1)
+            split_val.append(0.0)
+            left.append(-1)
+            right.append(-1)
+            start.append(lo)
+            end.append(hi)
+            return len(start) - 1
+
+        # Iterative build: each stack entry is a node covering perm[lo:hi]
+        root = new_node(0, self.size)
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            lo, hi = start[node], end[node]
+            if hi - lo <= self.leaf_size:
+                continue
+            block = xyz[perm[lo:hi]]
+            dim = int(np.argmax(block.max(axis=0) - block.min(axis=0)))
+            mid = (hi - lo) // 2
+            order = np.argpartition(block[:, dim], mid)
+            perm[lo:hi] = perm[lo:hi][order]
+            split_dim[node] = dim
+            split_val[node] = float(xyz[perm[lo + mid], dim])
+            left[node] = new_node(lo, lo + mid)
+            right[node] = new_node(lo + mid, hi)
+            stack.append(left[node])
+            stack.append(right[node])
+
+        self.perm = perm
+        self.xyz = xyz[perm]
+        self.nodes = (split_dim, split_val, left, right, start, end)
+        self._prepare()
+        return self
+
+    def _prepare(self):
+        # Python lists make the per-query tree walk much faster than numpy scalar indexing
+        self._perm_list = self.perm.tolist()
+        self._xyz_list = [tuple(p) for p in self.xyz.tolist()]
+        self._points_list = self.points.tolist()
+
+    def save(self, directory):
+        """
+        Write the built tree as .npy files into `directory` so it can be reloaded with load().
+        """
+        points, perm, nodes, split_val, leaf_size = self.to_arrays()
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, "index_points.npy"), points)
+        np.save(os.path.join(directory, "index_perm.npy"), perm)
+        np.save(os.path.join(directory, "index_nodes.npy"), nodes)
+        np.save(os.path.join(directory, "index_split_val.npy"), split_val)
+        np.save(os.path.join(directory, "index_leaf_size.npy"), np.array([leaf_size]))
+
+    @classmethod
+    def from_arrays(cls, points, perm, nodes, split_val, leaf_size):
+        """
+        Rebuild a tree from its arrays, e.g. ones loaded from disk or shared between processes.
+        `nodes` is the (5, n_nodes) int array of split dims, children and point ranges.
+        """
+        index = cls(leaf_size=int(leaf_size))
+        index.points = points
+        index.size = len(points)
+        index.perm = perm
+        index.xyz = to_unit_vectors(points)[perm]
+        split_dim, left, right, start, end = np.asarray(nodes).tolist()
+        index.nodes = (split_dim, np.asarray(split_val).tolist(), left, right, start, end)
+        index._prepare()
+        return index
+
+    def to_arrays(self):
+        """
+        Return (points, perm, nodes, split_val, leaf_size), the inverse of from_arrays().
+        """
+        split_dim, split_val, left, right, start, end = self.nodes
+        nodes = np.array([split_dim, left, right, start, end], dtype=np.int64).reshape(5, -1)
+        return self.points, self.perm, nodes, np.array(split_val, dtype=np.float64), self.leaf_size
+
+    @classmethod
+    def load(cls, directory, mmap_mode="r"):
+        """
+        Load a tree written by save(). The arrays are memory-mapped by default.
+        """
+        def read(name):
+            return np.load(os.path.join(directory, name), mmap_mode=mmap_mode)
+        return cls.from_arrays(read("index_points.npy"), read("index_perm.npy"), read("index_nodes.npy"),
+                               read("index_split_val.npy"), read("index_leaf_size.npy")[0])
+
+    def _candidates(self, x, y, z, k):
+        """
+        Collect tree positions whose chord is within tolerance of the k-th best chord.
+        """
+        split_dim, split_val, left, right, start, end = self.nodes
+        xyz = self._xyz_list
+        heap = []  # max-heap (negated) of the k best squared chords
+        found = []
+        bound = math.inf
+        stack = [(0, 0.0)]
+        while stack:
+            node, lower = stack.pop()
+            if lower > bound:
+                continue
+            child = left[node]
+            if child < 0:
+                for pos in range(start[node], end[node]):
+                    px, py, pz = xyz[pos]
+                    dx = px - x
+                    dy = py - y
+                    dz = pz - z
+                    dist2 = dx * dx + dy * dy + dz * dz
+                    if dist2 > bound:
+                        continue
+                    found.append((dist2, pos))
+                    if len(heap) < k:
+                        heapq.heappush(heap, -dist2)
+                    elif dist2 < -heap[0]:
+                        heapq.heapreplace(heap, -dist2)
+                    if len(heap) == k:
+                        bound = (math.sqrt(-heap[0]) + CHORD_TOLERANCE) ** 2
+                continue
+            diff = (x, y, z)[split_dim[node]] - split_val[node]
+            if diff < 0:
+                near, far = child, right[node]
+            else:
+                near, far = right[node], child
+            stack.append((far, diff * diff))
+            stack.append((near, lower))
+        return [pos for dist2, pos in found if dist2 <= bound]
+
+    def _within(self, x, y, z, bound):
+        """
+        Collect tree positions whose squared chord is at most `bound`.
+        """
+        split_dim, split_val, left, right, start, end = self.nodes
+        xyz = self._xyz_list
+        found = []
+        stack = [(0, 0.0)]
+        while stack:
+            node, lower = stack.pop()
+            if lower > bound:
+                continue
+            child = left[node]
+            if child < 0:
+                for pos in range(start[node], end[node]):
+                    px, py, pz = xyz[pos]
+                    dx = px - x
+                    dy = py - y
+                    dz = pz - z
+                    if dx * dx + dy * dy + dz * dz <= bound:
+                        found.append(pos)
+                continue
+            diff = (x, y, z)[split_dim[node]] - split_val[node]
+            if diff < 0:
+                stack.append((right[node], diff * diff))
+                stack.append((child, lower))
+            else:
+                stack.append((child, diff * diff))
+                stack.append((right[node], lower))
+        return found
+
+    def _rank(self, lat, lon, positions, k):
+        """
+        Re-rank tree positions with d() and return the k best (index, distance) pairs.
+        """
+        perm = self._perm_list
+        points = self._points_list
+        ranked = []
+        for pos in positions:
+            j = perm[pos]
+            ranked.append((d(lat, lon, points[j][0], points[j][1]), j))
+        ranked.sort()
+        return ranked[:k]
+
+    def query(self, points, k=1):
+        """
+        Find the k nearest reference points for every query point.
+
+        Returns:
+            (indices, distances): (n, k) arrays of reference indices and distances in km,
+            closest first.
+        """
+        query = as_point_array(points)
+        n = len(query)
+        if self.size == 0 and n:
+            raise ValueError("reference set is empty")
+        k = min(k, self.size)
+        indices = np.empty((n, k), dtype=np.intp)
+        distances = np.empty((n, k), dtype=np.float64)
+        query_xyz = to_unit_vectors(query).tolist()
+        for i, (lat, lon) in enumerate(query.tolist()):
+            x, y, z = query_xyz[i]
+            ranked = self._rank(lat, lon, self._candidates(x, y, z, k), k)
+            for col, (dist, j) in enumerate(ranked):
+                indices[i, col] = j
+                distances[i, col] = dist
+        return indices, distances
+
+    def query_radius(self, points, radius_km):
+        """
+        Find every reference point within `radius_km` of each query point.
+
+        Returns:
+            A list with one (indices, distances) pair of arrays per query point, closest first.
+        """
+        query = as_point_array(points)
+        # Chord length of the radius, plus tolerance so d() decides the boundary cases
+        angle = min(radius_km / EARTH_RADIUS_KM, math.pi)
+        bound = (2 * math.sin(angle / 2) + CHORD_TOLERANCE) ** 2
+        query_xyz = to_unit_vectors(query).tolist()
+        results = []
+        for i, (lat, lon) in enumerate(query.tolist()):
+            x, y, z = query_xyz[i]
+            ranked = [(dist, j) for dist, j in self._rank(lat, lon, self._within(x, y, z, bound), self.size)
+                      if dist <= radius_km]
+            results.append((np.array([j for _, j in ranked], dtype=np.intp),
+                            np.array([dist for dist, _ in ranked], dtype=np.float64)))
+        return results
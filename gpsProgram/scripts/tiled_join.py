@@ -0,0 +1,276 @@
+"""
+tiled_join.py
+
+Out-of-core nearest-point join for point sets that do not fit in memory.
+
+Both CSV files are streamed in blocks (csv_points.iter_column_pairs) and every
+point is spilled to disk twice: once in input order, and once into the file of
+its lat/lon tile, as (index, lat, lon) float64 records. The join then walks the
+query tiles one at a time. For each query tile the non-empty reference tiles
+are ordered by a lower bound on the distance between the two tiles,
+
+    hav(theta) >= hav(dlat_min) + cos_min1 * cos_min2 * hav(dlon_min)
+
+(the closest latitudes, the smallest wrapped longitude gap, and the smallest
+cosine in each latitude band), and reference tiles are matched with
+match_engine.nearest_neighbors until the bound exceeds the worst current match
+in the slice. Tiles are read in slices, so memory stays within the budget
+however large a tile is. Ties keep the lowest reference index, so the result
+is the same as matching the whole files in memory.
+
+Results (reference index and distance per query point) are written to
+memory-mapped .npy files in the work directory, then streamed to a CSV file.
+
+Usage:
+    python3 tiled_join.py traces.csv 0 1 pois.csv 5 6 matches.csv --memory-mb 256
+"""
+
+import os
+import sys
+import csv
+import json
+import math
+import argparse
+import tempfile
+import numpy as np
+from csv_points import iter_column_pairs
+from match_engine import nearest_neighbors, EARTH_RADIUS_KM
+
+DEFAULT_TILE_DEG = 5.0
+DEFAULT_MEMORY_MB = 256
+
+# Bytes per spilled tile record: index, lat, lon as float64
+RECORD_BYTES = 24
+
+# Rough bytes per point while a slice is matched (arrays plus the Python lists
+# nearest_neighbors builds for the exact re-check)
+BYTES_PER_SLICE_POINT = 200
+
+# Lower bounds are shrunk by this factor so rounding never skips the nearest tile
+BOUND_MARGIN = 1e-9
+
+class TileSpill:
+    """
+    Points of one side of the join, spilled to disk in input order and by tile.
+    """
+
+    def __init__(self, directory, tile_deg=DEFAULT_TILE_DEG, buffer_bytes=DEFAULT_MEMORY_MB * 1024 * 1024):
+        self.directory = directory
+        self.tile_deg = tile_deg
+        self.buffer_bytes = buffer_bytes
+        self.rows = int(math.ceil(180 / tile_deg))
+        self.cols = int(math.ceil(360 / tile_deg))
+        self.counts = {}
+        self.size = 0
+        self._buffers = {}
+        self._buffered = 0
+        os.makedirs(directory, exist_ok=True)
+        self._points_file = open(os.path.join(directory, "points.bin"), "wb")
+
+    def tile_of(self, points):
+        """
+        Tile number of each [lat, lon] point; longitudes are wrapped into [-180, 180).
+        """
+        row = np.clip(((points[:, 0] + 90) // self.tile_deg).astype(np.int64), 0, self.rows - 1)
+        col = (((points[:, 1] + 180) % 360) // self.tile_deg).astype(np.int64) % self.cols
+        return row * self.cols + col
+
+    def _tile_path(self, tile):
+        return os.path.join(self.directory, f"tile_{tile}.bin")
+
+    def add(self, points):
+        """
+        Append a block of (n, 2) points; they get the next n indices.
+        """
+        points = np.ascontiguousarray(points, dtype=np.float64).reshape(-1, 2)
+        if len(points) == 0:
+            return
+        self._points_file.write(points.tobytes())
+        records = np.empty((len(points), 3))
+        records[:, 0] = np.arange(self.size, self.size + len(points))
+        records[:, 1:] = points
+        self.size += len(points)
+        tiles = self.tile_of(points)
+        order = np.argsort(tiles, kind="stable")
+        tiles = tiles[order]
+        starts = np.flatnonzero(np.r_[True, tiles[1:] != tiles[:-1]])
+        ends = np.r_[starts[1:], len(tiles)]
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            tile = int(tiles[start])
+            self._buffers.setdefault(tile, []).append(records[order[start:end]])
+            self.counts[tile] = self.counts.get(tile, 0) + end - start
+        self._buffered += records.nbytes
+        if self._buffered >= self.buffer_bytes:
+            self.flush()
+
+    def flush(self):
+        for tile, blocks in self._buffers.items():
+            with open(self._tile_path(tile), "ab") as f:
+                for block in blocks:
+                    f.write(block.tobytes())
+        self._buffers = {}
+        self._buffered = 0
+
+    def close(self):
+        self.flush()
+        self._points_file.close()
+
+    def points(self):
+        """
+        All points in input order as a read-only (n, 2) memory map.
+        """
+        if self.size == 0:
+            return np.empty((0, 2))
+        return np.memmap(os.path.join(self.directory, "points.bin"), dtype=np.float64, mode="r",
+                         shape=(self.size, 2))
+
+    def read(self, tile, start, stop):
+        """
+        Records start:stop of a tile file as (indices, points).
+        """
+        count = max(0, min(stop, self.counts[tile]) - start)
+        with open(self._tile_path(tile), "rb") as f:
+            f.seek(start * RECORD_BYTES)
+            records = np.fromfile(f, dtype=np.float64, count=count * 3).reshape(-1, 3)
+        return records[:, 0].astype(np.intp), records[:, 1:]
+
+    def bounds(self, tiles):
+        """
+        (lat_lo, lat_hi, lon_center) of each tile in radians.
+        """
+        tiles = np.asarray(tiles)
+        lat_lo = np.maximum(-90.0, (tiles // self.cols) * self.tile_deg - 90)
+        lat_hi = np.minimum(90.0, lat_lo + self.tile_deg)
+        lon_center = (tiles % self.cols + 0.5) * self.tile_deg - 180
+        return np.radians(lat_lo), np.radians(lat_hi), np.radians(lon_center)
+
+def tile_lower_bounds(spill, tile, other_tiles):
+    """
+    Lower bound in km on the distance between any point of `tile` and any point of each other tile.
+    Both tiles must come from spills with the same tile size.
+    """
+    lat_lo1, lat_hi1, lon1 = spill.bounds(tile)
+    lat_lo2, lat_hi2, lon2 = spill.bounds(other_tiles)
+    dlat = np.maximum(0.0, np.maximum(lat_lo2 - lat_hi1, lat_lo1 - lat_hi2))
+    dlon = np.abs(lon1 - lon2) % (2 * math.pi)
+    dlon = np.maximum(0.0, np.minimum(dlon, 2 * math.pi - dlon) - math.radians(spill.tile_deg))
+    cos_min1 = min(math.cos(lat_lo1), math.cos(lat_hi1))
+    cos_min2 = np.minimum(np.cos(lat_lo2), np.cos(lat_hi2))
+    h = np.sin(dlat / 2) ** 2 + cos_min1 * np.maximum(cos_min2, 0.0) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(h, 0.0, 1.0))) * (1 - BOUND_MARGIN)
+
+def spill_csv(file_path, col1, col2, directory, tile_deg, buffer_bytes):
+    spill = TileSpill(directory, tile_deg, buffer_bytes)
+    stats = None
+    try:
+        for points, stats in iter_column_pairs(file_path, [(col1, col2)]):
+            spill.add(points[0])
+    finally:
+        spill.close()
+    return spill, stats[0]
+
+def join_spills(queries, refs, indices, distances, memory_bytes):
+    """
+    Fill indices/distances (arrays indexed by query point) with the nearest reference point.
+    Returns counts of the tile pairs matched and skipped.
+    """
+    slice_rows = max(1, memory_bytes // (4 * BYTES_PER_SLICE_POINT))
+    chunk_pairs = max(1, memory_bytes // 4 // 24)
+    ref_tiles = np.array(sorted(refs.counts), dtype=np.int64)
+    stats = {"tile_pairs": 0, "tile_pairs_skipped": 0}
+    for tile in sorted(queries.counts):
+        bounds = tile_lower_bounds(queries, tile, ref_tiles)
+        order = np.argsort(bounds, kind="stable")
+        for start in range(0, queries.counts[tile], slice_rows):
+            query_idx, query_points = queries.read(tile, start, start + slice_rows)
+            best = np.full(len(query_idx), np.inf)
+            best_j = np.full(len(query_idx), -1, dtype=np.intp)
+            for rank, t in enumerate(order.tolist()):
+                if bounds[t] > best.max():
+                    stats["tile_pairs_skipped"] += len(order) - rank
+                    break
+                stats["tile_pairs"] += 1
+                ref_tile = int(ref_tiles[t])
+                for ref_start in range(0, refs.counts[ref_tile], slice_rows):
+                    ref_idx, ref_points = refs.read(ref_tile, ref_start, ref_start + slice_rows)
+                    local, dist = nearest_neighbors(query_points, ref_points, chunk_pairs)
+                    j = ref_idx[local]
+                    # Lowest reference index wins a tie, like the in-memory loop
+                    better = (dist < best) | ((dist == best) & (j < best_j))
+                    best[better] = dist[better]
+                    best_j[better] = j[better]
+            indices[query_idx] = best_j
+            distances[query_idx] = best
+    return stats
+
+def write_matches(output_path, query_points, ref_points, indices, distances, rows=65536):
+    # Stream the matches to CSV in query order, one block of rows at a time
+    with open(output_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["query_index", "query_lat", "query_lon", "ref_index", "ref_lat", "ref_lon", "distance_km"])
+        for start in range(0, len(indices), rows):
+            stop = min(start + rows, len(indices))
+            q = np.asarray(query_points[start:stop])
+            j = np.asarray(indices[start:stop])
+            r = np.asarray(ref_points[j])
+            writer.writerows(zip(range(start, stop), q[:, 0].tolist(), q[:, 1].tolist(), j.tolist(),
+                                 r[:, 0].tolist(), r[:, 1].tolist(), np.asarray(distances[start:stop]).tolist()))
+
+def tiled_join(query_file, query_cols, ref_file, ref_cols, output_path,
+               tile_deg=DEFAULT_TILE_DEG, memory_mb=DEFAULT_MEMORY_MB, work_dir=None):
+    """
+    Match every point of query_file to its nearest point in ref_file without loading either file.
+
+    Parameters:
+        query_cols, ref_cols (tuple): 0-based (lat column, lon column) of each file.
+        output_path (str): CSV file that receives one row per query point.
+        tile_deg (float): Tile size in degrees.
+        memory_mb (int): Approximate peak memory for spill buffers and matching.
+        work_dir (str): Where the spill files go (default: the system temp directory);
+            they are removed afterwards.
+
+    Returns:
+        dict of counts: query and reference points, non-empty tiles, tile pairs matched and skipped.
+    """
+    memory_bytes = int(memory_mb * 1024 * 1024)
+    with tempfile.TemporaryDirectory(prefix="tiled_join_", dir=work_dir) as scratch:
+        # Half the budget for spill buffers while reading; they are empty again before the join
+        queries, query_stats = spill_csv(query_file, *query_cols, os.path.join(scratch, "query"),
+                                         tile_deg, memory_bytes // 2)
+        refs, ref_stats = spill_csv(ref_file, *ref_cols, os.path.join(scratch, "ref"),
+                                    tile_deg, memory_bytes // 2)
+        if queries.size and not refs.size:
+            raise ValueError("reference set is empty")
+        indices = np.lib.format.open_memmap(os.path.join(scratch, "indices.npy"), mode="w+",
+                                            dtype=np.intp, shape=(queries.size,))
+        distances = np.lib.format.open_memmap(os.path.join(scratch, "distances.npy"), mode="w+",
+                                              dtype=np.float64, shape=(queries.size,))
+        stats = join_spills(queries, refs, indices, distances, memory_bytes)
+        write_matches(output_path, queries.points(), refs.points(), indices, distances)
+        del indices, distances
+    return {"query_points": queries.size, "ref_points": refs.size,
+            "query_tiles": len(queries.counts), "ref_tiles": len(refs.counts), **stats,
+            "query_csv": query_stats, "ref_csv": ref_stats}
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Out-of-core nearest-point join of two CSV files.")
+    parser.add_argument("query_file")
+    parser.add_argument("query_col1", type=int)
+    parser.add_argument("query_col2", type=int)
+    parser.add_argument("ref_file")
+    parser.add_argument("ref_col1", type=int)
+    parser.add_argument("ref_col2", type=int)
+    parser.add_argument("output", help="CSV file for the matches")
+    parser.add_argument("--tile-deg", type=float, default=DEFAULT_TILE_DEG, help="tile size in degrees")
+    parser.add_argument("--memory-mb", type=float, default=DEFAULT_MEMORY_MB,
+                        help="approximate peak memory for buffers and matching")
+    parser.add_argument("--work-dir", help="directory for the temporary spill files")
+    args = parser.parse_args(argv[1:])
+    if not 0 < args.tile_deg <= 180:
+        parser.error("--tile-deg must be in (0, 180]")
+    stats = tiled_join(args.query_file, (args.query_col1, args.query_col2), args.ref_file,
+                       (args.ref_col1, args.ref_col2), args.output, args.tile_deg, args.memory_mb, args.work_dir)
+    print(json.dumps(stats))
+
+if __name__ == "__main__":
+    main(sys.argv)
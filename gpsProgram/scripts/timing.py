@@ -0,0 +1,73 @@
+"""
+timing.py
+
+Opt-in per-phase instrumentation for process_data.py (--timing).
+
+Each phase records wall time (time.perf_counter), CPU time of the process
+(time.process_time) and the peak resident set size of the process once the
+phase has finished (getrusage; None where the resource module is missing).
+A phase that runs several times, e.g. matching against several reference
+sets, is summed and its count kept. When the timer is disabled phase() does
+nothing, so the hooks can stay in the code path.
+
+Usage:
+    timer = PhaseTimer()
+    with timer.phase("match"):
+        ...
+    print(json.dumps({"timing": timer.report()}), file=sys.stderr)
+"""
+
+import sys
+import time
+import contextlib
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+def peak_rss_kb():
+    # Peak resident set size of this process so far, in KB (ru_maxrss is in bytes on macOS)
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+class PhaseTimer:
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.phases = {}
+        self.start = time.perf_counter()
+
+    def add(self, name, wall_s, cpu_s):
+        """
+        Record a phase measured elsewhere (e.g. argument parsing, before the timer existed).
+        """
+        if not self.enabled:
+            return
+        phase = self.phases.setdefault(name, {"wall_s": 0.0, "cpu_s": 0.0, "count": 0})
+        phase["wall_s"] += wall_s
+        phase["cpu_s"] += cpu_s
+        phase["count"] += 1
+        phase["peak_rss_kb"] = peak_rss_kb()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        if not self.enabled:
+            yield
+            return
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - wall, time.process_time() - cpu)
+
+    def report(self):
+        """
+        {"phases": [{"name", "wall_s", "cpu_s", "count", "peak_rss_kb"}, ...] in first-run order,
+        "total_wall_s", "peak_rss_kb"}
+        """
+        return {"phases": [{"name": name, **phase} for name, phase in self.phases.items()],
+                "total_wall_s": time.perf_counter() - self.start,
+                "peak_rss_kb": peak_rss_kb()}
@@ -0,0 +1,154 @@
+"""
+trajectory.py
+
+Streaming nearest-point matcher for ordered GPS fixes.
+
+Consecutive fixes of a vehicle are close together, so each search is seeded
+from the previous one. When a vehicle is (re)anchored at a fix A, a full
+SphereIndex search finds its nearest distance D0, and every reference point
+within R = D0 + 2 * reanchor_km of A is kept as the candidate set. For a later
+fix P that has moved m = d(A, P) from the anchor, any reference point outside
+the set is at least R - m away (triangle inequality), so if the best candidate
+is closer than R - m it is the true nearest point. Otherwise the vehicle is
+re-anchored at P. Each fix costs one d() per candidate, which stays constant
+while the vehicle moves less than about reanchor_km between anchors.
+
+Usage:
+    matcher = TrajectoryMatcher(SphereIndex().build(refs))
+    for index, distance in matcher.stream(fixes):
+        ...
+
+    python3 trajectory.py refs.csv 5 6 < fixes.ndjson
+    (one fix per line, {"lat": ..., "lon": ..., "vehicle": ..., "id": ...} or [lat, lon];
+    one JSON match per line is written as soon as each fix is read)
+"""
+
+import sys
+import json
+import argparse
+from match_engine import d
+from spatial_index import SphereIndex
+from csv_points import read_column_pairs
+
+DEFAULT_REANCHOR_KM = 1.0
+
+# The candidate set is trusted only when its best match is this much inside the bound
+BOUND_MARGIN = 1e-9
+
+class TrajectoryMatcher:
+    """
+    Matches fixes one at a time, keeping a candidate set per vehicle.
+    """
+
+    def __init__(self, index, reanchor_km=DEFAULT_REANCHOR_KM):
+        if index.size == 0:
+            raise ValueError("reference set is empty")
+        self.index = index
+        self.reanchor_km = reanchor_km
+        self.points = index.points.tolist()
+        self._vehicles = {}
+        self.stats = {"fixes": 0, "reanchors": 0, "candidates": 0}
+
+    def _anchor(self, vehicle, lat, lon):
+        indices, distances = self.index.query([[lat, lon]], k=1)
+        radius = float(distances[0, 0]) + 2 * self.reanchor_km
+        within, _ = self.index.query_radius([[lat, lon]], radius)[0]
+        # Sorted by index so the first of several equally close points wins, like the other engines
+        candidates = sorted(within.tolist())
+        self._vehicles[vehicle] = (lat, lon, radius, candidates)
+        self.stats["reanchors"] += 1
+        return int(indices[0, 0]), float(distances[0, 0])
+
+    def match(self, lat, lon, vehicle=None):
+        """
+        Return (reference index, distance in km) of the nearest reference point to one fix.
+        """
+        self.stats["fixes"] += 1
+        state = self._vehicles.get(vehicle)
+        if state is None:
+            return self._anchor(vehicle, lat, lon)
+        anchor_lat, anchor_lon, radius, candidates = state
+        moved = d(anchor_lat, anchor_lon, lat, lon)
+        if moved >= radius:
+            return self._anchor(vehicle, lat, lon)
+        points = self.points
+        best = float("inf")
+        best_j = -1
+        for j in candidates:
+            dist = d(lat, lon, points[j][0], points[j][1])
+            if dist < best:
+                best = dist
+                best_j = j
+        self.stats["candidates"] += len(candidates)
+        if best < (radius - moved) * (1 - BOUND_MARGIN):
+            return best_j, best
+        return self._anchor(vehicle, lat, lon)
+
+    def forget(self, vehicle=None):
+        """
+        Drop a vehicle's candidate set, e.g. when its trip ends.
+        """
+        self._vehicles.pop(vehicle, None)
+
+    def stream(self, fixes):
+        """
+        Yield (reference index, distance in km) for each fix as it arrives.
+        A fix is [lat, lon] or (lat, lon, vehicle).
+        """
+        for fix in fixes:
+            yield self.match(fix[0], fix[1], fix[2] if len(fix) > 2 else None)
+
+def parse_fix(line):
+    # {"lat", "lon", "vehicle"?, "id"?} or [lat, lon]; returns (lat, lon, vehicle, message)
+    message = json.loads(line)
+    if isinstance(message, dict):
+        lat, lon = message["lat"], message["lon"]
+        vehicle = message.get("vehicle")
+    elif isinstance(message, list) and len(message) == 2:
+        lat, lon = message
+        vehicle = None
+        message = {}
+    else:
+        raise ValueError("a fix must be {\"lat\", \"lon\"} or [lat, lon]")
+    lat = float(lat)
+    lon = float(lon)
+    if vehicle is not None and not isinstance(vehicle, (str, int)):
+        raise ValueError("vehicle must be a string or number")
+    return lat, lon, vehicle, message
+
+def run_stream(matcher, stdin=sys.stdin, stdout=sys.stdout):
+    # One JSON match per input line, flushed right away so real-time feeds see each fix matched
+    points = matcher.points
+    for line in stdin:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            lat, lon, vehicle, message = parse_fix(line)
+            j, dist = matcher.match(lat, lon, vehicle)
+            reply = {"point": [lat, lon], "index": j, "ref": points[j], "distance_km": dist}
+            for key in ("id", "vehicle"):
+                if key in message:
+                    reply[key] = message[key]
+        except (ValueError, KeyError, TypeError) as e:
+            reply = {"error": f"Invalid fix: {e}"}
+        stdout.write(json.dumps(reply) + "\n")
+        stdout.flush()
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Match a stream of GPS fixes read from stdin.")
+    parser.add_argument("ref_file", help="CSV file with the reference points")
+    parser.add_argument("col1", type=int, help="latitude column (0-based)")
+    parser.add_argument("col2", type=int, help="longitude column (0-based)")
+    parser.add_argument("--reanchor-km", type=float, default=DEFAULT_REANCHOR_KM,
+                        help="how far a vehicle may roughly move before a full index search")
+    args = parser.parse_args(argv[1:])
+    if args.reanchor_km <= 0:
+        parser.error("--reanchor-km must be positive")
+    points, _ = read_column_pairs(args.ref_file, [(args.col1, args.col2)])
+    matcher = TrajectoryMatcher(SphereIndex().build(points[0]), args.reanchor_km)
+    run_stream(matcher)
+    print(json.dumps(matcher.stats), file=sys.stderr)
+
+if __name__ == "__main__":
+    main(sys.argv)
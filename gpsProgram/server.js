@@ -3,15 +3,17 @@ const multer = require('multer');
 const cors = require('cors');
 const path = require('path');
 const fs = require('fs');
-const { exec } = require('child_process');
+const { spawn } = require('child_process');
+const readline = require('readline');
 const bodyParser = require('body-parser');
 
 const app = express();
 const upload = multer({ dest: 'uploads/' });
 
 app.use(cors());
-app.use(express.json());
-app.use(bodyParser.json());
+// Bulk "points1"/"points2" arrays can be far larger than the default 100kb body limit
+app.use(express.json({ limit: '50mb' }));
+app.use(bodyParser.json({ limit: '50mb' }));
 app.use(express.static('uploads'));
 
 // Endpoint for file upload
@@ -22,33 +24,187 @@ app.post('/upload', upload.single('file'), (req, res) => {
     const newPath = path.join(__dirname, 'uploads', req.file.originalname);
     fs.renameSync(req.file.path, newPath);
     res.json({ filePath: `/uploads/${req.file.originalname}` });
+
+    // Parse the lat/lon columns and build their index now so the first /execute is served from the cache
+    sendToWorker({ preprocess: newPath }).then((reply) => {
+        if (reply.error) {
+            console.error(`Could not preprocess ${newPath}: ${reply.error}`);
+        }
+    });
 });
 
-// Endpoint to execute Python script
-app.post('/execute', (req, res) => {
-    const { file, columnIndex1A, columnIndex2A, columnIndex1B, columnIndex2B, manualEntry1, manualEntry2, useCSV1, useCSV2 } = req.body;
+// Long-lived Python matching worker (process_data.py --worker). It keeps parsed
+// CSV columns and spatial indexes in memory, so requests skip interpreter startup
+// and re-parsing. Requests and responses are newline-delimited JSON matched by id.
+let worker = null;
+let nextRequestId = 1;
+const pendingRequests = new Map();
+
+// Answer every request still waiting on the worker with an error and forget the worker,
+// so the next request starts a new one
+function failWorker(child, message) {
+    if (worker !== child) {
+        return; // already handled ('error' and 'exit' can both fire), and a new worker may own the requests now
+    }
+    console.error(`${message}, restarting`);
+    for (const pending of pendingRequests.values()) {
+        pending.resolve({ error: message });
+    }
+    pendingRequests.clear();
+    worker = null;
+}
+
+function startWorker() {
+    const child = spawn('python3', ['./scripts/process_data.py', '--worker'], { cwd: __dirname });
+    worker = child;
+    readline.createInterface({ input: child.stdout }).on('line', (line) => {
+        let reply;
+        try {
+            reply = JSON.parse(line);
+        } catch (err) {
+            console.error(`Unexpected output from Python worker: ${line}`);
+            return;
+        }
+        const pending = pendingRequests.get(reply.id);
+        if (!pending) {
+            return;
+        }
+        // {"id", "chunk"} lines are partial jsonl output; the request stays pending until its final reply
+        if (reply.chunk !== undefined) {
+            if (pending.onChunk) {
+                pending.onChunk(reply.chunk);
+            }
+            return;
+        }
+        pendingRequests.delete(reply.id);
+        pending.resolve(reply);
+    });
+    child.stderr.on('data', (data) => console.error(`Python worker stderr: ${data}`));
+    child.on('exit', (code) => failWorker(child, `Python worker exited with code ${code}`));
+    // Without these an 'error' event (python3 missing, EPIPE after the worker died) would crash the server
+    child.on('error', (err) => failWorker(child, `Python worker failed: ${err.message}`));
+    child.stdin.on('error', (err) => failWorker(child, `Could not write to the Python worker: ${err.message}`));
+}
+
+function sendToWorker(message, onChunk) {
+    if (!worker) {
+        startWorker();
+    }
+    return new Promise((resolve) => {
+        const id = nextRequestId++;
+        pendingRequests.set(id, { resolve, onChunk });
+        worker.stdin.write(JSON.stringify({ ...message, id }) + '\n');
+    });
+}
+
+// Client-supplied reference databases must stay inside uploads/: the worker may rebuild
+// (overwrite) the file, so "../", absolute paths and symlinks out of the directory are refused
+const UPLOADS_DIR = path.join(__dirname, 'uploads');
+
+function resolveUploadPath(relativePath) {
+    const resolved = path.resolve(__dirname, String(relativePath));
+    let real;
+    try {
+        real = path.join(fs.realpathSync(path.dirname(resolved)), path.basename(resolved));
+    } catch (err) {
+        return null; // the directory doesn't exist
+    }
+    return real.startsWith(fs.realpathSync(UPLOADS_DIR) + path.sep) ? real : null;
+}
+
+class BadRequest extends Error {}
+
+function toWorkerRequest(body) {
+    const { file, columnIndex1A, columnIndex2A, columnIndex1B, columnIndex2B, manualEntry1, manualEntry2, useCSV1, useCSV2 } = body;
+    // Optional query mode: "nearest" (default), "knn" with k, or "radius" with radius_km,
+    // the number of worker processes for large inputs, and the matching engine
+    // "output": "jsonl" streams one JSON record per query point instead of the text response
+    const { mode, k, radius_km, workers, engine, output } = body;
+    // Optional bulk input: "points1"/"points2" arrays of [lat, lon] replace manualEntry1/manualEntry2
+    const { points1, points2 } = body;
+    // Optional trace simplification before matching: "simplify" ("dp" or "decimate") and "tolerance_m"
+    const { simplify, tolerance_m } = body;
+    // "timing": true makes the worker reply with wall/CPU time and peak RSS per phase, logged below
+    const { timing } = body;
+    // Optional shared reference database: "ref_db" (e.g. "uploads/refs.db") holds array 2 in a SQLite R*Tree
+    const refDb = body.ref_db ? resolveUploadPath(body.ref_db) : undefined;
+    if (refDb === null) {
+        throw new BadRequest(`ref_db must be a file inside uploads/: ${body.ref_db}`);
+    }
+    // Optional extra reference sets matched in the same run: "references": [{ name, file, columns: [lat, lon] }],
+    // where a missing file means the request's file
+    const references = Array.isArray(body.references)
+        ? body.references.map((ref) => ({ ...ref, file: ref.file ? path.join(__dirname, ref.file) : undefined }))
+        : undefined;
 
     // Ensure file is passed correctly and resolve the full path
-    const absoluteFilePath = path.join(__dirname, file); // Using path.join instead of path.resolve
+    const absoluteFilePath = file ? path.join(__dirname, file) : ''; // Using path.join instead of path.resolve
     console.log("Resolved absolute file path being passed to Python:", absoluteFilePath);
 
-    const command = `python3 ./scripts/process_data.py "${absoluteFilePath}" "${columnIndex1A}" "${columnIndex2A}" "${columnIndex1B}" "${columnIndex2B}" "${manualEntry1}" "${manualEntry2}" ${useCSV1} ${useCSV2}`;
+    return { file: absoluteFilePath, columnIndex1A, columnIndex2A, columnIndex1B, columnIndex2B, manualEntry1, manualEntry2, useCSV1, useCSV2, mode, k, radius_km, workers, engine, output, points1, points2, simplify, tolerance_m, ref_db: refDb, references, timing };
+}
 
-    exec(command, (error, stdout, stderr) => {
-        if (error) {
-            console.error(`Error executing Python script: ${error.message}`);
-            return res.status(500).send({ response: `Error executing Python script: ${error.message}` });
+// Endpoint to execute Python script
+app.post('/execute', async (req, res) => {
+    let request;
+    try {
+        request = toWorkerRequest(req.body);
+    } catch (err) {
+        if (err instanceof BadRequest) {
+            return res.status(400).send({ response: err.message });
         }
-
-        if (stderr) {
-            console.error(`stderr: ${stderr}`);
-            return res.status(500).send({ response: stderr });
+        throw err;
+    }
+    if (req.body.output === 'jsonl') {
+        // Forward the worker's jsonl chunks as they arrive, without parsing the records
+        res.type('application/x-ndjson');
+        const reply = await sendToWorker(request, (chunk) => res.write(chunk));
+        if (reply.error) {
+            console.error(`Error executing Python script: ${reply.error}`);
+            if (!res.headersSent) {
+                return res.status(500).send(JSON.stringify({ error: reply.error }) + '\n');
+            }
+            res.write(JSON.stringify({ error: reply.error }) + '\n');
         }
+        return res.end();
+    }
+    const reply = await sendToWorker(request);
+    if (reply.error) {
+        console.error(`Error executing Python script: ${reply.error}`);
+        return res.status(500).send({ response: `Error executing Python script: ${reply.error}` });
+    }
+    if (reply.timing) {
+        console.log('Python phase timing:', JSON.stringify(reply.timing));
+    }
+    if (reply.result_cache) {
+        // Whether the worker answered from its result cache; the counters are in the worker reply
+        res.set('X-Result-Cache', reply.result_cache.hit ? 'hit' : 'miss');
+    }
+    res.json({ response: reply.response });
+});
 
-        res.json({ response: stdout });
+// Endpoint to execute several matching requests in one worker round trip
+app.post('/execute/batch', async (req, res) => {
+    let requests;
+    try {
+        requests = (req.body.requests || []).map((body, i) => ({ ...toWorkerRequest(body), id: i }));
+    } catch (err) {
+        if (err instanceof BadRequest) {
+            return res.status(400).send({ response: err.message });
+        }
+        throw err;
+    }
+    const reply = await sendToWorker({ requests });
+    if (reply.error) {
+        return res.status(500).send({ response: `Error executing Python script: ${reply.error}` });
+    }
+    res.json({
+        responses: reply.responses.map((r) => (r.error ? { error: r.error } : { response: r.response })),
     });
 });
 
+startWorker();
+
 app.listen(8000, () => {
     console.log('Server running on port http://localhost:8000');
 });
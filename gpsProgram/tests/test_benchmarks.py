@@ -0,0 +1,37 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))) #set benchmarks path
+
+import bench_matching
+
+class TestBenchMatching(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.output = os.path.join(self.tmp, "results.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_writes_results_and_compares(self):
+        argv = ["bench_matching.py", "--sizes", "40", "80", "--repeat", "1", "--output", self.output]
+        self.assertEqual(bench_matching.main(argv), 0)
+        with open(self.output) as f:
+            report = json.load(f)
+        phases = {bench_matching.key_of(r) for r in report["results"]}
+        for phase in ("csv_parse", "convert", "match/matrix", "match/index", "match/loop", "format/nearest", "end_to_end"):
+            self.assertIn(phase, phases)
+        self.assertIn("match/matrix", report["scaling"])
+
+        # Compared with itself nothing regressed; against a much faster run everything did
+        self.assertEqual(bench_matching.compare(report["results"], report, 1.5), [])
+        faster = {"results": [dict(r, seconds=0.0) for r in report["results"]]}
+        slow = [dict(r, seconds=1.0) for r in report["results"]]
+        self.assertEqual(len(bench_matching.compare(slow, faster, 1.5)), len(slow))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts'))) #set scripts path
+
+from csv_points import read_column_pairs
+
+AIRPORTS_CSV = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'uploads', 'iata-icao.csv'))
+
+class TestReadColumnPairs(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.csv_path = os.path.join(self.tmpdir, "fixes.csv")
+        with open(self.csv_path, "w") as f:
+            f.write('"id","lat","lon","alt"\n'
+                    '1,"42.5","-71.25",10\n'
+                    '2,abc,-71.0,11\n'
+                    '3,41.0,-70.0\n'
+                    '\n'
+                    '4,nan,-70.0,12\n'
+                    '5," 40.0 ",-69.5,inf\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_several_pairs_in_one_pass(self):
+        (lat_lon, lon_alt), (stats1, stats2) = read_column_pairs(self.csv_path, [(1, 2), (2, 3)])
+        self.assertEqual(lat_lon.tolist(), [[42.5, -71.25], [41.0, -70.0], [40.0, -69.5]])
+        self.assertEqual(lon_alt.tolist(), [[-71.25, 10.0], [-71.0, 11.0], [-70.0, 12.0]])
+        self.assertEqual(stats1, {"rows": 7, "header_rows": 1, "short_rows": 1, "invalid_rows": 2, "points": 3})
+        self.assertEqual(stats2, {"rows": 7, "header_rows": 1, "short_rows": 2, "invalid_rows": 1, "points": 3})
+
+    def test_file_without_header(self):
+        with open(self.csv_path, "w") as f:
+            f.write("1.5,2.5\n3.5,4.5\n")
+        points, stats = read_column_pairs(self.csv_path, [(0, 1)])
+        self.assertEqual(points[0].tolist(), [[1.5, 2.5], [3.5, 4.5]])
+        self.assertEqual(stats[0]["header_rows"], 0)
+
+    def test_header_is_decided_per_pair(self):
+        # No header: row 1 is data for the numeric pair even though column 2 holds text
+        with open(self.csv_path, "w") as f:
+            f.write("1.5,2.5,north\n3.5,4.5,south\n")
+        points, stats = read_column_pairs(self.csv_path, [(0, 1), (1, 2)])
+        self.assertEqual(points[0].tolist(), [[1.5, 2.5], [3.5, 4.5]])
+        self.assertEqual([s["header_rows"] for s in stats], [0, 1])
+        self.assertEqual(stats[1]["invalid_rows"], 1)
+
+    def test_quoted_airport_file(self):
+        points, stats = read_column_pairs(AIRPORTS_CSV, [(5, 6), (6, 5)])
+        self.assertEqual(points[0][0].tolist(), [24.2617, 55.6092])
+        self.assertEqual(points[1][0].tolist(), [55.6092, 24.2617])
+        self.assertEqual(stats[0]["header_rows"], 1)
+        self.assertEqual(stats[0]["points"] + stats[0]["invalid_rows"] + stats[0]["short_rows"], stats[0]["rows"] - 1)
+
+if __name__ == "__main__":
+    unittest.main()
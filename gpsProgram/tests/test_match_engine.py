@@ -0,0 +1,68 @@
+import os
+import sys
+import random
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts'))) #set scripts path
+
+from match_engine import d, nearest_neighbors
+from process_data import two_arrays, read_csv_columns
+
+AIRPORTS_CSV = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'uploads', 'iata-icao.csv'))
+
+def brute_force(arr1, arr2):
+    # The original double loop, used as the reference result
+    matches = []
+    for p in arr1:
+        best = float('inf')
+        best_j = None
+        for j, q in enumerate(arr2):
+            dist = d(p[0], p[1], q[0], q[1])
+            if dist < best:
+                best = dist
+                best_j = j
+        matches.append((best_j, best))
+    return matches
+
+class TestMatchEngine(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(530)
+        self.queries = [[rng.uniform(-90, 90), rng.uniform(-180, 180)] for _ in range(300)]
+        self.refs = [[rng.uniform(-90, 90), rng.uniform(-180, 180)] for _ in range(400)]
+
+    def test_matches_brute_force(self):
+        indices, distances = nearest_neighbors(self.queries, self.refs)
+        expected = brute_force(self.queries, self.refs)
+        self.assertEqual(list(zip(indices.tolist(), distances.tolist())), expected)
+
+    def test_small_chunks_give_same_result(self):
+        full = nearest_neighbors(self.queries, self.refs)
+        chunked = nearest_neighbors(self.queries, self.refs, chunk_pairs=1000)
+        self.assertEqual(full[0].tolist(), chunked[0].tolist())
+        self.assertEqual(full[1].tolist(), chunked[1].tolist())
+
+    def test_ties_keep_first_reference(self):
+        # Both references are exactly 1 degree of longitude away on the equator
+        indices, _ = nearest_neighbors([[0, 0]], [[0, 1], [0, -1], [0, 1]])
+        self.assertEqual(indices.tolist(), [0])
+
+    def test_empty_inputs(self):
+        indices, distances = nearest_neighbors([], self.refs)
+        self.assertEqual(len(indices), 0)
+        self.assertEqual(len(distances), 0)
+        with self.assertRaises(ValueError):
+            nearest_neighbors(self.queries, [])
+
+    def test_two_arrays_returns_points(self):
+        arr1 = [[52.5200, 13.4050], [45.5, -122.7], [45, -122.7]]
+        arr2 = [[44, -123], [48.8566, 2.3522]]
+        self.assertEqual(two_arrays(arr1, arr2), [[48.8566, 2.3522], [44, -123], [44, -123]])
+
+    def test_airport_csv(self):
+        airports = read_csv_columns(AIRPORTS_CSV, 5, 6)
+        queries = self.queries[:20]
+        indices, distances = nearest_neighbors(queries, airports)
+        self.assertEqual(list(zip(indices.tolist(), distances.tolist())), brute_force(queries, airports))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import os
+import sys
+import random
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts'))) #set scripts path
+
+from match_engine import nearest_neighbors
+from spatial_index import SphereIndex
+from parallel_match import parallel_query
+from process_data import two_arrays, query_matches
+
+class TestParallelQuery(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(7)
+        self.queries = [[rng.uniform(-90, 90), rng.uniform(-180, 180)] for _ in range(3000)]
+        self.refs = [[rng.uniform(-90, 90), rng.uniform(-180, 180)] for _ in range(800)]
+
+    def test_matrix_matches_serial(self):
+        # Small shards so several tasks finish out of order
+        indices, distances = parallel_query(self.queries, self.refs, workers=2, shard_size=250)
+        expected_indices, expected_distances = nearest_neighbors(self.queries, self.refs)
+        self.assertEqual(indices[:, 0].tolist(), expected_indices.tolist())
+        self.assertEqual(distances[:, 0].tolist(), expected_distances.tolist())
+
+    def test_index_knn_matches_serial(self):
+        index = SphereIndex().build(self.refs)
+        indices, distances = parallel_query(self.queries, self.refs, workers=2, engine="index",
+                                            k=3, index=index, shard_size=400)
+        expected_indices, expected_distances = index.query(self.queries, k=3)
+        self.assertEqual(indices.tolist(), expected_indices.tolist())
+        self.assertEqual(distances.tolist(), expected_distances.tolist())
+
+    def test_empty_inputs(self):
+        indices, distances = parallel_query([], self.refs, workers=2)
+        self.assertEqual(indices.shape, (0, 1))
+        with self.assertRaises(ValueError):
+            parallel_query(self.queries, [], workers=2)
+        with self.assertRaises(ValueError):
+            parallel_query(self.queries, self.refs, workers=2, k=2)
+
+    def test_process_data_workers(self):
+        for engine in ("matrix", "index"):
+            self.assertEqual(two_arrays(self.queries, self.refs, engine, workers=2),
+                             two_arrays(self.queries, self.refs, engine))
+        parallel = query_matches(self.queries, self.refs, "knn", k=2, workers=2)
+        serial = query_matches(self.queries, self.refs, "knn", k=2)
+        self.assertEqual([(i.tolist(), dist.tolist()) for i, dist in parallel],
+                         [(i.tolist(), dist.tolist()) for i, dist in serial])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import os
+import sys
+import random
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts'))) #set scripts path
+
+from point_cache import PointCache
+from spatial_index import SphereIndex
+from csv_points import read_column_pairs
+from process_data import read_csv_columns, detect_coordinate_columns
+
+class TestPointCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tmpdir, "cache")
+        self.csv_path = os.path.join(self.tmpdir, "points.csv")
+        rng = random.Random(4)
+        with open(self.csv_path, "w") as f:
+            f.write('"name","latitude","longitude"\n')
+            for i in range(200):
+                f.write(f'"p{i}","{rng.uniform(-90, 90):.4f}","{rng.uniform(-180, 180):.4f}"\n')
+        self.reads = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def reader(self, path, pairs):
+        self.reads += 1
+        return read_column_pairs(path, pairs)
+
+    def test_points_are_parsed_once_and_memory_mapped(self):
+        cache = PointCache(self.cache_dir)
+        first = cache.points(self.csv_path, 1, 2, self.reader)
+        # A new PointCache stands in for a later process_data.py run
+        second = PointCache(self.cache_dir).points(self.csv_path, 1, 2, self.reader)
+        self.assertEqual(self.reads, 1)
+        self.assertIsInstance(second, np.memmap)
+        self.assertEqual(second.tolist(), read_csv_columns(self.csv_path, 1, 2))
+        self.assertEqual(first.tolist(), second.tolist())
+
+    def test_saved_index_gives_same_matches(self):
+        queries = [[10.0, 10.0], [-45.0, 170.0], [80.0, -20.0]]
+        built = PointCache(self.cache_dir).index(self.csv_path, 1, 2, self.reader)
+        loaded = PointCache(self.cache_dir).index(self.csv_path, 1, 2, self.reader)
+        self.assertEqual(self.reads, 1)
+        for a, b in zip(built.query(queries, k=3), loaded.query(queries, k=3)):
+            self.assertEqual(a.tolist(), b.tolist())
+
+    def test_missing_pairs_are_read_together(self):
+        cache = PointCache(self.cache_dir)
+        cache.points(self.csv_path, 1, 2, self.reader)
+        points, stats = cache.points_many(self.csv_path, [(1, 2), (2, 1), (1, 1)], self.reader)
+        self.assertEqual(self.reads, 2)
+        self.assertEqual(points[1].tolist(), [[b, a] for a, b in points[0].tolist()])
+        self.assertEqual([s["header_rows"] for s in stats], [1, 1, 1])
+
+    def test_changed_contents_get_a_new_entry(self):
+        cache = PointCache(self.cache_dir)
+        before = cache.entry_dir(self.csv_path, 1, 2)
+        with open(self.csv_path, "a") as f:
+            f.write('"extra","1.5","2.5"\n')
+        self.assertNotEqual(before, cache.entry_dir(self.csv_path, 1, 2))
+        self.assertEqual(len(cache.points(self.csv_path, 1, 2, self.reader)), 201)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = PointCache(self.cache_dir)
+        cache.points(self.csv_path, 1, 2, self.reader)
+        entry_size = cache.size_bytes()
+        cache.max_bytes = 2 * entry_size
+        oldest = cache.entry_dir(self.csv_path, 1, 2)
+        os.utime(oldest, (0, 0))
+        cache.points(self.csv_path, 2, 1, self.reader)
+        cache.points(self.csv_path, 1, 1, self.reader)
+        self.assertFalse(os.path.exists(oldest))
+        self.assertLessEqual(cache.size_bytes(), 2 * entry_size)
+
+    def test_small_cache_keeps_every_requested_pair(self):
+        # The cache can't hold these pairs at all, but one call still gets all of them
+        cache = PointCache(self.cache_dir, max_bytes=1000)
+        points, _ = cache.points_many(self.csv_path, [(1, 2), (2, 1)], self.reader)
+        self.assertEqual([len(p) for p in points], [200, 200])
+        cache.max_bytes = 8000
+        cache.points(self.csv_path, 1, 1, self.reader)
+        os.utime(cache.entry_dir(self.csv_path, 1, 1), (0, 0))
+        points, _ = cache.points_many(self.csv_path, [(1, 1), (2, 2), (2, 1)], self.reader)
+        self.assertEqual([len(p) for p in points], [200, 200, 200])
+
+    def test_incomplete_entry_is_read_again(self):
+        cache = PointCache(self.cache_dir)
+        cache.points(self.csv_path, 1, 2, self.reader)
+        os.remove(os.path.join(cache.entry_dir(self.csv_path, 1, 2), "stats.json"))  # user-004 layout
+        points, stats = cache.points_many(self.csv_path, [(1, 2)], self.reader)
+        self.assertEqual((self.reads, len(points[0]), stats[0]["header_rows"]), (2, 200, 1))
+
+    def test_index_save_and_load(self):
+        points = read_csv_columns(self.csv_path, 1, 2)
+        index = SphereIndex(leaf_size=4).build(points)
+        index.save(self.tmpdir)
+        loaded = SphereIndex.load(self.tmpdir)
+        self.assertEqual(loaded.leaf_size, 4)
+        self.assertEqual(index.query(points[:10], k=2)[0].tolist(), loaded.query(points[:10], k=2)[0].tolist())
+
+    def test_detect_coordinate_columns(self):
+        self.assertEqual(detect_coordinate_columns(self.csv_path), [(1, 2)])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+import io
+import os
+import sys
+import json
+import shutil
+import tempfile
+import contextlib
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts'))) #set scripts path
+
+from point_input import parse_points, load_points, points_from_records
+from process_data import parse_args, run_request, run_worker, parse_manual_entry
+
+class TestPointInput(unittest.TestCase):
+    def test_json_array(self):
+        points, stats = parse_points("[[1.5, 2], [3, -4.25]]")
+        self.assertEqual(points.tolist(), [[1.5, 2.0], [3.0, -4.25]])
+        self.assertEqual(stats, {"records": 2, "points": 2, "invalid": 0})
+
+    def test_ndjson_and_objects(self):
+        text = '[1, 2]\n\n{"lat": 3, "lon": 4}\n{"lat": 5}\n[6, "x"]\n[7, 8, 9]\n[NaN, 1]\n'
+        points, stats = parse_points(text)
+        self.assertEqual(points.tolist(), [[1.0, 2.0], [3.0, 4.0]])
+        self.assertEqual(stats, {"records": 6, "points": 2, "invalid": 4})
+        # A single NDJSON line is one record
+        self.assertEqual(parse_points("[1, 2]")[0].tolist(), [[1.0, 2.0]])
+        self.assertEqual(parse_points('{"lat": 1, "lon": 2}')[0].tolist(), [[1.0, 2.0]])
+
+    def test_booleans_are_not_coordinates(self):
+        # Both the all-pairs fast path and the per-record path
+        points, stats = parse_points("[[true, 1], [1, 2], [3, false]]")
+        self.assertEqual(points.tolist(), [[1.0, 2.0]])
+        self.assertEqual(stats, {"records": 3, "points": 1, "invalid": 2})
+        points, stats = parse_points('[[true, 1], {"lat": 1, "lon": 2}, {"lat": false, "lon": 4}]')
+        self.assertEqual(points.tolist(), [[1.0, 2.0]])
+        self.assertEqual(stats["invalid"], 2)
+
+    def test_empty_and_invalid(self):
+        points, stats = parse_points("  \n")
+        self.assertEqual(points.shape, (0, 2))
+        self.assertEqual(stats["records"], 0)
+        with self.assertRaises(ValueError):
+            parse_points("[[1, 2]")
+        with self.assertRaises(ValueError):
+            points_from_records({"lat": 1})
+
+    def test_load_from_stdin(self):
+        points, _ = load_points("-", io.StringIO("[[1, 2]]"))
+        self.assertEqual(points.tolist(), [[1.0, 2.0]])
+
+    def test_manual_entry_still_accepts_python_syntax(self):
+        self.assertEqual(parse_manual_entry("[[1, 2], [3, 'x'], (5, 6)]", 1), [[1.0, 2.0]])
+        self.assertEqual(parse_manual_entry("[[1, 2], [3, 4]]", 1), [[1.0, 2.0], [3.0, 4.0]])
+
+class TestBulkRequests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.input1 = os.path.join(self.tmpdir, "points1.ndjson")
+        with open(self.input1, "w") as f:
+            f.write("[42.0, -71.0]\n[48.0, 2.0]\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_input_files_replace_arguments(self):
+        input2 = os.path.join(self.tmpdir, "points2.json")
+        with open(input2, "w") as f:
+            json.dump([[42.3643, -71.0052], [49.0097, 2.5479], ["bad", 0]], f)
+        args = parse_args(["process_data.py", "--input1", self.input1, "--input2", input2, "--no-cache"])
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            info = run_request(args)
+        self.assertIn("Output Array: [[42.3643, -71.0052], [49.0097, 2.5479]]", output.getvalue())
+        self.assertEqual(info["input_stats"][1], {"records": 3, "points": 2, "invalid": 1})
+
+    def test_worker_inline_points(self):
+        defaults = parse_args(["process_data.py", "--worker", "--no-cache"])
+        request = {"id": 1, "points1": [[42.0, -71.0]], "input2": self.input1, "useCSV1": False, "useCSV2": False}
+        stdout = io.StringIO()
+        run_worker(defaults, io.StringIO(json.dumps(request) + "\n"), stdout)
+        reply = json.loads(stdout.getvalue())
+        self.assertIn("Output Array: [[42.0, -71.0]]", reply["response"])
+        self.assertEqual(reply["input_stats"][0]["points"], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import os
+import sys
+import random
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts'))) #set scripts path
+
+from match_engine import nearest_neighbors
+from prefilter import prefilter_nearest
+from process_data import two_arrays
+
+class TestPrefilter(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(88)
+        self.queries = [[rng.uniform(-90, 90), rng.uniform(-180, 180)] for _ in range(300)]
+        self.refs = [[rng.uniform(-90, 90), rng.uniform(-180, 180)] for _ in range(400)]
+        # Poles and the antimeridian are where a lat/lon box is easiest to get wrong
+        self.queries += [[89.99, 0], [-89.99, 120], [0, 180], [10, -179.999], [-45, 179.5]]
+        self.refs += [[89.9, 179], [-89.95, -60], [0.1, -179.95], [10, 179.999], [-45, -179.8]]
+
+    def test_matches_matrix_engine(self):
+        indices, distances, _ = prefilter_nearest(self.queries, self.refs)
+        expected_indices, expected_distances = nearest_neighbors(self.queries, self.refs)
+        self.assertEqual(indices.tolist(), expected_indices.tolist())
+        self.assertEqual(distances.tolist(), expected_distances.tolist())
+
+    def test_clustered_and_far_references(self):
+        # A tight cluster seen from far away (seeds found by widening the search), and refs on one parallel
+        rng = random.Random(7)
+        cluster = [[40.5 + rng.uniform(0, 1e-4), -73.5 + rng.uniform(0, 1e-4)] for _ in range(200)]
+        parallel = [[0, rng.uniform(-180, 180)] for _ in range(200)]
+        for refs in (cluster, parallel, [[12.5, 40.0]] * 3):
+            for chunk_pairs in (10**6, 500):
+                indices, distances, _ = prefilter_nearest(self.queries, refs, chunk_pairs=chunk_pairs)
+                expected_indices, expected_distances = nearest_neighbors(self.queries, refs)
+                self.assertEqual(indices.tolist(), expected_indices.tolist())
+                self.assertEqual(distances.tolist(), expected_distances.tolist())
+
+    def test_ties_keep_first_index(self):
+        refs = [[10, 10], [0, 0], [0, 0], [-10, -10]]
+        indices, _, _ = prefilter_nearest([[0.5, 0.5], [0, 0]], refs)
+        self.assertEqual(indices.tolist(), [1, 1])
+
+    def test_stats(self):
+        _, _, full = prefilter_nearest(self.queries, self.refs)
+        _, _, chunked = prefilter_nearest(self.queries, self.refs, chunk_pairs=1000)
+        self.assertEqual(full, chunked)
+        self.assertEqual(full["pairs"], len(self.queries) * len(self.refs))
+        self.assertEqual(full["box_rejected"] + full["haversine"], full["pairs"])
+        self.assertGreater(full["box_rejected"], full["pairs"] // 2)
+        self.assertGreaterEqual(full["refined"], len(self.queries))
+
+    def test_empty_inputs(self):
+        indices, _, stats = prefilter_nearest([], self.refs)
+        self.assertEqual(len(indices), 0)
+        self.assertEqual(stats["pairs"], 0)
+        with self.assertRaises(ValueError):
+            prefilter_nearest(self.queries, [])
+
+    def test_two_arrays_engine(self):
+        stats = {}
+        self.assertEqual(two_arrays(self.queries, self.refs, "prefilter", stats=stats),
+                         two_arrays(self.queries, self.refs, "matrix"))
+        self.assertEqual(stats["pairs"], len(self.queries) * len(self.refs))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,176 @@
+import io
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+import contextlib
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts'))) #set scripts path
+
+from process_data import parse_args, run_worker, run_request, BINARY_HEADER, BINARY_RECORD
+from csv_points import read_column_pairs
+from dataset_store import DatasetStore
+
+class TestWorker(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.csv_path = os.path.join(self.tmpdir, "points.csv")
+        with open(self.csv_path, "w") as f:
+            f.write("name,lat,lon\nBOS,42.3643,-71.0052\nCDG,49.0097,2.5479\n")
+        self.defaults = parse_args(["process_data.py", "--worker", "--cache-dir", os.path.join(self.tmpdir, "cache")])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def request(self, **fields):
+        base = {"file": self.csv_path, "columnIndex1A": "", "columnIndex2A": "",
+                "columnIndex1B": 1, "columnIndex2B": 2, "manualEntry1": "", "manualEntry2": "",
+                "useCSV1": False, "useCSV2": True}
+        base.update(fields)
+        return base
+
+    def serve(self, *messages):
+        stdin = io.StringIO("".join(json.dumps(m) + "\n" for m in messages))
+        stdout = io.StringIO()
+        run_worker(self.defaults, stdin, stdout)
+        return [json.loads(line) for line in stdout.getvalue().splitlines()]
+
+    def test_single_request(self):
+        replies = self.serve(self.request(id=7, manualEntry1="[[42.0, -71.0]]"))
+        self.assertEqual(replies[0]["id"], 7)
+        self.assertIn("Output Array: [[42.3643, -71.0052]]", replies[0]["response"])
+
+    def test_both_csv_arrays(self):
+        replies = self.serve(self.request(id=1, useCSV1=True, columnIndex1A=1, columnIndex2A=2))
+        self.assertIn("Output Array: [[42.3643, -71.0052], [49.0097, 2.5479]]", replies[0]["response"])
+        stats = replies[0]["csv_stats"]
+        self.assertEqual([(s["header_rows"], s["points"]) for s in stats], [(1, 2), (1, 2)])
+
+    def test_knn_and_radius_modes(self):
+        replies = self.serve(self.request(id=1, manualEntry1="[[42.0, -71.0]]", mode="knn", k=2),
+                             self.request(id=2, manualEntry1="[[42.0, -71.0]]", mode="radius", radius_km=100))
+        knn = json.loads(replies[0]["response"].split("Output Matches: ")[1])
+        self.assertEqual([m["index"] for m in knn[0]["matches"]], [0, 1])
+        radius = json.loads(replies[1]["response"].split("Output Matches: ")[1])
+        self.assertEqual([m["index"] for m in radius[0]["matches"]], [0])
+
+    def test_batch_request_and_errors(self):
+        replies = self.serve({"id": "b", "requests": [
+            self.request(id=1, manualEntry1="[[48.0, 2.0]]"),
+            self.request(id=2, file=os.path.join(self.tmpdir, "missing.csv")),
+        ]})
+        responses = replies[0]["responses"]
+        self.assertIn("Output Array: [[49.0097, 2.5479]]", responses[0]["response"])
+        self.assertIn("FileNotFoundError", responses[1]["error"])
+
+    def test_jsonl_output_is_streamed(self):
+        replies = self.serve(self.request(id=3, manualEntry1="[[42.0, -71.0], [48.0, 2.0]]", output="jsonl"))
+        chunks = [r["chunk"] for r in replies[:-1]]
+        self.assertTrue(all(r["id"] == 3 for r in replies))
+        self.assertEqual(replies[-1]["response"], "")
+        records = [json.loads(line) for line in "".join(chunks).splitlines()]
+        self.assertEqual(records[0], {"mode": "nearest", "queries": 2, "references": 2})
+        self.assertEqual([(r["i"], r["index"], r["point"]) for r in records[1:]],
+                         [(0, 0, [42.3643, -71.0052]), (1, 1, [49.0097, 2.5479])])
+
+    def test_binary_output(self):
+        args = parse_args(["process_data.py", self.csv_path, "", "", "1", "2", "[[42.0, -71.0], [48.0, 2.0]]", "",
+                           "false", "true", "--mode", "knn", "--k", "2", "--output", "binary",
+                           "--cache-dir", os.path.join(self.tmpdir, "cache")])
+        chunks = []
+        run_request(args, emit=chunks.append)
+        data = b"".join(chunks)
+        self.assertEqual(BINARY_HEADER.unpack(data[:BINARY_HEADER.size]), (b"GPSM", 1, 2, 2))
+        records = np.frombuffer(data[BINARY_HEADER.size:], dtype=BINARY_RECORD).reshape(2, 2)
+        self.assertEqual(records["index"].tolist(), [[0, 1], [1, 0]])
+        self.assertLess(records["distance_km"][0, 0], records["distance_km"][0, 1])
+        # The worker only answers in JSON
+        replies = self.serve(self.request(id=4, manualEntry1="[[42.0, -71.0]]", output="binary"))
+        self.assertIn("error", replies[0])
+
+    def test_several_references(self):
+        depots = os.path.join(self.tmpdir, "depots.csv")
+        with open(depots, "w") as f:
+            f.write("id,lon,lat\nD1,2.35,48.85\nD2,-71.06,42.36\n")
+        references = [{"name": "airports", "columns": [1, 2]}, {"name": "depots", "file": depots, "columns": [2, 1]}]
+        replies = self.serve(self.request(id=1, manualEntry1="[[48.0, 2.0]]", useCSV2=False, references=references),
+                             self.request(id=2, manualEntry1="[[48.0, 2.0]]", references=references[1:], output="jsonl"))
+        response = replies[0]["response"]
+        self.assertIn("Output Array [airports]: [[49.0097, 2.5479]]", response)
+        self.assertIn("Output Array [depots]: [[48.85, 2.35]]", response)
+        self.assertNotIn("Invalid format", response)
+        self.assertEqual([(r["name"], r["points"]) for r in replies[0]["references"]], [("airports", 2), ("depots", 2)])
+        # Array 2 is matched too when it is given, then each reference set under its own header
+        records = [json.loads(line) for line in "".join(r["chunk"] for r in replies[1:-1]).splitlines()]
+        headers = [r for r in records if "mode" in r]
+        self.assertEqual([h.get("reference") for h in headers], ["array2", "depots"])
+        self.assertEqual([r["index"] for r in records if "index" in r], [1, 0])
+
+    def test_ref_option(self):
+        args = parse_args(["process_data.py", self.csv_path, "", "", "", "", "[[0, 0]]", "", "false", "false",
+                           "--ref", f"a={self.csv_path}:1:2", "--ref", ":2:1"])
+        self.assertEqual(args.references[0], {"name": "a", "file": self.csv_path, "columns": [1, 2]})
+        self.assertEqual(args.references[1], {"name": "2:1", "file": None, "columns": [2, 1]})
+        with self.assertRaises(SystemExit), contextlib.redirect_stderr(io.StringIO()):
+            parse_args(["process_data.py", "--input1", "-", "--ref", "a=points.csv:1"])
+        with self.assertRaises(SystemExit), contextlib.redirect_stderr(io.StringIO()):
+            parse_args(["process_data.py", "--input1", "-", "--ref", ":2:1"])
+
+    def test_invalid_json_keeps_worker_running(self):
+        stdin = io.StringIO("not json\n" + json.dumps(self.request(id=2, manualEntry1="[[0, 0]]")) + "\n")
+        stdout = io.StringIO()
+        run_worker(self.defaults, stdin, stdout)
+        replies = [json.loads(line) for line in stdout.getvalue().splitlines()]
+        self.assertIn("error", replies[0])
+        self.assertEqual(replies[1]["id"], 2)
+
+class TestDatasetStore(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.csv_path = os.path.join(self.tmpdir, "points.csv")
+        with open(self.csv_path, "w") as f:
+            f.write("1,2\n3,4\n")
+        self.reads = 0
+
+        def counting_reader(path, pairs):
+            self.reads += 1
+            return read_column_pairs(path, pairs)
+        self.store = DatasetStore(counting_reader, max_entries=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_parses_once(self):
+        self.assertEqual(self.store.points(self.csv_path, 0, 1).tolist(), [[1.0, 2.0], [3.0, 4.0]])
+        self.store.points(self.csv_path, 0, 1)
+        self.assertIs(self.store.index(self.csv_path, 0, 1), self.store.index(self.csv_path, 0, 1))
+        self.assertEqual(self.reads, 1)
+
+    def test_several_pairs_share_one_pass(self):
+        first, second = self.store.points_many(self.csv_path, [(0, 1), (1, 0)])
+        self.assertEqual(second.tolist(), [[2.0, 1.0], [4.0, 3.0]])
+        self.store.points(self.csv_path, 1, 0)
+        self.assertEqual(self.reads, 1)
+        self.assertEqual(self.store.stats(self.csv_path, 0, 1)["points"], 2)
+
+    def test_changed_file_is_parsed_again(self):
+        self.store.points(self.csv_path, 0, 1)
+        with open(self.csv_path, "a") as f:
+            f.write("5,6\n")
+        self.assertEqual(len(self.store.points(self.csv_path, 0, 1)), 3)
+        self.assertEqual(self.reads, 2)
+
+    def test_least_recently_used_entry_is_dropped(self):
+        self.store.points(self.csv_path, 0, 1)
+        self.store.points(self.csv_path, 1, 0)
+        self.store.points(self.csv_path, 0, 1)
+        self.store.points(self.csv_path, 1, 1)
+        self.assertEqual(len(self.store), 2)
+        self.store.points(self.csv_path, 0, 1)
+        self.assertEqual(self.reads, 3)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import unittest
+import contextlib
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts'))) #set scripts path
+
+from result_cache import ResultCache, fingerprint
+from process_data import parse_args, run_worker, run_request, pack_matches, unpack_matches
+
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_fingerprint(self):
+        points = np.array([[1.0, 2.0], [3.0, 4.0]])
+        self.assertEqual(fingerprint({"mode": "knn"}, points), fingerprint({"mode": "knn"}, points.copy()))
+        self.assertNotEqual(fingerprint({"mode": "knn"}, points), fingerprint({"mode": "knn"}, points[::-1]))
+        self.assertNotEqual(fingerprint({"mode": "knn"}, points), fingerprint({"mode": "radius"}, points))
+        self.assertNotEqual(fingerprint(points.ravel()), fingerprint(points))
+
+    def test_memory_lru(self):
+        cache = ResultCache(max_bytes=3 * 80)
+        for i in range(4):
+            cache.put(f"k{i}", {"indices": np.arange(10) + i})
+        self.assertIsNone(cache.get("k0"))
+        self.assertEqual(cache.get("k3")["indices"][0], 3)
+        self.assertEqual(cache.summary()["entries"], 3)
+        self.assertEqual((cache.stats["memory_hits"], cache.stats["misses"]), (1, 1))
+        # Results bigger than the whole tier are not kept
+        cache.put("big", {"indices": np.arange(100)})
+        self.assertIsNone(cache.get("big"))
+
+    def test_disk_tier_is_shared(self):
+        directory = os.path.join(self.tmpdir, "results")
+        ResultCache(cache_dir=directory).put("k", {"indices": np.array([4, 2]), "distances": np.array([0.5, 1.5])})
+        other = ResultCache(max_bytes=0, cache_dir=directory)
+        value = other.get("k")
+        self.assertEqual(value["indices"].tolist(), [4, 2])
+        self.assertEqual(other.stats["disk_hits"], 1)
+
+    def test_disk_eviction(self):
+        directory = os.path.join(self.tmpdir, "results")
+        cache = ResultCache(max_bytes=0, cache_dir=directory, disk_max_bytes=3000)
+        for i in range(5):
+            cache.put(f"k{i}", {"indices": np.arange(100)})
+            os.utime(os.path.join(directory, f"k{i}.npz"), (i, i))
+        self.assertEqual(sorted(os.listdir(directory)), ["k3.npz", "k4.npz"])
+
+    def test_pack_matches(self):
+        matches = [(np.array([3, 1]), np.array([0.1, 0.2])), (np.array([], dtype=np.intp), np.array([])),
+                   (np.array([7]), np.array([2.5]))]
+        unpacked = unpack_matches(pack_matches(matches))
+        self.assertEqual([(i.tolist(), dist.tolist()) for i, dist in unpacked],
+                         [(i.tolist(), dist.tolist()) for i, dist in matches])
+        self.assertEqual(unpack_matches(pack_matches([])), [])
+
+class TestCachedRequests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.csv_path = os.path.join(self.tmpdir, "points.csv")
+        with open(self.csv_path, "w") as f:
+            f.write("name,lat,lon\nBOS,42.3643,-71.0052\nCDG,49.0097,2.5479\n")
+        self.defaults = parse_args(["process_data.py", "--worker", "--cache-dir", os.path.join(self.tmpdir, "cache")])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def request(self, **fields):
+        base = {"file": self.csv_path, "columnIndex1A": "", "columnIndex2A": "",
+                "columnIndex1B": 1, "columnIndex2B": 2, "manualEntry1": "[[42.0, -71.0]]", "manualEntry2": "",
+                "useCSV1": False, "useCSV2": True}
+        base.update(fields)
+        return base
+
+    def serve(self, *messages):
+        stdin = io.StringIO("".join(json.dumps(m) + "\n" for m in messages))
+        stdout = io.StringIO()
+        run_worker(self.defaults, stdin, stdout)
+        return [json.loads(line) for line in stdout.getvalue().splitlines()]
+
+    def test_repeated_requests_hit(self):
+        replies = self.serve(self.request(id=1), self.request(id=2), self.request(id=3, mode="knn", k=2),
+                             self.request(id=4, mode="knn", k=2), self.request(id=5, manualEntry1="[[48.0, 2.0]]"))
+        self.assertEqual([r["result_cache"]["hit"] for r in replies], [False, True, False, True, False])
+        self.assertEqual(replies[0]["response"], replies[1]["response"])
+        self.assertEqual(replies[2]["response"], replies[3]["response"])
+        self.assertEqual(replies[-1]["result_cache"]["memory_hits"], 2)
+        self.assertIn("Output Array: [[49.0097, 2.5479]]", replies[-1]["response"])
+
+    def test_changed_file_misses(self):
+        first = self.serve(self.request(id=1))
+        with open(self.csv_path, "w") as f:
+            f.write("name,lat,lon\nJFK,40.6413,-73.7781\n")
+        os.utime(self.csv_path, ns=(time.time_ns(), time.time_ns() + 10**9))
+        replies = self.serve(self.request(id=1), self.request(id=2))
+        self.assertIn("Output Array: [[42.3643, -71.0052]]", first[0]["response"])
+        self.assertIn("Output Array: [[40.6413, -73.7781]]", replies[0]["response"])
+        self.assertEqual([r["result_cache"]["hit"] for r in replies], [False, True])
+
+    def test_disk_tier_across_runs(self):
+        args = parse_args(["process_data.py", self.csv_path, "", "", "1", "2", "[[42.0, -71.0]]", "", "false", "true",
+                           "--no-cache", "--result-cache-dir", os.path.join(self.tmpdir, "results")])
+        infos = []
+        for _ in range(2):
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out):
+                infos.append(run_request(args))
+            self.assertIn("Output Array: [[42.3643, -71.0052]]", out.getvalue())
+        self.assertEqual([info["result_cache"]["hit"] for info in infos], [False, True])
+        self.assertEqual(infos[1]["result_cache"]["disk_hits"], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import io
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts'))) #set scripts path
+
+from spatial_index import SphereIndex
+from rtree_index import RTreeIndex, import_points, import_csv, is_current
+from process_data import parse_args, run_worker
+
+class TestRTreeIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        rng = random.Random(15)
+        self.refs = [[rng.uniform(-90, 90), rng.uniform(-180, 180)] for _ in range(2000)]
+        # Near the poles, on both sides of the antimeridian, and a duplicate for ties
+        self.refs += [[89.95, 20.0], [-89.9, -160.0], [10.0, 179.999], [10.0, -179.999], [10.0, 180.0], [10.0, 180.0]]
+        self.queries = [[rng.uniform(-90, 90), rng.uniform(-180, 180)] for _ in range(500)]
+        self.queries += [[90.0, 0.0], [-90.0, 0.0], [10.0, 180.0], [10.0, -180.0], [10.0, 540.0], [89.99, -100.0]]
+        self.db_path = os.path.join(self.tmpdir, "refs.db")
+        import_points(self.db_path, self.refs)
+        self.index = RTreeIndex(self.db_path)
+
+    def tearDown(self):
+        self.index.close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_nearest_and_knn_match_sphere_index(self):
+        tree = SphereIndex().build(self.refs)
+        for k in (1, 4):
+            indices, distances = self.index.query(self.queries, k=k)
+            expected_indices, expected_distances = tree.query(self.queries, k=k)
+            self.assertEqual(indices.tolist(), expected_indices.tolist())
+            self.assertEqual(distances.tolist(), expected_distances.tolist())
+
+    def test_radius_matches_sphere_index(self):
+        tree = SphereIndex().build(self.refs)
+        got = self.index.query_radius(self.queries, 800)
+        expected = tree.query_radius(self.queries, 800)
+        for (indices, distances), (expected_indices, expected_distances) in zip(got, expected):
+            self.assertEqual(indices.tolist(), expected_indices.tolist())
+            self.assertEqual(distances.tolist(), expected_distances.tolist())
+
+    def test_ties_pick_lowest_index(self):
+        indices, _ = self.index.query([[10.0, 180.0]], k=1)
+        self.assertEqual(indices[0, 0], len(self.refs) - 2)
+
+    def test_points_and_empty(self):
+        self.assertEqual(len(self.index), len(self.refs))
+        self.assertEqual(self.index[3], self.refs[3])
+        self.assertEqual(self.index.tolist(), self.refs)
+        with self.assertRaises(IndexError):
+            self.index[len(self.refs)]
+        empty_path = os.path.join(self.tmpdir, "empty.db")
+        import_points(empty_path, [])
+        with self.assertRaises(ValueError):
+            RTreeIndex(empty_path).query([[0.0, 0.0]])
+
+    def test_shared_between_processes(self):
+        # A second process opens the same file read-only and gets the same answer
+        script = ("import sys, json; sys.path.insert(0, sys.argv[1]); from rtree_index import RTreeIndex; "
+                  "i, d = RTreeIndex(sys.argv[2]).query(json.loads(sys.argv[3]), k=2); print(json.dumps(i.tolist()))")
+        scripts = os.path.join(os.path.dirname(__file__), '..', 'scripts')
+        out = subprocess.run([sys.executable, "-c", script, scripts, self.db_path, json.dumps(self.queries[:20])],
+                             capture_output=True, text=True, check=True).stdout
+        self.assertEqual(json.loads(out), self.index.query(self.queries[:20], k=2)[0].tolist())
+
+    def test_csv_import_tracks_source(self):
+        csv_path = os.path.join(self.tmpdir, "refs.csv")
+        with open(csv_path, "w") as f:
+            f.write("name,lat,lon\nBOS,42.3643,-71.0052\nCDG,49.0097,2.5479\n")
+        db_path = os.path.join(self.tmpdir, "csv.db")
+        self.assertFalse(is_current(db_path, csv_path, 1, 2))
+        self.assertEqual(import_csv(db_path, csv_path, 1, 2), 2)
+        self.assertTrue(is_current(db_path, csv_path, 1, 2))
+        self.assertFalse(is_current(db_path, csv_path, 2, 1))
+        with open(csv_path, "a") as f:
+            f.write("NRT,35.7647,140.3864\n")
+        os.utime(csv_path, ns=(time.time_ns(), time.time_ns() + 10**9))
+        self.assertFalse(is_current(db_path, csv_path, 1, 2))
+
+    def test_worker_request_with_ref_db(self):
+        csv_path = os.path.join(self.tmpdir, "points.csv")
+        with open(csv_path, "w") as f:
+            f.write("name,lat,lon\nBOS,42.3643,-71.0052\nCDG,49.0097,2.5479\n")
+        db_path = os.path.join(self.tmpdir, "airports.db")
+        defaults = parse_args(["process_data.py", "--worker", "--no-cache", "--ref-db-dir", self.tmpdir])
+        base = {"file": csv_path, "columnIndex1B": 1, "columnIndex2B": 2, "manualEntry1": "[[42.0, -71.0], [48.0, 2.0]]",
+                "useCSV1": False, "ref_db": db_path}
+        messages = [dict(base, id=1, useCSV2=True), dict(base, id=2, useCSV2=False, mode="knn", k=2)]
+        stdin = "".join(json.dumps(m) + "\n" for m in messages)
+        stdout = io.StringIO()
+        run_worker(defaults, io.StringIO(stdin), stdout)
+        replies = [json.loads(line) for line in stdout.getvalue().splitlines()]
+        self.assertIn("Output Array: [[42.3643, -71.0052], [49.0097, 2.5479]]", replies[0]["response"])
+        self.assertEqual(replies[0]["ref_db"]["imported"], True)
+        # The second request reuses the database without the CSV
+        self.assertEqual(replies[1]["ref_db"], {"path": db_path, "points": 2, "imported": False})
+        knn = json.loads(replies[1]["response"].split("Output Matches: ")[1])
+        self.assertEqual([m["index"] for m in knn[1]["matches"]], [1, 0])
+
+    def test_worker_refuses_ref_db_outside_its_directory(self):
+        allowed = os.path.join(self.tmpdir, "uploads")
+        os.mkdir(allowed)
+        os.symlink(self.tmpdir, os.path.join(allowed, "link"))
+        victim = os.path.join(self.tmpdir, "victim.txt")
+        with open(victim, "w") as f:
+            f.write("keep me")
+        defaults = parse_args(["process_data.py", "--worker", "--no-cache", "--ref-db-dir", allowed])
+        base = {"file": victim, "columnIndex1B": 0, "columnIndex2B": 1, "manualEntry1": "[[1.0, 2.0]]",
+                "useCSV1": False, "useCSV2": True}
+        paths = [victim, os.path.join(allowed, "..", "victim.txt"), os.path.join(allowed, "link", "victim.txt")]
+        stdin = "".join(json.dumps(dict(base, id=i, ref_db=path)) + "\n" for i, path in enumerate(paths))
+        stdout = io.StringIO()
+        run_worker(defaults, io.StringIO(stdin), stdout)
+        replies = [json.loads(line) for line in stdout.getvalue().splitlines()]
+        self.assertEqual(len(replies), 3)
+        for reply in replies:
+            self.assertIn("ref_db must be a file inside", reply["error"])
+        with open(victim) as f:
+            self.assertEqual(f.read(), "keep me")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import os
+import sys
+import random
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts'))) #set scripts path
+
+from match_engine import d, nearest_neighbors
+from simplify import douglas_peucker, decimate, simplify_points, expand_matches
+from process_data import simplified_matches, two_arrays
+
+class TestSimplify(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(14)
+        # A dense, slightly noisy trace (~5 m steps) with one sharp turn
+        self.trace = []
+        lat, lon = 45.0, 7.0
+        for i in range(3000):
+            if i < 1500:
+                lat += 0.00004
+            else:
+                lon += 0.00006
+            self.trace.append([lat + rng.gauss(0, 0.000005), lon + rng.gauss(0, 0.000005)])
+        self.refs = [[rng.uniform(44.9, 45.2), rng.uniform(6.9, 7.3)] for _ in range(400)]
+
+    def test_douglas_peucker(self):
+        kept = douglas_peucker(self.trace, 5)
+        self.assertEqual(kept[0], 0)
+        self.assertEqual(kept[-1], len(self.trace) - 1)
+        self.assertLess(len(kept), len(self.trace) // 10)
+        # The corner survives
+        self.assertTrue(any(abs(i - 1500) <= 2 for i in kept.tolist()))
+        self.assertEqual(douglas_peucker([[1, 2], [3, 4]], 5).tolist(), [0, 1])
+        self.assertEqual(douglas_peucker(self.trace, 0).tolist(), list(range(len(self.trace))))
+
+    def test_decimate_spacing(self):
+        kept = decimate(self.trace, 50).tolist()
+        for a, b in zip(kept[:-2], kept[1:-1]):
+            self.assertGreaterEqual(d(*self.trace[a], *self.trace[b]), 0.05)
+        self.assertEqual(kept[-1], len(self.trace) - 1)
+
+    def test_decimate_error_bound(self):
+        tolerance_m = 30
+        indices, distances, kept = simplified_matches(self.trace, self.refs, "decimate", tolerance_m)
+        exact_indices, exact_distances = nearest_neighbors(self.trace, self.refs)
+        self.assertLess(len(kept), len(self.trace) // 3)
+        self.assertEqual(len(indices), len(self.trace))
+        # Kept points are matched exactly, dropped ones are within 2 * tolerance
+        self.assertEqual(indices[kept].tolist(), exact_indices[kept].tolist())
+        self.assertLessEqual(max(distances - exact_distances), 2 * tolerance_m / 1000)
+        for i in range(0, len(self.trace), 97):
+            j = indices[i]
+            self.assertEqual(distances[i], d(*self.trace[i], *self.refs[j]))
+
+    def test_every_method_within_tolerance(self):
+        tolerance_m = 20
+        # A straight run: Douglas-Peucker alone keeps only its two ends
+        line = [[45.0 + 0.00004 * i, 7.0] for i in range(2000)]
+        self.assertEqual(douglas_peucker(line, tolerance_m).tolist(), [0, len(line) - 1])
+        for trace in (line, self.trace):
+            exact_indices, exact_distances = nearest_neighbors(trace, self.refs)
+            for method in ("dp", "decimate"):
+                kept = simplify_points(trace, method, tolerance_m)
+                after = np.searchsorted(kept, np.arange(len(trace)))
+                for i in np.setdiff1d(np.arange(len(trace)), kept).tolist():
+                    near = min(d(*trace[i], *trace[kept[after[i] - 1]]), d(*trace[i], *trace[kept[after[i]]]))
+                    self.assertLessEqual(near, tolerance_m / 1000)
+                indices, distances, kept = simplified_matches(trace, self.refs, method, tolerance_m)
+                self.assertLess(len(kept), len(trace) // 3)
+                self.assertLessEqual(max(distances - exact_distances), 2 * tolerance_m / 1000)
+
+    def test_expand_without_drops(self):
+        kept = simplify_points(self.trace[:5], "none", 10)
+        indices, distances = nearest_neighbors(self.trace[:5], self.refs)
+        full = expand_matches(self.trace[:5], self.refs, kept, indices, distances)
+        self.assertEqual(full[0].tolist(), indices.tolist())
+        with self.assertRaises(ValueError):
+            simplify_points(self.trace, "dp", -1)
+
+    def test_output_array_keeps_every_point(self):
+        indices, _, _ = simplified_matches(self.trace, self.refs, "dp", 10)
+        self.assertEqual([self.refs[j] for j in indices.tolist()][:1], two_arrays(self.trace[:1], self.refs))
+        self.assertEqual(simplified_matches([], self.refs, "dp", 10)[0].tolist(), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import os
+import sys
+import random
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts'))) #set scripts path
+
+from match_engine import d, nearest_neighbors
+from spatial_index import SphereIndex
+from process_data import two_arrays, query_matches, format_matches
+
+def brute_force_k(point, refs, k):
+    ranked = sorted((d(point[0], point[1], q[0], q[1]), j) for j, q in enumerate(refs))
+    return ranked[:k]
+
+class TestSphereIndex(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(2025)
+        self.queries = [[rng.uniform(-90, 90), rng.uniform(-180, 180)] for _ in range(200)]
+        self.refs = [[rng.uniform(-90, 90), rng.uniform(-180, 180)] for _ in range(500)]
+        # Points near the poles and the antimeridian are where planar shortcuts go wrong
+        self.queries += [[89.9, 10], [-89.9, -170], [0, 179.99], [0, -179.99]]
+        self.refs += [[89.8, -170], [-89.95, 10], [0.5, -179.9], [-0.5, 179.9]]
+        self.index = SphereIndex().build(self.refs)
+
+    def test_nearest_matches_d(self):
+        indices, distances = self.index.query(self.queries)
+        expected_indices, expected_distances = nearest_neighbors(self.queries, self.refs)
+        self.assertEqual(indices[:, 0].tolist(), expected_indices.tolist())
+        self.assertEqual(distances[:, 0].tolist(), expected_distances.tolist())
+
+    def test_k_nearest(self):
+        indices, distances = self.index.query(self.queries, k=4)
+        for i, point in enumerate(self.queries):
+            expected = brute_force_k(point, self.refs, 4)
+            self.assertEqual(indices[i].tolist(), [j for _, j in expected])
+            self.assertEqual(distances[i].tolist(), [dist for dist, _ in expected])
+
+    def test_radius_query(self):
+        results = self.index.query_radius(self.queries, radius_km=1500)
+        for point, (indices, distances) in zip(self.queries, results):
+            expected = [(dist, j) for dist, j in brute_force_k(point, self.refs, len(self.refs)) if dist <= 1500]
+            self.assertEqual(indices.tolist(), [j for _, j in expected])
+            self.assertEqual(distances.tolist(), [dist for dist, _ in expected])
+
+    def test_radius_covering_the_whole_sphere(self):
+        indices, _ = self.index.query_radius([[0, 0]], radius_km=30000)[0]
+        self.assertEqual(sorted(indices.tolist()), list(range(len(self.refs))))
+
+    def test_radius_boundary_is_inclusive(self):
+        refs = [[0, 0], [0, 1], [0, 2]]
+        exact = d(0, 0, 0, 1)
+        indices, _ = SphereIndex().build(refs).query_radius([[0, 0]], radius_km=exact)[0]
+        self.assertEqual(indices.tolist(), [0, 1])
+
+    def test_structured_knn_output(self):
+        refs = [[0, 0], [0, 1], [0, 3]]
+        matches = query_matches([[0, 0.9]], refs, "knn", k=2)
+        output = format_matches([[0, 0.9]], refs, matches)
+        self.assertEqual([m["index"] for m in output[0]["matches"]], [1, 0])
+        self.assertEqual(output[0]["matches"][0]["point"], [0, 1])
+        self.assertAlmostEqual(output[0]["matches"][0]["distance_km"], d(0, 0.9, 0, 1))
+        with self.assertRaises(ValueError):
+            query_matches([[0, 0]], refs, "radius")
+
+    def test_duplicate_references_keep_lowest_index(self):
+        index = SphereIndex(leaf_size=2).build([[10, 10], [0, 1], [5, 5], [0, 1], [0, 1]])
+        indices, _ = index.query([[0, 0]])
+        self.assertEqual(indices.tolist(), [[1]])
+
+    def test_k_larger_than_reference_set(self):
+        indices, _ = SphereIndex().build([[0, 0], [1, 1]]).query([[0, 0]], k=5)
+        self.assertEqual(indices.tolist(), [[0, 1]])
+
+    def test_empty_reference_set(self):
+        with self.assertRaises(ValueError):
+            SphereIndex().build([]).query([[0, 0]])
+
+    def test_two_arrays_engines_agree(self):
+        self.assertEqual(two_arrays(self.queries, self.refs, engine="index"),
+                         two_arrays(self.queries, self.refs, engine="matrix"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import os
+import sys
+import csv
+import random
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts'))) #set scripts path
+
+from match_engine import nearest_neighbors
+from tiled_join import tiled_join
+
+def write_points(path, points, header=True):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        if header:
+            writer.writerow(["name", "lat", "lon"])
+        for i, (lat, lon) in enumerate(points):
+            writer.writerow([f"p{i}", lat, lon])
+
+class TestTiledJoin(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        rng = random.Random(404)
+        self.queries = [[rng.uniform(-90, 90), rng.uniform(-180, 180)] for _ in range(1500)]
+        self.refs = [[rng.uniform(-90, 90), rng.uniform(-180, 180)] for _ in range(700)]
+        # Poles, the antimeridian and a duplicated reference point (tie)
+        self.queries += [[90, 0], [-89.9, 45], [0, 180], [12, -179.99], [30, 30]]
+        self.refs += [[89.5, -150], [0.2, -179.9], [12, 179.99], [30.1, 30.1], [30.1, 30.1]]
+        self.query_file = os.path.join(self.tmp, "queries.csv")
+        self.ref_file = os.path.join(self.tmp, "refs.csv")
+        self.output = os.path.join(self.tmp, "matches.csv")
+        write_points(self.query_file, self.queries)
+        write_points(self.ref_file, self.refs, header=False)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def read_output(self):
+        with open(self.output, newline="") as f:
+            rows = list(csv.reader(f))[1:]
+        return [int(r[3]) for r in rows], [float(r[6]) for r in rows]
+
+    def test_matches_in_memory_join(self):
+        expected_indices, expected_distances = nearest_neighbors(self.queries, self.refs)
+        # Uneven tile sizes and a budget small enough to force many slices
+        for tile_deg, memory_mb in ((5, 256), (7, 0.02), (40, 0.05)):
+            stats = tiled_join(self.query_file, (1, 2), self.ref_file, (1, 2), self.output,
+                               tile_deg=tile_deg, memory_mb=memory_mb, work_dir=self.tmp)
+            indices, distances = self.read_output()
+            self.assertEqual(indices, expected_indices.tolist())
+            self.assertEqual(distances, expected_distances.tolist())
+            self.assertEqual(stats["query_points"], len(self.queries))
+            self.assertEqual(stats["ref_points"], len(self.refs))
+        # The spill files are cleaned up
+        self.assertEqual(sorted(os.listdir(self.tmp)), ["matches.csv", "queries.csv", "refs.csv"])
+
+    def test_skips_far_tiles(self):
+        stats = tiled_join(self.query_file, (1, 2), self.ref_file, (1, 2), self.output, work_dir=self.tmp)
+        self.assertGreater(stats["tile_pairs_skipped"], stats["tile_pairs"])
+
+    def test_empty_reference_file(self):
+        write_points(self.ref_file, [])
+        with self.assertRaises(ValueError):
+            tiled_join(self.query_file, (1, 2), self.ref_file, (1, 2), self.output, work_dir=self.tmp)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import io
+import os
+import sys
+import json
+import time
+import pstats
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts'))) #set scripts path
+
+from timing import PhaseTimer
+from process_data import parse_args, run_worker
+
+SCRIPT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts', 'process_data.py'))
+
+class TestPhaseTimer(unittest.TestCase):
+    def test_phases_are_summed(self):
+        timer = PhaseTimer()
+        for _ in range(2):
+            with timer.phase("match"):
+                time.sleep(0.01)
+        with timer.phase("output"):
+            pass
+        report = timer.report()
+        self.assertEqual([(p["name"], p["count"]) for p in report["phases"]], [("match", 2), ("output", 1)])
+        self.assertGreaterEqual(report["phases"][0]["wall_s"], 0.02)
+        self.assertLess(report["phases"][0]["cpu_s"], report["phases"][0]["wall_s"])
+        self.assertGreaterEqual(report["total_wall_s"], report["phases"][0]["wall_s"])
+
+    def test_disabled_records_nothing(self):
+        timer = PhaseTimer(enabled=False)
+        with timer.phase("match"):
+            pass
+        timer.add("parse_args", 1.0, 1.0)
+        self.assertEqual(timer.phases, {})
+
+class TestTimingOption(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.csv_path = os.path.join(self.tmpdir, "points.csv")
+        with open(self.csv_path, "w") as f:
+            f.write("name,lat,lon\nBOS,42.3643,-71.0052\nCDG,49.0097,2.5479\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_json_trailer_and_profile(self):
+        profile = os.path.join(self.tmpdir, "request.prof")
+        result = subprocess.run([sys.executable, SCRIPT, self.csv_path, "", "", "1", "2", "[[42.0, -71.0]]", "",
+                                 "false", "true", "--no-cache", "--timing", "--profile", profile],
+                                capture_output=True, text=True, check=True)
+        # stdout is unchanged, the trailer is the last stderr line
+        self.assertEqual(result.stdout.splitlines()[-1], "Output Array: [[42.3643, -71.0052]]")
+        timing = json.loads(result.stderr.splitlines()[-1])["timing"]
+        names = [p["name"] for p in timing["phases"]]
+        self.assertEqual(names[0], "parse_args")
+        self.assertTrue({"read_csv", "validation", "match", "output"} <= set(names))
+        self.assertTrue(all(p["peak_rss_kb"] > 0 for p in timing["phases"]))
+        stats = pstats.Stats(profile)
+        self.assertTrue(any(func[2] == "run_request" for func in stats.stats))
+
+    def test_worker_request(self):
+        defaults = parse_args(["process_data.py", "--worker", "--no-cache"])
+        request = {"id": 1, "file": self.csv_path, "columnIndex1B": 1, "columnIndex2B": 2,
+                   "manualEntry1": "[[42.0, -71.0]]", "useCSV1": False, "useCSV2": True}
+        stdin = io.StringIO(json.dumps(dict(request, timing=True)) + "\n" + json.dumps(dict(request, id=2)) + "\n")
+        stdout = io.StringIO()
+        run_worker(defaults, stdin, stdout)
+        replies = [json.loads(line) for line in stdout.getvalue().splitlines()]
+        self.assertIn("match", [p["name"] for p in replies[0]["timing"]["phases"]])
+        self.assertNotIn("timing", replies[1])
+
+if __name__ == '__main__':
+    unittest.main()
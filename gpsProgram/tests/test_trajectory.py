@@ -0,0 +1,61 @@
+import io
+import os
+import sys
+import json
+import random
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts'))) #set scripts path
+
+from match_engine import nearest_neighbors
+from spatial_index import SphereIndex
+from trajectory import TrajectoryMatcher, run_stream
+
+class TestTrajectoryMatcher(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(31)
+        # Dense reference points around a small region, plus a few far away
+        self.refs = [[rng.uniform(40, 42), rng.uniform(-75, -72)] for _ in range(600)]
+        self.refs += [[rng.uniform(-90, 90), rng.uniform(-180, 180)] for _ in range(50)]
+        self.refs += [self.refs[0]]  # duplicate, the lower index must win
+        self.index = SphereIndex().build(self.refs)
+        # Two vehicles driving random walks, fixes interleaved, with one long jump
+        self.fixes = []
+        positions = {"a": [41, -74], "b": [40.5, -73]}
+        for step in range(600):
+            for vehicle, position in positions.items():
+                position[0] += rng.gauss(0, 0.002)
+                position[1] += rng.gauss(0, 0.002)
+                if step == 300 and vehicle == "a":
+                    position[:] = [10, 100]
+                self.fixes.append((position[0], position[1], vehicle))
+        self.fixes.append((self.refs[0][0], self.refs[0][1], "b"))
+
+    def test_matches_full_search(self):
+        matcher = TrajectoryMatcher(self.index, reanchor_km=0.5)
+        results = list(matcher.stream(self.fixes))
+        expected_indices, expected_distances = nearest_neighbors([f[:2] for f in self.fixes], self.refs)
+        self.assertEqual([j for j, _ in results], expected_indices.tolist())
+        self.assertEqual([dist for _, dist in results], expected_distances.tolist())
+        # Most fixes are answered from the candidate set, not a new index search
+        self.assertEqual(matcher.stats["fixes"], len(self.fixes))
+        self.assertLess(matcher.stats["reanchors"], len(self.fixes) // 2)
+
+    def test_empty_reference_set(self):
+        with self.assertRaises(ValueError):
+            TrajectoryMatcher(SphereIndex().build([]))
+
+    def test_run_stream(self):
+        matcher = TrajectoryMatcher(self.index)
+        stdin = io.StringIO('{"lat": 41, "lon": -74, "vehicle": "a", "id": 7}\n\n[41.001, -74.001]\n{"lat": 1}\n')
+        stdout = io.StringIO()
+        run_stream(matcher, stdin, stdout)
+        replies = [json.loads(line) for line in stdout.getvalue().splitlines()]
+        self.assertEqual(len(replies), 3)
+        self.assertEqual((replies[0]["id"], replies[0]["vehicle"]), (7, "a"))
+        self.assertEqual(replies[0]["ref"], self.refs[replies[0]["index"]])
+        self.assertNotIn("vehicle", replies[1])
+        self.assertIn("error", replies[2])
+
+if __name__ == '__main__':
+    unittest.main()